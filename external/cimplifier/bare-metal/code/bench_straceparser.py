@@ -0,0 +1,78 @@
+''' Throughput of the strace log parsing, generic vs fast mode
+
+    python3 bench_straceparser.py [trace_log_file] [--lines N]
+
+    Without trace_log_file a synthetic log of N lines is generated. Both modes
+    must give the same ProcessImage records.
+'''
+import argparse
+import os
+import random
+import sys
+import time
+from tempfile import TemporaryDirectory
+
+import straceparser
+
+
+def synthetic_trace(path, lines):
+    calls = [
+        'openat(AT_FDCWD, "/usr/lib/python3/dist-packages/{0}.py", O_RDONLY|O_CLOEXEC) = 3</usr/lib/python3/dist-packages/{0}.py>',
+        'openat(AT_FDCWD, "/usr/lib/python3/{0}.so", O_RDONLY|O_CLOEXEC) = -1 ENOENT (No such file or directory)',
+        'openat(3</usr/lib>, "{0}.cache", O_WRONLY|O_CREAT|O_TRUNC, 0644) = 4</usr/lib/{0}.cache>',
+        'newfstatat(AT_FDCWD, "/etc/{0}", {{st_mode=S_IFREG|0644, st_size=1024, ...}}, 0) = 0',
+        'newfstatat(3</usr/lib>, "", {{st_mode=S_IFDIR|0755, st_size=4096, ...}}, AT_EMPTY_PATH) = 0',
+        'stat("/usr/share/{0}", {{st_mode=S_IFDIR|0755, st_size=4096, ...}}) = 0',
+        'access("/etc/ld.so.{0}", R_OK) = -1 ENOENT (No such file or directory)',
+        'read(3</usr/lib/{0}.py>, "import os\\n"..., 4096) = 4096',
+        'mmap(NULL, 8192, PROT_READ|PROT_WRITE, MAP_PRIVATE|MAP_ANONYMOUS, -1, 0) = 0x7f0000000000',
+        'fstat(3</usr/lib/{0}.py>, {{st_mode=S_IFREG|0644, st_size=4096, ...}}) = 0',
+        'close(3</usr/lib/{0}.py>) = 0',
+        'futex(0x7f0000000000, FUTEX_WAKE_PRIVATE, 1) = 0',
+        'brk(NULL) = 0x5600000000',
+        'getdents64(3</usr/lib>, 0x5600000000 /* 12 entries */, 32768) = 400',
+        'lseek(3</usr/lib/{0}.py>, 0, SEEK_CUR) = 0',
+    ]
+    rand = random.Random(0)
+    with open(path, 'w') as f:
+        f.write('execve("/usr/bin/python3", ["python3", "main.py"], ["PATH=/usr/bin", "HOME=/root"]) = 0\n')
+        for _ in range(lines):
+            call = rand.choice(calls)
+            f.write(call.format('m{}'.format(rand.randrange(5000))) + '\n')
+        f.write('exit_group(0) = ?\n+++ exited with 0 +++\n')
+
+
+def bench(trace_log_file, fast):
+    start = time.perf_counter()
+    parsers = straceparser.process(0, trace_log_file, '/', False, fast)
+    return time.perf_counter() - start, parsers[0].exec_records
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('trace_log_file', nargs='?')
+    argparser.add_argument('--lines', type=int, default=1000000)
+    args = argparser.parse_args()
+
+    with TemporaryDirectory() as tmp:
+        trace_log_file = args.trace_log_file
+        if trace_log_file is None:
+            trace_log_file = os.path.join(tmp, 'all.strace')
+            synthetic_trace(trace_log_file, args.lines)
+        size = os.path.getsize(trace_log_file) / 2**20
+
+        slow_time, slow_records = bench(trace_log_file, False)
+        fast_time, fast_records = bench(trace_log_file, True)
+
+    # sets of the records are compared as sets, their repr depends on
+    # the insertion history
+    if [vars(r) for r in slow_records] != [vars(r) for r in fast_records]:
+        print('the fast mode gives different records', file=sys.stderr)
+        sys.exit(1)
+    print('{:.1f}MB'.format(size))
+    print('generic: {:.2f}s {:.1f}MB/s'.format(slow_time, size / slow_time))
+    print('fast:    {:.2f}s {:.1f}MB/s'.format(fast_time, size / fast_time))
+
+
+if __name__ == '__main__':
+    main()
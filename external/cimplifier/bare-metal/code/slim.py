@@ -352,16 +352,14 @@ def slim(oldimg, newimgprefix, cntnr, rootpid, traces_log_file, volpath=None):
 
     # analyze strace logs
     pid_records = straceparser.process(rootpid, traces_log_file,
-                                       cntnr_metadata['Config']['WorkingDir'], False)
+                                       cntnr_metadata['Config']['WorkingDir'], False,
+                                       fast=True)
 
-    assert len(pid_records.values())==1
     print("exec records len: ", {len(rec.exec_records) for rec in pid_records.values()})
-    # Get and refine all exec file extracted from strace log. pid_records.values()[0].exec_records is a list
+    # Get and refine all exec file extracted from strace log, one parser per pid
     for pidrec in pid_records.values():
-        for i in range(len(pidrec.exec_records)):
-            if pidrec.exec_records[i].exe is None:
-                del pidrec.exec_records[i]
-                break
+        pidrec.exec_records = [rec for rec in pidrec.exec_records
+                               if rec.exe is not None]
     
     for pidrec in pid_records.values():
          for rec in pidrec.exec_records:
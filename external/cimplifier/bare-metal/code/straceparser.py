@@ -16,8 +16,10 @@
 
 import os
 import json
-from glob import glob
+from glob import glob, escape as glob_escape
 import re
+import logging
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 CREAT_FLAGS = ['O_CREAT', 'O_WRONLY', 'O_TRUNC']
 # regex for possible file descriptors
@@ -25,6 +27,24 @@ CREAT_FLAGS = ['O_CREAT', 'O_WRONLY', 'O_TRUNC']
 fdre = re.compile(r'((?:0[xX][0-9a-fA-F]+)|(?:-?[0-9]+))(?:<(.*)>)?')
 nop = lambda *args: None
 
+# the fast mode reads the log by chunks of this many characters
+CHUNK_SIZE = 1 << 22
+
+# precompiled patterns of the hot syscalls for the fast mode. They only match
+# the arguments the generic parsing below would parse the same way: a complete
+# string (closing quote not escaped, see string_arg), an fd with its path
+# without comma (see fd_arg). Anything else goes through the generic parsing.
+# execve has no pattern on purpose: it is called once per process image and
+# its argv and envp need the escape fixing of sys_execve.
+_STR = r'"((?:[^"\\]|\\.)*)"(?!\.\.\.)'
+_FD = r'(?:(AT_FDCWD)|-?[0-9]+<([^,]*)>)'
+FAST_PATTERNS = {
+    'openat': re.compile(r'openat\(' + _FD + ', ' + _STR + r', ([^,)]*)'),
+    'newfstatat': re.compile(r'newfstatat\(' + _FD + ', ' + _STR),
+    'stat': re.compile(r'stat\(' + _STR),
+    'access': re.compile(r'access\(' + _STR),
+}
+
 # lambdas have expression bodies not statements, so no straight-forward way to
 #   a lambda that raises exception
 def unhandled(*args):
@@ -56,10 +76,18 @@ def parse_call(line):
     # exit and exit_group do not return
     if syscall == '_exit' or syscall == 'exit_group':
         return syscall, argstr, None, None, None
+    return (syscall, argstr) + parse_ret(line, retstr)
+
+
+def parse_ret(line, retstr):
+    ''' return value, path of the returned fd and errno symbol of a call,
+        retstr is what follows the last '=' of the line
+    '''
     retstr = retstr.lstrip()
     m = fdre.match(retstr)
     if not m:
-        print(line, end='')
+        # the lines of parse keep their newline, the ones of parse_fast don't
+        print(line.rstrip('\n'))
         assert retstr.startswith('? ')
         end = 2
         ret, retfdpath = '-1', None
@@ -68,7 +96,21 @@ def parse_call(line):
         end = m.end()
     errlist = retstr[end:].split(maxsplit=1)
     err = errlist[0] if errlist else None
-    return syscall, argstr, int(ret, 0), retfdpath, err
+    return int(ret, 0), retfdpath, err
+
+
+def iter_lines(file, chunk_size=CHUNK_SIZE):
+    ''' lines of file without their newline, read by large chunks '''
+    tail = ''
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        lines = (tail + chunk).split('\n')
+        tail = lines.pop()
+        yield from lines
+    if tail:
+        yield tail
 
 
 def parse_signal(line):
@@ -316,7 +358,17 @@ class StraceParser(object):
 
                 }
 
-    def parse(self, file):
+    def __getstate__(self):
+        # handlers hold lambdas and closures that can't be pickled; a parser
+        # sent back by a worker of process() is done parsing anyway
+        state = self.__dict__.copy()
+        state.pop('handlers', None)
+        state.pop('orig_handlers', None)
+        return state
+
+    def parse(self, file, fast=False):
+        if fast:
+            return self.parse_fast(file)
         for line in file:
             if line.startswith('---'):
                 si_signo, si_code, pid = parse_signal(line.strip())
@@ -337,6 +389,69 @@ class StraceParser(object):
                 self.handlers[syscall](argstr, ret, err)
         self.exec_records.append(ProcessImage(self))
 
+    def parse_fast(self, file):
+        ''' Same results as parse, for multi-GB logs. The log is read by
+            large chunks, the calls without handler, or with a nop one, are
+            skipped before any argument parsing and the hot syscalls are
+            matched by precompiled patterns.
+        '''
+        # handlers are swapped by StraceParserContainerRoot, the filter is
+        # rebuilt when they are
+        handlers = None
+        for line in iter_lines(file):
+            if self.handlers is not handlers:
+                handlers = self.handlers
+                wanted = {k for k, h in handlers.items()
+                          if h is not nop and h is not unhandled}
+                # a fast handler only replaces the handler it mimics
+                fast = {k: getattr(self, f)
+                        for k, (g, f) in self.fast_dispatch.items()
+                        if getattr(handlers.get(k), '__func__', None) is
+                        getattr(StraceParser, g)}
+            if line.startswith('---'):
+                si_signo, si_code, pid = parse_signal(line.strip())
+                if si_signo == 'SIGCHLD':
+                    self.children.append((pid, self.cwd))
+                continue
+            syscall = line[:line.find('(')]
+            if syscall not in wanted:
+                continue
+            if line.rstrip().endswith('<detached ...>'): # last line...
+                continue
+            if syscall in fast:
+                m = FAST_PATTERNS[syscall].match(line)
+                if m is not None:
+                    fast[syscall](m, *parse_ret(line, line.rsplit('=', 1)[1]))
+                    continue
+            syscall, argstr, ret, retfdpath, err = parse_call(line)
+            handlers[syscall](argstr, ret, err)
+        self.exec_records.append(ProcessImage(self))
+
+    def _fast_cwd(self, m):
+        return self.cwd if m.group(1) else m.group(2)
+
+    def fast_openat(self, m, ret, retfdpath, err):
+        self.helper_open0(self._fast_cwd(m), m.group(3), m.group(4).split('|'),
+                ret, err)
+
+    def fast_newfstatat(self, m, ret, retfdpath, err):
+        if err is None:
+            self.exist_files.add(os.path.join(self._fast_cwd(m), m.group(3)))
+
+    def fast_stat(self, m, ret, retfdpath, err):
+        if err is None:
+            self.exist_files.add(os.path.join(self.cwd, m.group(1)))
+
+    fast_access = fast_stat
+
+    # syscall: (generic handler, fast handler) names
+    fast_dispatch = {
+            'openat': ('sys_openat', 'fast_openat'),
+            'newfstatat': ('sys_unlinkat', 'fast_newfstatat'),
+            'stat': ('sys_unlink', 'fast_stat'),
+            'access': ('sys_access', 'fast_access'),
+            }
+
     def helper_open0(self, cwd, filename, flags, ret, err):
         if err is None:
             # if 'O_CREAT' is given, only the dir must exist
@@ -599,30 +714,83 @@ class StraceParserContainerRoot(StraceParser):
         self.exec_records.pop() # the record before the first execve is useless
 
         
-def process(rootpid, trace_log_file, cwd='/', iscontainerroot=True):
+def per_pid_traces(trace_prefix):
+    ''' the <trace_prefix>.<pid> files written by strace -ff, by pid '''
+    traces = {}
+    for trace in glob(glob_escape(trace_prefix) + '.*'):
+        suffix = trace[len(trace_prefix)+1:]
+        if suffix.isdigit():
+            traces[int(suffix)] = trace
+    return traces
+
+def parse_pid(trace, cwd, exe, argv, envp, iscontainerroot, fast):
+    ''' parse the log of one pid, run by the workers of process() '''
+    parser = (StraceParserContainerRoot(cwd) if iscontainerroot else
+            StraceParser(cwd, exe, argv, envp))
+    with open(trace) as f:
+        parser.parse(f, fast)
+    return parser
+
+def children_of(parser):
+    ''' (pid, cwd, image) of the children of a parsed process, image is the
+        ProcessImage the child was forked from
+    '''
+    seen = set()
+    for rec in parser.exec_records:
+        # clone records come before the SIGCHLD ones and have the cwd at
+        # fork time, keep the first one
+        for pid, cwd in rec.children:
+            pid = int(pid)
+            if pid not in seen:
+                seen.add(pid)
+                yield pid, cwd, rec
+
+def process(rootpid, trace_log_file, cwd='/', iscontainerroot=True,
+        fast=False, max_workers=None):
     ''' rootpid is typically the original pid we started stracing
-        traces_prefix is the argument of -o option, e.g., /tmp/all.strace
+        trace_log_file is either one log, parsed as the log of rootpid, or
+        the argument of -o option of strace -ff, e.g., /tmp/all.strace, and
+        the /tmp/all.strace.<pid> logs are parsed in a process pool. A child
+        is parsed once its parent is, starting from the cwd and image of the
+        parent at fork time. Logs not reached from rootpid are parsed last
+        from cwd.
+        fast: use StraceParser.parse_fast, same results
+        returns the parsers by int pid, rootpid first
     '''
-    rootparser = (StraceParserContainerRoot(cwd) if iscontainerroot else
-            StraceParser(cwd))
-    parsers = {rootpid: rootparser}
-
-    
-    with open(trace_log_file) as f:
-        parsers[rootpid].parse(f)
-
-    # the following code exist bugs. It assumes that the strace log files end with
-    # pid. But according to the doc. The strace log file name is customized by users.
-    """
-    def parse_helper(pid, parser):
-        trace = '{}.{}'.format(traces_prefix, pid)
-        if trace not in trace_files:
-            return
-        assert trace in trace_files, trace
-        with open(trace) as f:
-            parser.parse(f)
-    parse_helper(rootpid, parsers[rootpid])
-    """
-
-
+    rootpid = int(rootpid)
+    if os.path.isfile(trace_log_file):
+        rootparser = (StraceParserContainerRoot(cwd) if iscontainerroot else
+                StraceParser(cwd))
+        parsers = {rootpid: rootparser}
+        with open(trace_log_file) as f:
+            parsers[rootpid].parse(f, fast)
+        return parsers
+
+    traces = per_pid_traces(trace_log_file)
+    assert rootpid in traces, '{}.{}'.format(trace_log_file, rootpid)
+    parsers = {}
+    with ProcessPoolExecutor(max_workers) as executor:
+        def submit(pid, cwd, exe=None, argv=[], envp=[], isroot=False):
+            submitted.add(pid)
+            future = executor.submit(parse_pid, traces[pid], cwd, exe, argv,
+                    envp, isroot and iscontainerroot, fast)
+            pending[future] = pid
+
+        submitted = set()
+        pending = {}
+        submit(rootpid, cwd, isroot=True)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pid = pending.pop(future)
+                parsers[pid] = future.result()
+                for child, childcwd, image in children_of(parsers[pid]):
+                    if child in traces and child not in submitted:
+                        submit(child, childcwd, image.exe, image.argv,
+                                image.envp)
+            if not pending:
+                for pid in sorted(traces.keys() - submitted):
+                    logging.warning('%s.%d not reached from pid %d',
+                            trace_log_file, pid, rootpid)
+                    submit(pid, cwd)
     return parsers
@@ -0,0 +1,159 @@
+from array import array
+
+
+class PathTable(object):
+    """
+    Interned directory prefixes, every path of a FileStore is kept as the
+    id of its directory plus its basename.
+    """
+
+    def __init__(self) -> None:
+        self.dirs = []
+        self.ids = {}
+
+    def intern(self, dirname):
+        dir_id = self.ids.get(dirname)
+        if dir_id is None:
+            dir_id = len(self.dirs)
+            self.dirs.append(dirname)
+            self.ids[dirname] = dir_id
+        return dir_id
+
+    def __getitem__(self, dir_id):
+        return self.dirs[dir_id]
+
+    def __len__(self):
+        return len(self.dirs)
+
+
+class FileStore(object):
+    """
+    Compact storage of (path, size, owner) file records. Records live in
+    arrays instead of one python object per file:
+        dir_ids:       id of the directory prefix in a PathTable
+        names:         utf-8 basenames, one after the other, delimited by
+                       name_offsets
+        sizes:         array of size_typecode
+        owners:        id of the owning package, -1 if none
+
+    Iterating a store, or a FileView of it, builds record_type(path, size)
+    objects on the fly, like the PkgFile or ImageFile lists used before.
+
+    Usage:
+        store = FileStore(PkgFile)
+        store.append('/usr/bin/adduser', 40.0, owner=0)
+        for f in store.view(0, 1):
+            print(f.name, f.size)
+    """
+
+    def __init__(self, record_type, size_typecode="d", paths=None) -> None:
+        self.record_type = record_type
+        self.paths = paths if paths is not None else PathTable()
+        self.dir_ids = array("I")
+        self.names = bytearray()
+        self.name_offsets = array("Q", [0])
+        self.sizes = array(size_typecode)
+        self.owners = array("i")
+
+    def append(self, path, size, owner=-1):
+        # the dir keeps its trailing '/', so dir + name is exactly path
+        sep = path.rfind("/") + 1
+        self.dir_ids.append(self.paths.intern(path[:sep]))
+        self.names += path[sep:].encode("utf-8", "surrogateescape")
+        self.name_offsets.append(len(self.names))
+        self.sizes.append(size)
+        self.owners.append(owner)
+
+    def extend(self, files, owner=-1):
+        """
+        files: iterable of objects with name and size, like PkgFile
+        """
+        for f in files:
+            self.append(f.name, f.size, owner)
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def name(self, i):
+        """
+        utf-8 basename of record i
+        """
+        return bytes(self.names[self.name_offsets[i] : self.name_offsets[i + 1]])
+
+    def path(self, i):
+        return self.paths[self.dir_ids[i]] + self.name(i).decode(
+            "utf-8", "surrogateescape"
+        )
+
+    def sort_key(self, i):
+        """
+        (directory, utf-8 basename) of record i, the order of sorted_indices
+        """
+        return self.paths[self.dir_ids[i]], self.name(i)
+
+    def size(self, i):
+        return self.sizes[i]
+
+    def owner(self, i):
+        return self.owners[i]
+
+    def record(self, i):
+        return self.record_type(self.path(i), self.sizes[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.record(i)
+
+    def view(self, start=0, stop=None):
+        stop = len(self) if stop is None else stop
+        return FileView(self, range(start, stop))
+
+    def select(self, indices):
+        return FileView(self, array("Q", indices))
+
+    def sorted_indices(self):
+        """
+        Indices of the records sorted by sort_key: by directory, then by
+        basename. The records are bucketed by directory id and only the
+        basenames of one directory are built at a time, no full path is.
+        """
+        by_dir = [array("Q") for _ in range(len(self.paths))]
+        for i, dir_id in enumerate(self.dir_ids):
+            by_dir[dir_id].append(i)
+        order = array("Q")
+        for dir_id in sorted(range(len(self.paths)), key=self.paths.__getitem__):
+            if len(by_dir[dir_id]) > 0:
+                order.extend(sorted(by_dir[dir_id], key=self.name))
+            by_dir[dir_id] = None
+        return order
+
+
+class FileView(object):
+    """
+    Iterable over some records of a FileStore, used where a list of
+    PkgFile or ImageFile was expected.
+    """
+
+    __slots__ = ("store", "indices")
+
+    def __init__(self, store, indices) -> None:
+        self.store = store
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        store = self.store
+        for i in self.indices:
+            yield store.record(i)
+
+    def __getitem__(self, i):
+        return self.store.record(self.indices[i])
+
+    def total_size(self):
+        sizes = self.store.sizes
+        return sum(sizes[i] for i in self.indices)
+
+    def __repr__(self) -> str:
+        return f"FileView({len(self)} files)"
@@ -1 +1,2 @@
 from .container import Container, Mount, ContainerTestCase, clone_container
+from .session import ExecSession
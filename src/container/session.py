@@ -0,0 +1,75 @@
+import logging
+
+import docker
+
+
+class ExecSession(object):
+    """
+    One idle container of an image, commands are run in it by `docker exec`
+    instead of starting a new container for each of them.
+
+    Usage:
+        with ExecSession('tf_train_mnist') as session:
+            output = session.run('apt list --installed')
+    """
+
+    # keeps the container alive, available in both coreutils and busybox
+    IDLE_CMD = ["tail", "-f", "/dev/null"]
+
+    def __init__(self, image: str) -> None:
+        self.image: str = image
+        self.client: docker.DockerClient = docker.from_env()
+        self.container = None
+
+    def start(self) -> None:
+        if self.container is not None:
+            return
+        self.container = self.client.containers.run(
+            self.image, self.IDLE_CMD, entrypoint="", detach=True
+        )
+        logging.info(f"exec session {self.container.short_id} of {self.image} started")
+
+    def run(self, cmd) -> bytes:
+        """
+        Same as `client.containers.run(image, cmd, remove=True, entrypoint='')`:
+        returns stdout, raises docker.errors.ContainerError with stderr if the
+        command fails, or docker.errors.APIError if it can't be executed.
+        """
+        self.start()
+        exit_code, (stdout, stderr) = self.container.exec_run(cmd, demux=True)
+        stdout = stdout if stdout is not None else b""
+        stderr = stderr if stderr is not None else b""
+        # 126: not executable, 127: not found
+        if exit_code in (126, 127):
+            raise docker.errors.APIError(
+                f"cannot execute {cmd} in {self.image}: "
+                + (stdout + stderr).decode("utf-8", errors="replace")
+            )
+        if exit_code != 0:
+            raise docker.errors.ContainerError(
+                self.container, exit_code, cmd, self.image, stderr
+            )
+        return stdout
+
+    def stop(self) -> None:
+        if self.container is None:
+            return
+        self.container.remove(force=True)
+        logging.info(f"exec session {self.container.short_id} of {self.image} stopped")
+        self.container = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def run_in_image(client, image, cmd, session=None) -> bytes:
+    """
+    Run cmd in session if given, else in a new container of image
+    """
+    if session is not None:
+        return session.run(cmd)
+    return client.containers.run(image, cmd, remove=True, entrypoint="")
@@ -23,12 +23,11 @@ class Cimplifier(Debloater):
         with open(pid_filepath) as f:
             pid = f.readline().strip()
 
-        merged_logs_file: str = os.path.join(
-            '/tmp', f'strace_{image_name}_{short_cnt_id}.log')
+        # strace -ff writes one {short_cnt_id}.<pid> log per pid, slim parses
+        # them in parallel from their prefix
+        logs_prefix: str = os.path.join(container_log_dir, short_cnt_id)
 
-        shell(f'cat {container_log_dir}/{short_cnt_id}.* > {merged_logs_file}')
-
-        return pid, merged_logs_file
+        return pid, logs_prefix
 
     def debloat(self, container: Container) -> str:
         container.setup()
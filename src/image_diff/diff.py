@@ -5,12 +5,16 @@ import logging
 from pathlib import Path
 import shutil
 
+from common.file_store import FileStore
+
 
 class ImageFile:
     """
     A class used to represent a file.
     """
 
+    __slots__ = ('name', 'size')
+
     def __init__(self, name, size):
         self.name = name
         self.size = size
@@ -98,13 +102,13 @@ def save_image(image_name, output_dir='./output'):
 def get_all_files(path):
     f"""Get all files of given path
     :param path: given path
-    :return: list of {ImageFile("file_name_without_given_path", "file_size")}
+    :return: FileStore of {ImageFile("file_name_without_given_path", "file_size")}
     """
     du_cmd = 'find {dir} -type f -exec ls -lsd --block-size=k {{}} +'.format(
         dir=path)
     logging.debug("du command: %s", du_cmd)
     lines = os.popen(du_cmd).read().split('\n')
-    image_files = []
+    image_files = FileStore(ImageFile, size_typecode='q')
     total_size = 0
     for line in lines:
         items = line.split()
@@ -112,9 +116,7 @@ def get_all_files(path):
             if items[1] == 'total':
                 total_size += int(items[0])
             else:
-                image_files.append(
-                    ImageFile(items[-1][len(path):], items[5][:-1]))
-    image_files.sort(key=lambda i: i.name, reverse=True)
+                image_files.append(items[-1][len(path):], int(items[5][:-1]))
     return image_files, total_size
 
 
@@ -122,21 +124,37 @@ def diff_dirs(path0, path1):
     """Diff files of given paths
     :param path0:
     :param path1:
-    :return:files only in path0, files only in path 1
+    :return:files only in path0, common files (sizes in path0), files only in path 1,
+        each one sorted by directory then name
     """
     files0, total_size0 = get_all_files(path0)
-    files0_set = set(files0)
-
     files1, total_size1 = get_all_files(path1)
-    files1_set = set(files1)
-
-    intersection = files0_set.intersection(files1_set)
-
-    files_only_in_path0 = files0_set - intersection
-
-    files_only_in_path1 = files1_set - intersection
 
-    return sorted(files_only_in_path0, key=lambda i: i.name), sorted(intersection, key=lambda i: i.name), sorted(files_only_in_path1, key=lambda i: i.name)
+    # merge the two stores sorted by (dir, name) instead of building sets of
+    # files, no full path is built
+    order0 = files0.sorted_indices()
+    order1 = files1.sorted_indices()
+    only0, common, only1 = [], [], []
+    i = j = 0
+    key0 = files0.sort_key(order0[i]) if i < len(order0) else None
+    key1 = files1.sort_key(order1[j]) if j < len(order1) else None
+    while key0 is not None or key1 is not None:
+        if key1 is None or (key0 is not None and key0 < key1):
+            only0.append(order0[i])
+            i += 1
+            key0 = files0.sort_key(order0[i]) if i < len(order0) else None
+        elif key0 is None or key1 < key0:
+            only1.append(order1[j])
+            j += 1
+            key1 = files1.sort_key(order1[j]) if j < len(order1) else None
+        else:
+            common.append(order0[i])
+            i += 1
+            j += 1
+            key0 = files0.sort_key(order0[i]) if i < len(order0) else None
+            key1 = files1.sort_key(order1[j]) if j < len(order1) else None
+
+    return files0.select(only0), files0.select(common), files1.select(only1)
 
 
 def trim_image_name(image_name):
@@ -150,7 +168,7 @@ def trim_image_name(image_name):
 
 def write_image_files(image_files, target_path):
     """Write list of {ImageFile}s to target_path in csv format.
-    :param image_files: list of {ImageFile}s
+    :param image_files: iterable of {ImageFile}s
     :param target_path: output target path
     :return: 
     """
@@ -9,23 +9,50 @@ import yaml
 
 from common.utils import get_image_size, image_to_filename, is_empty_str
 from common.constants import Functionality
-from container import Container, Mount, ContainerTestCase
+from container import Container, Mount, ContainerTestCase, ExecSession
 from debloater import Cimplifier, Debloater
 from image_diff import diff_images
 from vul_analysis.vul_analysis import ContainerCreator
-from pkg_analysis.dependency_graph import PipDependencyGraph, AptDependencyGraph
-from pkg_analysis.analyzer import AptPkgAnalyzer, CondaPkgAnalyzer, PipPkgAnalyzer
+from pkg_analysis.dependency_graph import (
+    AptDependencyGraph,
+    CondaDependencyGraph,
+    PipDependencyGraph,
+)
+from pkg_analysis.analyzer import (
+    AptPkgAnalyzer,
+    CondaPkgAnalyzer,
+    PipPkgAnalyzer,
+    RootfsAptPkgAnalyzer,
+    RootfsCondaPkgAnalyzer,
+    RootfsPipPkgAnalyzer,
+)
 from pkg_analysis.package_info import (
     AptPkgInfoFiller,
     CondaPkgInfoFiller,
     PipPkgInfoFiller,
+    RootfsAptPkgInfoFiller,
+    RootfsCondaPkgInfoFiller,
+    RootfsPipPkgInfoFiller,
 )
 from pkg_analysis.package_file import (
     AptPkgFileFiller,
     CondaPkgFileFiller,
     PipPkgFileFiller,
+    RootfsAptPkgFileFiller,
+    RootfsCondaPkgFileFiller,
+    RootfsPipPkgFileFiller,
+)
+from pkg_analysis.dump_pkg_info import (
+    TABLE_FORMATS,
+    PkgFilesWriter,
+    PkgInfoDumper,
+    read_table,
 )
-from pkg_analysis.dump_pkg_info import PkgInfoDumper
+from pkg_analysis.ownership import OwnershipIndex
+from pkg_analysis.probe import ProbeRootFS
+from pkg_analysis.layer_cache import LayerCache
+from pkg_analysis.rootfs import METADATA_PATTERNS, export_rootfs
+from pkg_analysis.sbom import SBOM_FORMATS
 from pkg_analysis.image import Image
 
 
@@ -170,52 +197,93 @@ def vul_analysis(
     pd.DataFrame(all_pkg_stats).to_csv(pkg_cve_path, index=False)
 
 
-def pkg_info_analysis(image_name: str):
+def pkg_info_analysis(
+    image_name: str,
+    rootfs_dir: str = None,
+    use_probe=False,
+    layer_cache_dir: str = None,
+    table_format: str = "csv",
+):
+    """
+    rootfs_dir: if given, packages are read from the root filesystem of the
+    image stored in this dir instead of running containers.
+    use_probe: if True, all package metadata is collected by one run of the
+    inventory probe in a container of the image.
+    layer_cache_dir: if given with rootfs_dir, the parsed layers are cached
+    in this dir and reused by the images sharing them.
+    table_format: format of the dumped tables, one of TABLE_FORMATS.
+    """
     print(f"Analyzing packages in image: {image_name}")
+    rootfs = None
+    session = None
+    if not is_empty_str(rootfs_dir):
+        layer_cache = None
+        if not is_empty_str(layer_cache_dir):
+            layer_cache = LayerCache(layer_cache_dir, patterns=METADATA_PATTERNS)
+        rootfs = export_rootfs(image_name, rootfs_dir, layer_cache)
+    elif use_probe:
+        rootfs = ProbeRootFS(image_name)
+    else:
+        # all the commands of the analysis run in one container
+        session = ExecSession(image_name)
 
     def analyze_pkgs(pkg_type: str):
         ana = None
         info_filler = None
         file_filler = None
-        if pkg_type == "apt":
-            ana = AptPkgAnalyzer(image_name)
-            info_filler = AptPkgInfoFiller(image_name)
-            file_filler = AptPkgFileFiller(image_name)
+        if pkg_type == "apt" and rootfs is not None:
+            ana = RootfsAptPkgAnalyzer(rootfs)
+            info_filler = RootfsAptPkgInfoFiller(rootfs)
+            file_filler = RootfsAptPkgFileFiller(rootfs)
+        elif pkg_type == "apt":
+            ana = AptPkgAnalyzer(image_name, session)
+            info_filler = AptPkgInfoFiller(image_name, session)
+            file_filler = AptPkgFileFiller(image_name, session)
+        elif pkg_type == "pip" and rootfs is not None:
+            ana = RootfsPipPkgAnalyzer(rootfs)
+            info_filler = RootfsPipPkgInfoFiller(rootfs)
+            file_filler = RootfsPipPkgFileFiller(rootfs)
         elif pkg_type == "pip":
-            ana = PipPkgAnalyzer(image_name)
-            info_filler = PipPkgInfoFiller(image_name)
-            file_filler = PipPkgFileFiller(image_name)
+            ana = PipPkgAnalyzer(image_name, session)
+            info_filler = PipPkgInfoFiller(image_name, session)
+            file_filler = PipPkgFileFiller(image_name, session)
+        elif pkg_type == "conda" and rootfs is not None:
+            ana = RootfsCondaPkgAnalyzer(rootfs)
+            info_filler = RootfsCondaPkgInfoFiller(rootfs)
+            file_filler = RootfsCondaPkgFileFiller(rootfs)
         elif pkg_type == "conda":
-            ana = CondaPkgAnalyzer(image_name)
-            info_filler = CondaPkgInfoFiller(image_name)
-            file_filler = CondaPkgFileFiller(image_name)
+            ana = CondaPkgAnalyzer(image_name, session)
+            info_filler = CondaPkgInfoFiller(image_name, session)
+            file_filler = CondaPkgFileFiller(image_name, session)
         else:
             raise ValueError(f"Unknown package type: {pkg_type}")
 
         pkgs = ana.list_pkgs()
         info_filler.fit(pkgs)
-        file_filler.fit(pkgs)
+        # files are written package by package instead of being kept
+        for p, files in file_filler.iter_files(pkgs):
+            files_writer.write(p, files)
         return pkgs
 
-    all_pkgs = []
-    apt_pkgs = analyze_pkgs("apt")
-    pip_pkgs = analyze_pkgs("pip")
-    conda_pkgs = analyze_pkgs("conda")
-
-    print("Dumping package analysis results...")
     dumper = PkgInfoDumper()
+    pkg_info_file = image_to_filename(image_name) + "_" + f"packages.{table_format}"
+    pkg_file_info_file = (
+        image_to_filename(image_name) + "_" + f"packages_files.{table_format}"
+    )
+    print("dump files info to: ", pkg_file_info_file)
 
-    all_pkgs.extend(apt_pkgs)
-    all_pkgs.extend(pip_pkgs)
-    all_pkgs.extend(conda_pkgs)
+    all_pkgs = []
+    try:
+        with PkgFilesWriter(pkg_file_info_file, image_name) as files_writer:
+            for pkg_type in ["apt", "pip", "conda"]:
+                all_pkgs.extend(analyze_pkgs(pkg_type))
+                # the info of the packages analyzed so far survives a crash
+                dumper.dump_pkg_info(all_pkgs, image_name, pkg_info_file)
+    finally:
+        if session is not None:
+            session.stop()
 
-    pkg_info_file = image_to_filename(image_name) + "_" + "packages.csv"
     print("dump info to: ", pkg_info_file)
-    dumper.dump_pkg_info(all_pkgs, image_name, pkg_info_file)
-
-    pkg_file_info_file = image_to_filename(image_name) + "_" + "packages_files.csv"
-    print("dump files info to: ", pkg_file_info_file)
-    dumper.dump_pkg_files_info(all_pkgs, image_name, pkg_file_info_file)
 
 
 def pkg_deps_analysis(
@@ -226,24 +294,60 @@ def pkg_deps_analysis(
     packge_files_path: str,
     deps_path: str,
     grype_json_path: str,
+    rootfs_dir: str = None,
+    sbom_format: str = None,
+    fig_top_k: int = None,
+    fig_cache_dir: str = None,
 ):
-    pkg_df = pd.read_csv(package_path)
-    pkg_files_df = pd.read_csv(packge_files_path)
+    """
+    rootfs_dir: if given, the apt graph is built from the dpkg status file
+    of the image root filesystem stored in this dir, see pkg_info_analysis.
+    deps_path: deps.txt of scripts/show_deps.sh, if empty the pip graph is
+    built from the site-packages of the root filesystem in rootfs_dir.
+    sbom_format: if given, the original and debloated SBOMs of each graph
+    are written in this format, see SBOM_FORMATS.
+    fig_top_k: if given, the figures only draw the top k packages and
+    collapse the others, see DepsGraph.generate_fig.
+    fig_cache_dir: if given, the rendered figures are cached in this dir,
+    see render_cached.
+    """
+    pkg_df = read_table(package_path)
     removed_files_df = pd.read_csv(removed_files_path)
 
     with open(grype_json_path, "r") as file:
         grype_json_str = file.read()
 
-    with open(deps_path) as f:
-        deps_content = f.readlines()
+    # without deps.txt the pip graph is built from the image site-packages
+    deps_content = None
+    if not is_empty_str(deps_path):
+        with open(deps_path) as f:
+            deps_content = f.readlines()
+    elif is_empty_str(rootfs_dir):
+        raise Exception("either deps_path or rootfs_dir is needed")
+    rootfs = None
+    if not is_empty_str(rootfs_dir):
+        rootfs = export_rootfs(image_name, rootfs_dir)
+
+    # the packages_files table is only parsed if the index isn't persisted,
+    # its paths are resolved in the rootfs if there is one
+    ownership = OwnershipIndex.load_or_build(packge_files_path, rootfs=rootfs)
 
     image = Image(image_name)
-    image.analyze(debloated_image_name, pkg_files_df, removed_files_df, pkg_df)
+    image.analyze(
+        debloated_image_name,
+        ownership.table,
+        removed_files_df,
+        pkg_df,
+        ownership=ownership,
+    )
     image.pkg_bloat_degrees.to_csv("tmp.csv")
 
-    def generate_deps_graph(pkg_type):
+    def generate_deps_graph(pkg_type, session=None, rootfs=None):
         """
-        pkg_type: str, 'pip' or 'apt'
+        pkg_type: str, 'pip', 'apt' or 'conda'
+        session: ExecSession of the image, used by the apt graph
+        rootfs: RootFS of the image, used by the apt graph instead of session,
+        by the pip graph if there is no deps.txt and by the conda graph
         """
         direct_accessed_pkgs = []
         indices = (
@@ -257,19 +361,54 @@ def pkg_deps_analysis(
         dep_graph = None
         if pkg_type == "pip":
             dep_graph = PipDependencyGraph(
-                deps_content, direct_accessed_pkgs=direct_accessed_pkgs
+                deps_content,
+                direct_accessed_pkgs=direct_accessed_pkgs,
+                rootfs=rootfs if deps_content is None else None,
+            )
+        elif pkg_type == "conda":
+            dep_graph = CondaDependencyGraph(
+                rootfs, direct_accessed_pkgs=direct_accessed_pkgs
             )
         else:
             pkg_names = []
             for i in indices:
                 pkg_names.append(i[0])
-            dep_graph = AptDependencyGraph(image_name, direct_accessed_pkgs=pkg_names)
+            dep_graph = AptDependencyGraph(
+                image_name,
+                direct_accessed_pkgs=pkg_names,
+                session=session,
+                rootfs=rootfs,
+            )
 
-        dep_graph.build(image.pkg_bloat_degrees, grype_json=grype_json_str)
-        dep_graph.generate_fig(f"{image_to_filename(image_name)}_{pkg_type}", "./")
+        dep_graph.build(
+            image.pkg_bloat_degrees, grype_json=grype_json_str, ownership=ownership
+        )
+        dep_graph.generate_fig(
+            f"{image_to_filename(image_name)}_{pkg_type}",
+            "./",
+            top_k=fig_top_k,
+            cache_dir=None if is_empty_str(fig_cache_dir) else fig_cache_dir,
+        )
+        dep_graph.rollup().to_csv(
+            f"{image_to_filename(image_name)}_{pkg_type}_rollup.csv"
+        )
+        if not is_empty_str(sbom_format):
+            for is_debloated, suffix in [(False, ""), (True, "_debloated")]:
+                dep_graph.write_sbom(
+                    f"{image_to_filename(image_name)}_{pkg_type}{suffix}.{sbom_format}.json",
+                    sbom_format,
+                    is_debloated,
+                )
 
-    generate_deps_graph("pip")
-    generate_deps_graph("apt")
+    generate_deps_graph("pip", rootfs=rootfs)
+    if rootfs is not None:
+        generate_deps_graph("apt", rootfs=rootfs)
+        package_types = image.pkg_bloat_degrees.index.get_level_values("package_type")
+        if (package_types == "conda").any():
+            generate_deps_graph("conda", rootfs=rootfs)
+    else:
+        with ExecSession(image_name) as session:
+            generate_deps_graph("apt", session)
 
 
 if __name__ == "__main__":
@@ -290,6 +429,31 @@ if __name__ == "__main__":
         help="output path of debloating results, shoudl be a csv file",
     )
 
+    # arguments for package analysis
+    parser.add_argument(
+        "--rootfs_dir",
+        type=str,
+        help="dir of image root filesystems (`<image>` dirs or `<image>.tar` tarballs), images not found are `docker save`d into it. If set, packages are analyzed offline.",
+    )
+    parser.add_argument(
+        "--use_probe",
+        action="store_true",
+        help="collect all package metadata with one run of the inventory probe in a container of each image",
+    )
+    parser.add_argument(
+        "--layer_cache_dir",
+        type=str,
+        help="dir of the cache of parsed image layers, keyed by layer chain ID and shared by the images analyzed with --rootfs_dir",
+    )
+
+    parser.add_argument(
+        "--table_format",
+        type=str,
+        choices=TABLE_FORMATS,
+        default="csv",
+        help="format of the package tables, parquet and feather keep the package columns dictionary encoded",
+    )
+
     # arguments for image diff function
     parser.add_argument("--i1", type=str, help="the first image name")
     parser.add_argument("--i2", type=str, help="the second image name")
@@ -344,6 +508,22 @@ if __name__ == "__main__":
     parser.add_argument(
         "--grype_json_path", type=str, help="the path of grype json file"
     )
+    parser.add_argument(
+        "--sbom_format",
+        type=str,
+        choices=SBOM_FORMATS,
+        help="also write the original and debloated SBOMs of the dependency graphs in this format",
+    )
+    parser.add_argument(
+        "--fig_top_k",
+        type=int,
+        help="only draw the k heaviest and k most vulnerable packages of the dependency graphs and the paths to them, the other packages are collapsed",
+    )
+    parser.add_argument(
+        "--fig_cache_dir",
+        type=str,
+        help="cache the rendered dependency graph figures in this dir, by hash of the graph",
+    )
 
     args = parser.parse_args()
 
@@ -369,7 +549,13 @@ if __name__ == "__main__":
     elif func == Functionality.PKG_ANALYSIS.value:
         containers: List[Container] = yaml_to_containers(args.container_spec)
         for c in containers:
-            pkg_info_analysis(c.image)
+            pkg_info_analysis(
+                c.image,
+                args.rootfs_dir,
+                args.use_probe,
+                args.layer_cache_dir,
+                args.table_format,
+            )
     elif func == Functionality.PKG_DEPS_ANALYSIS.value:
         pkg_deps_analysis(
             args.img_name,
@@ -379,4 +565,8 @@ if __name__ == "__main__":
             args.package_files_path,
             args.deps_path,
             args.grype_json_path,
+            args.rootfs_dir,
+            args.sbom_format,
+            args.fig_top_k,
+            args.fig_cache_dir,
         )
@@ -5,10 +5,12 @@ import os
 
 import docker
 
-from .package import AptPackage, CondaPackage, PipPackage
-
-
+from container.session import run_in_image
 
+from .conda_meta import CondaEnvironments
+from .dpkg import DpkgDatabase
+from .package import AptPackage, CondaPackage, PipPackage
+from .site_packages import SitePackages
 
 
 class PkgAnalyzer(ABC):
@@ -18,15 +20,16 @@ class PkgAnalyzer(ABC):
 
 
 class AptPkgAnalyzer(object):
-    def __init__(self, container):
+    def __init__(self, container, session=None):
         self.container = container
+        self.session = session
         self.client = docker.from_env()
 
     def _detect_pkgs(self):
         output = ""
         try:
-            output = self.client.containers.run(
-                self.container, "apt list --installed", remove=True, entrypoint=""
+            output = run_in_image(
+                self.client, self.container, "apt list --installed", self.session
             ).decode("utf-8")
         except docker.errors.APIError:
             logging.error("apt not exist")
@@ -68,16 +71,36 @@ class AptPkgAnalyzer(object):
         return self._parse_pkgs(output)
 
 
+class RootfsAptPkgAnalyzer(PkgAnalyzer):
+    """
+    List apt packages from /var/lib/dpkg/status of a RootFS,
+    no container is started.
+    """
+
+    def __init__(self, rootfs):
+        self.rootfs = rootfs
+
+    def list_pkgs(self):
+        db = DpkgDatabase.load(self.rootfs)
+        if len(db.pkgs) == 0:
+            logging.error("apt not exist")
+        pkgs = []
+        for name, fields in db.pkgs.items():
+            pkgs.append(AptPackage(name, fields.get("Version")))
+        return pkgs
+
+
 class PipPkgAnalyzer(object):
-    def __init__(self, container):
+    def __init__(self, container, session=None):
         self.container = container
+        self.session = session
         self.client = docker.from_env()
 
     def _detect_pkgs(self):
         output = ""
         try:
-            output = self.client.containers.run(
-                self.container, "pip list --format=freeze", remove=True, entrypoint=""
+            output = run_in_image(
+                self.client, self.container, "pip list --format=freeze", self.session
             ).decode("utf-8")
         except docker.errors.APIError:
             logging.error("pip not exist")
@@ -122,18 +145,38 @@ class PipPkgAnalyzer(object):
         return self._parse_pkgs(output)
 
 
+class RootfsPipPkgAnalyzer(PkgAnalyzer):
+    """
+    List pip packages from the dist-info/egg-info dirs of every
+    site-packages dir of a RootFS, no container is started.
+    """
+
+    def __init__(self, rootfs):
+        self.rootfs = rootfs
+
+    def list_pkgs(self):
+        site_packages = SitePackages.load(self.rootfs)
+        if len(site_packages.dists) == 0:
+            logging.error("pip not exist")
+        pkgs = []
+        for name, dist in site_packages.dists.items():
+            pkgs.append(PipPackage(name, dist.version))
+        return pkgs
+
+
 class CondaPkgAnalyzer(object):
-    def __init__(self, container):
+    def __init__(self, container, session=None):
         self.container = container
+        self.session = session
         self.client = docker.from_env()
 
     def _display_pkg_root_dirs(self):
         try:
-            output = self.client.containers.run(
+            output = run_in_image(
+                self.client,
                 self.container,
                 "conda config --show pkgs_dirs",
-                remove=True,
-                entrypoint="",
+                self.session,
             ).decode("utf-8")
         except docker.errors.APIError:
             logging.error("Conda might not exist")
@@ -160,8 +203,8 @@ class CondaPkgAnalyzer(object):
             dir:  /opt/conda/pkgs
         """
         try:
-            output = self.client.containers.run(
-                self.container, f"ls {dir}", remove=True, entrypoint=""
+            output = run_in_image(
+                self.client, self.container, f"ls {dir}", self.session
             ).decode("utf-8")
         except docker.errors.ContainerError:
             logging.error(f"{dir} not exist.")
@@ -169,6 +212,11 @@ class CondaPkgAnalyzer(object):
         return output
 
     def _get_file_content(self, json_file_path):
+        if self.session is not None:
+            try:
+                return self.session.run(f"cat {json_file_path}")
+            except docker.errors.ContainerError:
+                return b""
         tmp_container = self.client.containers.create(
             self.container, f"cat {json_file_path}", detach=False, entrypoint=""
         )
@@ -223,3 +271,24 @@ class CondaPkgAnalyzer(object):
             pkgs = self._parse_pkgs(pkg_dirs_output, root_dir)
             packages.extend(pkgs)
         return packages
+
+
+class RootfsCondaPkgAnalyzer(PkgAnalyzer):
+    """
+    List conda packages from conda-meta of every prefix and from the pkgs
+    dirs of a RootFS, no container is started.
+    """
+
+    def __init__(self, rootfs):
+        self.rootfs = rootfs
+
+    def list_pkgs(self):
+        envs = CondaEnvironments.load(self.rootfs)
+        if len(envs.records) == 0:
+            logging.error("Conda might not exist")
+        packages = []
+        for record in envs.records:
+            pkg = CondaPackage(record.name, record.version)
+            pkg.location = record.location
+            packages.append(pkg)
+        return packages
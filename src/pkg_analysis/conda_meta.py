@@ -0,0 +1,146 @@
+import json
+import logging
+import posixpath
+
+# dirs where conda is usually installed, envs are below `<prefix>/envs`
+CONDA_PREFIX_PATTERNS = [
+    "/opt/conda",
+    "/opt/*",
+    "/root/*",
+    "/home/*/*",
+    "/usr/local",
+]
+
+# `conda config --show pkgs_dirs` besides `<prefix>/pkgs`
+CONDA_PKGS_DIR_PATTERNS = [
+    "/root/.conda/pkgs",
+    "/home/*/.conda/pkgs",
+]
+
+
+class CondaRecord(object):
+    def __init__(self, name, version, location, files, summary=None, depends=None):
+        """
+        location: dir the paths in files are relative to, the prefix for an
+                  installed package, the extracted dir for a package only
+                  found in a pkgs dir.
+        """
+        self.name = name
+        self.version = version
+        self.location = location
+        self.files = files
+        self.summary = summary
+        self.depends = depends if depends is not None else []
+
+
+def _load_json(rootfs, path):
+    content = rootfs.read_text(path)
+    if content is None:
+        return None
+    try:
+        return json.loads(content)
+    except json.decoder.JSONDecodeError:
+        logging.error(f"{path} is not a valid json file")
+        return None
+
+
+def find_conda_prefixes(rootfs):
+    bases = []
+    for pattern in CONDA_PREFIX_PATTERNS:
+        for prefix in rootfs.glob(pattern + "/conda-meta"):
+            prefix = posixpath.dirname(prefix)
+            if prefix not in bases:
+                bases.append(prefix)
+
+    prefixes = list(bases)
+    for base in bases:
+        for env_meta in rootfs.glob(base + "/envs/*/conda-meta"):
+            env = posixpath.dirname(env_meta)
+            if env not in prefixes:
+                prefixes.append(env)
+    return bases, prefixes
+
+
+class CondaEnvironments(object):
+    """
+    Conda packages of a RootFS, read from `<prefix>/conda-meta/*.json`
+    of every prefix and from `info/` of the extracted packages in the
+    pkgs dirs.
+    """
+
+    def __init__(self, rootfs) -> None:
+        self.rootfs = rootfs
+        self.records = []
+        bases, prefixes = find_conda_prefixes(rootfs)
+
+        extracted_dirs = set()
+        for prefix in prefixes:
+            meta_dir = posixpath.join(prefix, "conda-meta")
+            for meta_file in sorted(rootfs.listdir(meta_dir)):
+                if not meta_file.endswith(".json"):
+                    continue
+                data = _load_json(rootfs, posixpath.join(meta_dir, meta_file))
+                if data is None or "name" not in data:
+                    continue
+                extracted_dir = data.get("extracted_package_dir")
+                summary = None
+                if extracted_dir:
+                    extracted_dirs.add(extracted_dir)
+                    about = _load_json(
+                        rootfs, posixpath.join(extracted_dir, "info", "about.json")
+                    )
+                    if about is not None:
+                        summary = about.get("summary")
+                self.records.append(
+                    CondaRecord(
+                        data["name"],
+                        data["version"],
+                        prefix,
+                        data.get("files", []),
+                        summary=summary,
+                        depends=data.get("depends", []),
+                    )
+                )
+
+        # extracted packages that are not linked into any prefix
+        pkgs_dirs = [posixpath.join(base, "pkgs") for base in bases]
+        for pattern in CONDA_PKGS_DIR_PATTERNS:
+            pkgs_dirs.extend(rootfs.glob(pattern))
+        for pkgs_dir in pkgs_dirs:
+            for pkg_dir in sorted(rootfs.listdir(pkgs_dir)):
+                pkg_path = posixpath.join(pkgs_dir, pkg_dir)
+                if pkg_path in extracted_dirs:
+                    continue
+                index = _load_json(
+                    rootfs, posixpath.join(pkg_path, "info", "index.json")
+                )
+                if index is None:
+                    continue
+                about = _load_json(
+                    rootfs, posixpath.join(pkg_path, "info", "about.json")
+                )
+                files = rootfs.read_text(posixpath.join(pkg_path, "info", "files"))
+                self.records.append(
+                    CondaRecord(
+                        index["name"],
+                        index["version"],
+                        pkg_path,
+                        files.strip().splitlines() if files is not None else [],
+                        summary=about.get("summary") if about is not None else None,
+                        depends=index.get("depends", []),
+                    )
+                )
+
+        self.by_key = {}
+        for r in self.records:
+            self.by_key.setdefault((r.name, r.version, r.location), r)
+
+    def get(self, pkg):
+        return self.by_key[(pkg.name, pkg.version, pkg.location)]
+
+    @staticmethod
+    def load(rootfs):
+        """
+        conda prefixes and pkgs dirs are scanned once per RootFS
+        """
+        return rootfs.memo("conda", lambda: CondaEnvironments(rootfs))
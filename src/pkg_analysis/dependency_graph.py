@@ -1,54 +1,521 @@
 from abc import ABC, abstractmethod
+import hashlib
 import logging
 import json
-import queue
+import os
+import shutil
 
 import docker
 import graphviz
-
-from .package import PipPackage, AptPackage
+import numpy as np
+import pandas as pd
+
+from container.session import run_in_image
+from .dpkg import DpkgDatabase, parse_os_release
+from .graph_core import CoreNode, GraphCore
+from .image import SEVERITIES
+from .removal import RemovalSimulator
+from .sbom import SbomWriter, is_left
+from .site_packages import SitePackages, normalize_name
+from .conda_meta import CondaEnvironments, find_conda_prefixes
+from .package import AptPackage, CondaPackage, PipPackage
+
+
+def render_cached(dot, directory, cache_dir=None):
+    """
+    dot.render(directory=directory). If cache_dir is given, the rendered
+    figures are cached there by hash of the graph source, so the layout of
+    a graph already drawn isn't computed again. The cache isn't bounded.
+
+    Returns:
+        path of the rendered figure
+    """
+    if cache_dir is None:
+        return dot.render(directory=directory)
+    key = hashlib.sha256(dot.source.encode("utf-8")).hexdigest()
+    cached = os.path.join(cache_dir, f"{key}.{dot.format}")
+    if os.path.exists(cached):
+        out = dot.save(directory=directory) + "." + dot.format
+        shutil.copyfile(cached, out)
+        return out
+    out = dot.render(directory=directory)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f"{cached}.{os.getpid()}.tmp"
+        shutil.copyfile(out, tmp)
+        os.replace(tmp, cached)
+    except OSError as e:
+        logging.warning(f"cannot cache figure {out}: {e}")
+    return out
 
 
 class DepsGraph(ABC):
+    # columns of the package tables identifying a node
+    node_keys = ["package", "version"]
+
+    def __init__(self) -> None:
+        # edges and traversals of the graph, nodes are views over it
+        self.core = GraphCore()
+        # (core version, bfs of the root node) of the last traversal
+        self._root_bfs = None
+
     @abstractmethod
-    def build(self, pkg_bloat_degrees_df=None, grype_json='{"matches":[]}'):
+    def build(
+        self, pkg_bloat_degrees_df=None, grype_json='{"matches":[]}', ownership=None
+    ):
         raise NotImplementedError()
 
-    @abstractmethod
+    def _parse_grpye_json(self, grype_json, ownership=None):
+        """
+        Args:
+            ownership: OwnershipIndex of the image. If given, a match is
+                attributed to the packages of this type owning the
+                locations of its artifact, whatever the artifact type is.
+                The matches located in no package keep the name and
+                version of their artifact.
+
+        Returns:
+            pd.DataFrame of the grype matches of the packages of the graph,
+            columns package, version and severity
+        """
+        rows = []
+        for i, v in enumerate(json.loads(grype_json)["matches"]):
+            rows.append(
+                (
+                    i,
+                    v["artifact"]["type"],
+                    v["artifact"]["name"],
+                    v["artifact"]["version"],
+                    v["vulnerability"].get("severity"),
+                )
+            )
+        matches = pd.DataFrame(
+            rows,
+            columns=["match", "type", "package", "version", "severity"],
+            dtype=object,
+        )
+        by_artifact = matches[matches["type"] == self.grype_type]
+        if ownership is None:
+            return by_artifact[["package", "version", "severity"]]
+
+        owned = ownership.grype_owners(grype_json)
+        by_artifact = by_artifact[~by_artifact["match"].isin(owned["match"])]
+        owned = owned[owned["package_type"].astype(str) == self.pkg_type]
+        owned = owned[["match", "package", "version"]].astype(object)
+        by_owner = owned.drop_duplicates().merge(
+            matches[["match", "severity"]], on="match"
+        )
+        return pd.concat(
+            [
+                by_owner[["package", "version", "severity"]],
+                by_artifact[["package", "version", "severity"]],
+            ],
+            ignore_index=True,
+        )
+
+    def _annotate(self, pkg_bloat_degrees_df, vuls, keys):
+        """
+        Set bloat_degree, size, num_vuls and vuls_by_severity of the nodes
+        reached from the root with one join of the node table, pkg_bloat_degrees_df and the
+        grype matches.
+
+        Args:
+            pkg_bloat_degrees_df: obtained from Image.analyze()
+            vuls: grype matches, from _parse_grpye_json
+            keys: columns identifying a node, like ["package", "version"]
+
+        Returns:
+            list of the nodes found in pkg_bloat_degrees_df
+        """
+        root = self._node_id(self.root_node)
+        ids = [i for i in self._bfs(self.root_node)[0] if i != root]
+        nodes = self.core.nodes
+        node_df = pd.DataFrame(
+            {
+                "node": ids,
+                "package": [nodes[i].name for i in ids],
+                "version": [nodes[i].version for i in ids],
+            }
+        )[["node"] + keys]
+
+        pkgs = pkg_bloat_degrees_df.reset_index()
+        pkgs = pkgs[pkgs["package_type"].astype(str) == self.pkg_type]
+        pkgs = pkgs[keys + ["bloat_degree", "size(KB)_total"]].rename(
+            columns={"size(KB)_total": "size"}
+        )
+        for k in keys:
+            pkgs[k] = pkgs[k].astype(str)
+        counts = pkgs.groupby(keys).size()
+        for index in counts[counts > 1].index:
+            logging.error(f"Expect matched only one package: {index}")
+        pkgs = pkgs.drop_duplicates(keys)
+        num_vuls = (
+            vuls.groupby(keys)
+            .size()
+            .rename("num_vuls")
+            .to_frame()
+            .join(
+                vuls.groupby(keys + ["severity"])
+                .size()
+                .unstack(fill_value=0)
+                .reindex(columns=SEVERITIES, fill_value=0)
+            )
+            .reset_index()
+        )
+
+        annotated = node_df.merge(pkgs, on=keys, how="left", indicator="matched").merge(
+            num_vuls, on=keys, how="left"
+        )
+        for column in ["num_vuls"] + SEVERITIES:
+            annotated[column] = annotated[column].fillna(0).astype(int)
+
+        found = []
+        for row in annotated.itertuples(index=False):
+            node = nodes[row.node]
+            node.num_vuls = row.num_vuls
+            node.vuls_by_severity = {s: getattr(row, s) for s in SEVERITIES}
+            if row.matched == "both":
+                node.bloat_degree = row.bloat_degree
+                node.size = row.size
+                found.append(node)
+            else:
+                logging.error(
+                    f"{tuple(getattr(row, k) for k in keys)} not found in bloat_degree_df"
+                )
+        return found
+
+    def rollup(self):
+        """
+        Subtree aggregates of the packages reached from the root, computed
+        over the whole graph at once:
+            size(KB), removed_size(KB), num_vuls and one count per severity,
+            each as
+                <metric>:           the package alone
+                <metric>_inclusive: the package and everything it reaches,
+                                    shared dependencies and cycles counted
+                                    once
+                <metric>_dominated: the packages only reachable through
+                                    this one, what goes away with it
+
+        Returns:
+            pd.DataFrame indexed by (package, package_type, version), in BFS
+            order from the root, with a depth column
+        """
+        metrics = ["size(KB)", "removed_size(KB)", "num_vuls"] + SEVERITIES
+        nodes = self.core.nodes
+        values = np.zeros((len(nodes), len(metrics)))
+        for i, node in enumerate(nodes):
+            if node is self.root_node:
+                continue
+            size = max(getattr(node, "size", -1), 0)
+            values[i, 0] = size
+            if node.bloat_degree is not None:
+                values[i, 1] = size * node.bloat_degree
+            values[i, 2] = node.num_vuls
+            for j, severity in enumerate(SEVERITIES):
+                values[i, 3 + j] = node.vuls_by_severity.get(severity, 0)
+
+        root = self._node_id(self.root_node)
+        inclusive = self.core.closure_sums(values)
+        dominated = self.core.dominated_sums(root, values)
+        order, depth, _ = self._bfs(self.root_node)
+        ids = [i for i in order if i != root]
+
+        df = pd.DataFrame(
+            {
+                "package": [nodes[i].name for i in ids],
+                "package_type": self.pkg_type,
+                "version": [nodes[i].version for i in ids],
+                "depth": [depth[i] for i in ids],
+            }
+        ).set_index(["package", "package_type", "version"])
+        for j, metric in enumerate(metrics):
+            df[metric] = values[ids, j]
+            df[metric + "_inclusive"] = inclusive[ids, j]
+            df[metric + "_dominated"] = dominated[ids, j]
+        return df
+
+    def _rollup_entries(self):
+        df = self.rollup()
+        return {
+            (index[0], index[2]): {k: float(v) for k, v in row.items() if k != "depth"}
+            for index, row in df.to_dict("index").items()
+        }
+
+    def _label(self, node):
+        label = node.name + "\n" + str(node.depth)
+        if node.bloat_degree is not None:
+            label += "\n" + str(round(node.bloat_degree, 2))
+        label += "\n" + str(node.num_vuls)
+        return label
+
+    def generate_fig(
+        self,
+        name,
+        path="./",
+        top_k=None,
+        min_size=None,
+        min_removed_size=None,
+        cache_dir=None,
+    ):
+        """
+        Args:
+            top_k: if None every package is drawn. Otherwise only the top_k
+                packages dominating the most size(KB), the top_k with the
+                most vulnerabilities in their subtree and the shortest paths
+                from the root to them are drawn, see rollup(). The other
+                packages are collapsed into one aggregate node under the
+                drawn package that dominates them.
+            min_size: with top_k, the packages dominating at least min_size
+                KB are drawn too
+            min_removed_size: with top_k, same for the removed size(KB)
+            cache_dir: cache of the rendered figures, none by default, see
+                render_cached
+        """
+        dot = graphviz.Digraph(name, comment=name)
+        if top_k is None:
+
+            def generate_node(node):
+                dot.node(str(node), self._label(node))
+
+            def generate_edge(nodeA, nodeB):
+                dot.edge(str(nodeA), str(nodeB))
+
+            # one traversal, nodes get their depth before their label is made
+            self.traverse(node_func=generate_node, edge_func=generate_edge)
+        else:
+            self._collapsed_fig(dot, top_k, min_size, min_removed_size)
+        render_cached(dot, path, cache_dir)
+        logging.debug(dot.source)
+
+    def _collapsed_fig(self, dot, top_k, min_size, min_removed_size):
+        # sets the depths of the labels
+        self.traverse()
+        rollup = self.rollup()
+        root = self._node_id(self.root_node)
+        order, _, parent = self._bfs(self.root_node)
+        ids = np.array([i for i in order if i != root], dtype=np.int64)
+        nodes = self.core.nodes
+
+        size = rollup["size(KB)_dominated"].values
+        vuls = rollup["num_vuls_inclusive"].values
+        by_size = np.argsort(-size, kind="stable")[:top_k]
+        by_vuls = np.argsort(-vuls, kind="stable")[:top_k]
+        targets = set(ids[by_size])
+        targets.update(ids[by_vuls[vuls[by_vuls] > 0]])
+        if min_size is not None:
+            targets.update(ids[size >= min_size])
+        if min_removed_size is not None:
+            removed = rollup["removed_size(KB)_dominated"].values
+            targets.update(ids[removed >= min_removed_size])
+
+        kept = bytearray(len(nodes))
+        kept[root] = 1
+        for i in targets:
+            while i >= 0 and not kept[i]:
+                kept[i] = 1
+                i = parent[i]
+
+        # every collapsed package goes to the nearest drawn package
+        # dominating it, dominators come first in reversed postorder
+        idom, postorder = self.core.dominators(root)
+        owner = {}
+        collapsed = {}
+        for v in reversed(postorder):
+            if kept[v]:
+                owner[v] = v
+                continue
+            owner[v] = owner[idom[v]]
+            count, total_size, total_vuls = collapsed.get(owner[v], (0, 0, 0))
+            collapsed[owner[v]] = (
+                count + 1,
+                total_size + max(getattr(nodes[v], "size", -1), 0),
+                total_vuls + nodes[v].num_vuls,
+            )
+
+        def aggregate_name(i):
+            return f"{nodes[i]}+"
+
+        for v in reversed(postorder):
+            if kept[v]:
+                dot.node(str(nodes[v]), self._label(nodes[v]))
+        for v, (count, total_size, total_vuls) in collapsed.items():
+            dot.node(
+                aggregate_name(v),
+                f"+{count} packages\n{round(total_size)} KB\n{total_vuls}",
+                shape="box",
+                style="dashed",
+            )
+        edges = set()
+        for v in reversed(postorder):
+            if not kept[v]:
+                continue
+            for w in self.core.successors(v):
+                if kept[w]:
+                    edge = (str(nodes[v]), str(nodes[w]))
+                else:
+                    edge = (str(nodes[v]), aggregate_name(owner[w]))
+                if edge not in edges:
+                    edges.add(edge)
+                    dot.edge(*edge)
+
+    def _uncovered(self, ids):
+        """
+        Returns:
+            the nodes of ids no other one of them depends on, directly or
+            not, in topological order. A cycle of them gives one node.
+        """
+        ids = set(ids)
+        uncovered = []
+        covered = bytearray(len(self.core))
+        # strongly connected components in decreasing id order, dependents
+        # come before their dependencies and a cycle comes before what it
+        # depends on
+        for i in self.core.topological_order():
+            if i not in ids or covered[i]:
+                continue
+            uncovered.append(self.core.nodes[i])
+            for j in self.core.bfs(i)[0]:
+                covered[j] = 1
+        return uncovered
+
+    def removal_simulator(self, package_files_df=None):
+        """
+        What-if removals of packages of the graph, see RemovalSimulator
+        """
+        return RemovalSimulator(self, package_files_df)
+
+    def write_sbom(self, path, sbom_format="cyclonedx", is_debloated=False):
+        """
+        Stream the SBOM of the graph to path, see SbomWriter. Unlike
+        generate_sbom, every package is written once and referred to by id.
+        """
+        with open(path, "w") as f:
+            SbomWriter(f, sbom_format, is_debloated).write(self)
+
+    def _node_id(self, node):
+        if node.core is not self.core:
+            node.core = self.core
+            node.id = self.core.add_node(node)
+        return node.id
+
+    def _add_edge(self, node, sub_node):
+        """
+        All the edges are added here
+        """
+        self.core.add_edge(self._node_id(node), self._node_id(sub_node))
+
+    def _bfs(self, start_node):
+        start = self._node_id(start_node)
+        if start_node is not self.root_node:
+            return self.core.bfs(start)
+        if self._root_bfs is None or self._root_bfs[0] != self.core.version:
+            self._root_bfs = (self.core.version, self.core.bfs(start))
+        return self._root_bfs[1]
+
     def traverse(self, node_func=None, edge_func=None, start_node=None):
-        raise NotImplementedError()
+        """
+        node_func takes a node as a parameter.
+        edge_func taks 2 nodes as parameters.
+
+        Nodes are visited in BFS order. Traversing from the root node sets
+        the depth of every node to its BFS depth, the length of a
+        shortest path from the root.
+        """
+        if start_node is None:
+            start_node = self.root_node
+        order, depth, _ = self._bfs(start_node)
+        nodes = self.core.nodes
+        if start_node is self.root_node:
+            for i in order:
+                nodes[i].depth = depth[i]
+        for i in order:
+            n = nodes[i]
+            if node_func is not None:
+                node_func(n)
+            if edge_func is not None:
+                for j in self.core.successors(i):
+                    edge_func(n, nodes[j])
+
+    def apply_to_pd(self, node, node_func):
+        self.traverse(node_func=node_func, start_node=node)
+
+    def parents(self, node):
+        if node.core is not self.core:
+            return []
+        nodes = self.core.nodes
+        return [nodes[i] for i in self.core.predecessors(node.id)]
+
+    def apply_to_pr(self, node, node_func):
+        """
+        Apply node_func to node and all the packages depending on it, the
+        root node excluded.
+        """
+        root = self._node_id(self.root_node)
+        nodes = self.core.nodes
+        order, _, _ = self.core.bfs(self._node_id(node), reverse=True)
+        for i in order:
+            if i != root:
+                node_func(nodes[i])
+
+    def reverse_closure(self, node):
+        """
+        Returns:
+            set of the packages depending on node directly or not, node
+            and the root node excluded.
+        """
+        closure = set()
+        self.apply_to_pr(node, closure.add)
+        closure.discard(node)
+        return closure
+
+    def why_installed(self, node):
+        """
+        Returns:
+            a shortest path [root_node, ..., node] of dependencies that
+            brings node into the image, None if root_node doesn't reach it.
+        """
+        if node.core is not self.core:
+            return None
+        _, depth, parent = self._bfs(self.root_node)
+        i = node.id
+        if depth[i] < 0:
+            return None
+        path = []
+        while i >= 0:
+            path.append(self.core.nodes[i])
+            i = parent[i]
+        path.reverse()
+        return path
 
 
 # pip dependency graph
 class PipDependencyGraph(DepsGraph):
-    def __init__(self, deps_file_content, direct_accessed_pkgs=None) -> None:
+    pkg_type = "pip"
+    grype_type = "python"
+
+    def __init__(
+        self, deps_file_content=None, direct_accessed_pkgs=None, rootfs=None
+    ) -> None:
         """
         deps_file_content: array of content of deps.txt, split by lines,
         users could specify the start points by giving direct_accessed_pkgs
+        rootfs: RootFS of the image, if given the graph is built from the
+                Requires-Dist of the distributions in its site-packages, no
+                deps.txt is needed. The start points are the packages of
+                direct_accessed_pkgs no other one of them depends on.
         """
+        super().__init__()
         self.deps_file_content = deps_file_content
+        self.rootfs = rootfs
         self.root_node = PipGraphNode(
             "app",
             "0",
         )
         self.root_node.type = "root"
-        self.vul_table = {}
         self.table = {}
         self.direct_accessed_packages = direct_accessed_pkgs
 
-    def _parse_grpye_json(self, grype_json):
-        data = json.loads(grype_json)["matches"]
-        for v in data:
-            name = v["artifact"]["name"]
-            version = v["artifact"]["version"]
-            type = v["artifact"]["type"]
-            if type == "python":
-                node = PipGraphNode(name=name, version=version)
-                if node not in self.vul_table:
-                    self.vul_table[node] = 1
-                else:
-                    self.vul_table[node] += 1
-
     def _parse_file_content(self, all_content):
         for i, line in enumerate(all_content):
             if line.strip() == "project_level_deps:":
@@ -94,9 +561,50 @@ class PipDependencyGraph(DepsGraph):
                     sub_pkg = PipGraphNode(name=name, version=version)
                     table[key] = sub_pkg
 
-                pkg.deps.add(sub_pkg)
+                self._add_edge(pkg, sub_pkg)
+        return table
+
+    def _pase_site_packages(self):
+        """
+        Same table as _pase_all_deps, from the metadata of the distributions
+        installed in the image.
+        """
+        site_packages = SitePackages.load(self.rootfs)
+        table = {}
+        for dist in site_packages.dists.values():
+            table[dist.name + "_" + dist.version] = PipGraphNode(
+                name=dist.name, version=dist.version
+            )
+        for dist in site_packages.dists.values():
+            pkg = table[dist.name + "_" + dist.version]
+            for name in site_packages.dependencies(dist):
+                sub_dist = site_packages.dists.get(name)
+                # optional or missing dependency
+                if sub_dist is None:
+                    continue
+                self._add_edge(pkg, table[sub_dist.name + "_" + sub_dist.version])
         return table
 
+    def _infer_project_deps(self, all_deps_table, accessed_pkgs):
+        """
+        The project-level dependencies are the accessed packages that no
+        other accessed package depends on, directly or not. A cycle of them
+        gives one package.
+
+        accessed_pkgs: list of (name, version), all the packages if None
+        """
+        if accessed_pkgs is None:
+            keys = list(all_deps_table)
+        else:
+            keys = [normalize_name(p[0]) + "_" + p[1].strip() for p in accessed_pkgs]
+        accessed = []
+        for key in keys:
+            if key in all_deps_table:
+                accessed.append(self._node_id(all_deps_table[key]))
+            else:
+                logging.error(f"package {key} not found")
+        return [(node.name, node.version) for node in self._uncovered(accessed)]
+
     def _parse_deps(self, all_deps_table, project_deps):
         for dep in project_deps:
             key = dep[0].strip().replace("_", "-").lower() + "_" + dep[1].strip()
@@ -110,122 +618,68 @@ class PipDependencyGraph(DepsGraph):
                 continue
             node = all_deps_table[key]
 
-            self.root_node.deps.add(node)
+            self._add_edge(self.root_node, node)
 
         return self.root_node
 
-    def build(self, pkg_bloat_degrees_df=None, grype_json='{"matches":[]}'):
+    def build(
+        self, pkg_bloat_degrees_df=None, grype_json='{"matches":[]}', ownership=None
+    ):
         """
         pkg_bloat_degrees_df:  obtained from Image.analyze()
+        ownership: OwnershipIndex attributing the grype matches, see
+            _parse_grpye_json
         """
-        if len(self.deps_file_content) <= 1:
+        if self.rootfs is None and len(self.deps_file_content) <= 1:
             return self.root_node
 
-        self._parse_grpye_json(grype_json)
+        vuls = self._parse_grpye_json(grype_json, ownership)
 
-        all_deps, project_deps = self._parse_file_content(self.deps_file_content)
-        all_deps_table = self._pase_all_deps(all_deps)
-        if self.direct_accessed_packages is not None:
-            project_deps = self.direct_accessed_packages
+        if self.rootfs is not None:
+            all_deps_table = self._pase_site_packages()
+            project_deps = self._infer_project_deps(
+                all_deps_table, self.direct_accessed_packages
+            )
+        else:
+            all_deps, project_deps = self._parse_file_content(self.deps_file_content)
+            all_deps_table = self._pase_all_deps(all_deps)
+            if self.direct_accessed_packages is not None:
+                project_deps = self.direct_accessed_packages
         self._parse_deps(all_deps_table, project_deps)
         if pkg_bloat_degrees_df is None:
             return self.root_node
 
-        def fill_bloat_degree_and_table(node):
-            index = (node.name, node.type, node.version)
-            if index in pkg_bloat_degrees_df.index:
-                bloat_degree = pkg_bloat_degrees_df.loc[index]["bloat_degree"]
-                node.bloat_degree = bloat_degree
-                size = pkg_bloat_degrees_df.loc[index]["size(KB)_total"]
-                node.size = size
-                self.table[node.name + "_" + node.version] = node
-                if node in self.vul_table:
-                    node.num_vuls = self.vul_table[node]
-            else:
-                logging.error(f"{index} not found in bloat_degree_df")
-
-        self.traverse(node_func=fill_bloat_degree_and_table)
+        for node in self._annotate(pkg_bloat_degrees_df, vuls, self.node_keys):
+            self.table[node.name + "_" + node.version] = node
 
         return self.root_node
 
-    def apply_to_pd(self, node, node_func):
-        self.traverse(node_func=node_func, start_node=node)
-
-    def apply_to_pr(self, node, node_func):
-        to_be_visited = queue.Queue()
-        visited = set()
-
-        to_be_visited.put(node)
-        while not to_be_visited.empty():
-            n = to_be_visited.get()
-            if n not in visited:
-                node_func(n)
-                visited.add(n)
-                for _, graph_node in self.table.items():
-                    if node in graph_node.deps and graph_node not in visited:
-                        to_be_visited.put(graph_node)
-
-    def traverse(self, node_func=None, edge_func=None, start_node=None):
+    def generate_sbom(self, is_debloated=False, rollup=False):
         """
-        node_func takes a node as a parameter.
-        edge_func taks 2 nodes as parameters.
+        rollup: add the subtree aggregates of rollup() to every entry
 
+        The debloated sizes are what is left of the packages,
+        size * (1 - bloat_degree), as in SbomWriter.
         """
-        to_be_visited = queue.Queue()
-        visited = set()
-        if start_node is None:
-            start_node = self.root_node
-        to_be_visited.put(start_node)
-        while not to_be_visited.empty():
-            n = to_be_visited.get()
-            if n not in visited:
-                if node_func is not None:
-                    node_func(n)
-                visited.add(n)
-                for sub_n in n.deps:
-                    if sub_n.depth == 0:
-                        sub_n.depth = n.depth + 1
-                    if edge_func is not None:
-                        edge_func(n, sub_n)
-                    to_be_visited.put(sub_n)
-
-    def generate_fig(self, name, path="./"):
-        dot = graphviz.Digraph(name, comment="deps graph")
-
-        def generate_node(node):
-            label = node.name + "\n" + str(node.depth)
-            if node.bloat_degree is not None:
-                label += "\n" + str(round(node.bloat_degree, 2))
-            label += "\n" + str(node.num_vuls)
-            dot.node(str(node), label)
-
-        def generate_edge(nodeA, nodeB):
-            dot.edge(str(nodeA), str(nodeB))
-
-        self.traverse(node_func=generate_node)
-        self.traverse(edge_func=generate_edge)
-        dot.render(directory=path)
-        logging.debug(dot.source)
-
-    def generate_sbom(self, is_debloated=False):
         sbom = {"packages": []}
+        rollups = self._rollup_entries() if rollup else None
 
         def generate_entry(node):
             if node.name == "app" and node.depth == 0:
                 return
             if is_debloated:
-                if node.bloat_degree == 1 or node.bloat_degree is None:
+                if not is_left(node):
                     return
                 entry = {
                     "name": node.name,
                     "version": node.version,
                     "depth": node.depth,
                     "type": "PIP",
-                    "size": int(node.size * node.bloat_degree),
+                    "size": int(node.size * (1 - node.bloat_degree)),
                     "dependencies": [],
                 }
                 for n in node.deps:
-                    if node.bloat_degree == 1 or node.bloat_degree is None:
+                    if not is_left(n):
                         continue
                     entry["dependencies"].append(
                         {
@@ -233,7 +687,7 @@ class PipDependencyGraph(DepsGraph):
                             "version": n.version,
                             "depth": n.depth,
                             "type": "PIP",
-                            "size": int(n.size * node.bloat_degree),
+                            "size": int(n.size * (1 - n.bloat_degree)),
                         }
                     )
             else:
@@ -255,6 +709,8 @@ class PipDependencyGraph(DepsGraph):
                             "size": n.size,
                         }
                     )
+            if rollups is not None:
+                entry["rollup"] = rollups.get((node.name, node.version))
             sbom["packages"].append(entry)
 
         self.traverse(node_func=generate_entry)
@@ -263,7 +719,7 @@ class PipDependencyGraph(DepsGraph):
 
 
 # pip dependency node
-class PipGraphNode(PipPackage):
+class PipGraphNode(CoreNode, PipPackage):
     def __init__(
         self,
         name,
@@ -273,10 +729,11 @@ class PipGraphNode(PipPackage):
         size=-1,
     ):
         super().__init__(name, version, desc, size)
-        self.deps = set()
+        self._init_core_node()
         self.bloat_degree = bloat_degree
         self.depth = 0
         self.num_vuls = 0
+        self.vuls_by_severity = {}
 
     def __hash__(self) -> int:
         return hash(self.name + ":" + self.version)
@@ -300,29 +757,30 @@ class PipGraphNode(PipPackage):
 
 
 class AptDependencyGraph(DepsGraph):
-    def __init__(self, container_name, direct_accessed_pkgs) -> None:
+    pkg_type = "apt"
+    grype_type = "deb"
+    # apt depends doesn't give versions, packages are matched by name
+    node_keys = ["package"]
+
+    def __init__(
+        self, container_name, direct_accessed_pkgs, session=None, rootfs=None
+    ) -> None:
         """
         pkg_names: a list of direct deps pkg names.
+        session: an ExecSession of container_name, `apt depends` runs in it if given
+        rootfs: RootFS of the image, if given the graph is built from its dpkg
+                status file and no container is run.
         """
+        super().__init__()
         self.container_name = container_name
+        self.session = session
+        self.rootfs = rootfs
         self.pkg_names = direct_accessed_pkgs
         self.root_node = AptGraphNode("app")
         self.table = {}
         self.root_node.type = "root"
-        self.vul_table = {}
-
-    def _parse_grpye_json(self, grype_json):
-        data = json.loads(grype_json)["matches"]
-        for v in data:
-            name = v["artifact"]["name"]
-            version = v["artifact"]["version"]
-            type = v["artifact"]["type"]
-            if type == "deb":
-                node = AptGraphNode(name=name)
-                if node not in self.vul_table:
-                    self.vul_table[node] = 1
-                else:
-                    self.vul_table[node] += 1
+        # ID of the os-release of the image, the namespace of the purls
+        self.distro = None
 
     def _show_pkg_depends(self, pkg_names):
         """
@@ -342,12 +800,24 @@ class AptDependencyGraph(DepsGraph):
         cmd = "apt depends --installed "
         for p in pkg_names:
             cmd += p + " "
-        raw_output = self.client.containers.run(
-            self.container_name, cmd, remove=True, entrypoint=""
+        raw_output = run_in_image(
+            self.client, self.container_name, cmd, self.session
         ).decode("utf-8")
         arr_output = raw_output.splitlines()
         return arr_output
 
+    def _show_distro(self):
+        """
+        ID of the os-release of the container, None if it has none
+        """
+        try:
+            output = run_in_image(
+                self.client, self.container_name, "cat /etc/os-release", self.session
+            )
+        except docker.errors.DockerException:
+            return None
+        return parse_os_release(output.decode("utf-8")).get("ID")
+
     def _create_sub_graph(self, arr_output):
         cur_pkg_ind = 0
         cur_id = 0
@@ -372,7 +842,7 @@ class AptDependencyGraph(DepsGraph):
                     else:
                         sub_node = AptGraphNode(dep_pkg_name)
                         self.table[dep_pkg_name] = sub_node
-                    node.deps.add(sub_node)
+                    self._add_edge(node, sub_node)
                 cur_id += 1
                 if cur_id >= len(arr_output):
                     break
@@ -385,7 +855,7 @@ class AptDependencyGraph(DepsGraph):
                     continue
                 raise Exception(f"package {name} is not analyzed")
             node = self.table[name]
-            self.root_node.deps.add(node)
+            self._add_edge(self.root_node, node)
         return self.root_node
 
     def _create_whole_graph(self, arr_output):
@@ -406,85 +876,63 @@ class AptDependencyGraph(DepsGraph):
                 break
         return self.root_node
 
-    def traverse(self, node_func=None, edge_func=None, start_node=None):
+    def _create_whole_graph_from_dpkg(self):
         """
-        node_func takes a node as a parameter.
-        edge_func taks 2 nodes as parameters.
-
+        Same graph as _create_whole_graph, from the Depends, Pre-Depends and
+        Provides fields of the dpkg status file, in one pass.
         """
-        to_be_visited = queue.Queue()
-        visited = set()
-        if start_node is None:
-            start_node = self.root_node
-        to_be_visited.put(start_node)
-        while not to_be_visited.empty():
-            n = to_be_visited.get()
-            if n not in visited:
-                if node_func is not None:
-                    node_func(n)
-                visited.add(n)
-                for sub_n in n.deps:
-                    if sub_n.depth == 0:
-                        sub_n.depth = n.depth + 1
-                    if edge_func is not None:
-                        edge_func(n, sub_n)
-                    to_be_visited.put(sub_n)
-
-    def apply_to_pd(self, node, node_func):
-        self.traverse(node_func=node_func, start_node=node)
-
-    def apply_to_pr(self, node, node_func):
-        to_be_visited = queue.Queue()
-        visited = set()
-
-        to_be_visited.put(node)
-        while not to_be_visited.empty():
-            n = to_be_visited.get()
-            if n not in visited:
-                node_func(n)
-                visited.add(n)
-                for _, graph_node in self.table.items():
-                    if node in graph_node.deps and graph_node not in visited:
-                        to_be_visited.put(graph_node)
-
-    def generate_fig(self, name, path="./"):
-        dot = graphviz.Digraph(name, comment=name)
-
-        def generate_node(node):
-            label = node.name + "\n" + str(node.depth)
-            if node.bloat_degree is not None:
-                label += "\n" + str(round(node.bloat_degree, 2))
-            label += "\n" + str(node.num_vuls)
-
-            dot.node(str(node), label)
+        db = DpkgDatabase.load(self.rootfs)
+        self.distro = db.distro
+        todo = [name for name in self.pkg_names if name in db.pkgs]
+        for name in todo:
+            self.table[name] = AptGraphNode(name, db.version(name), arch=db.arch(name))
+        while todo:
+            name = todo.pop()
+            node = self.table[name]
+            for dep_name in db.depends(name):
+                sub_node = self.table.get(dep_name)
+                if sub_node is None:
+                    sub_node = AptGraphNode(
+                        dep_name, db.version(dep_name), arch=db.arch(dep_name)
+                    )
+                    self.table[dep_name] = sub_node
+                    todo.append(dep_name)
+                self._add_edge(node, sub_node)
 
-        def generate_edge(nodeA, nodeB):
-            dot.edge(str(nodeA), str(nodeB))
+        for name in self.pkg_names:
+            if name not in self.table:
+                if name == "tensorflow-model-server":
+                    continue
+                raise Exception(f"package {name} is not analyzed")
+            self._add_edge(self.root_node, self.table[name])
+        return self.root_node
 
-        self.traverse(node_func=generate_node)
-        self.traverse(edge_func=generate_edge)
-        dot.render(directory=path)
-        logging.debug(dot.source)
+    def generate_sbom(self, is_debloated=False, rollup=False):
+        """
+        rollup: add the subtree aggregates of rollup() to every entry
 
-    def generate_sbom(self, is_debloated=False):
+        The debloated sizes are what is left of the packages,
+        size * (1 - bloat_degree), as in SbomWriter.
+        """
         sbom = {"packages": []}
+        rollups = self._rollup_entries() if rollup else None
 
         def generate_entry(node):
             if node.name == "app" and node.depth == 0:
                 return
             if is_debloated:
-                if node.bloat_degree == 1:
+                if not is_left(node):
                     return
                 entry = {
                     "name": node.name,
                     "version": node.version,
                     "depth": node.depth,
                     "type": "APT",
-                    "size": int(node.size * node.bloat_degree),
+                    "size": int(node.size * (1 - node.bloat_degree)),
                     "dependencies": [],
                 }
                 for n in node.deps:
-                    if node.bloat_degree == 1 or node.bloat_degree is None:
+                    if not is_left(n):
                         continue
                     entry["dependencies"].append(
                         {
@@ -492,7 +940,7 @@ class AptDependencyGraph(DepsGraph):
                             "version": n.version,
                             "depth": n.depth,
                             "type": "APT",
-                            "size": int(n.size * node.bloat_degree),
+                            "size": int(n.size * (1 - n.bloat_degree)),
                         }
                     )
             else:
@@ -514,41 +962,33 @@ class AptDependencyGraph(DepsGraph):
                             "size": n.size,
                         }
                     )
+            if rollups is not None:
+                entry["rollup"] = rollups.get((node.name, node.version))
             sbom["packages"].append(entry)
 
         self.traverse(node_func=generate_entry)
         print("num of apt:", len(sbom["packages"]))
         return sbom
 
-    def build(self, pkg_bloat_degrees_df=None, grype_json='{"matches":[]}'):
-        self._parse_grpye_json(grype_json)
-
-        arr_output = self._show_pkg_depends(self.pkg_names)
-        self._create_whole_graph(arr_output)
+    def build(
+        self, pkg_bloat_degrees_df=None, grype_json='{"matches":[]}', ownership=None
+    ):
+        vuls = self._parse_grpye_json(grype_json, ownership)
+
+        if self.rootfs is not None:
+            self._create_whole_graph_from_dpkg()
+        else:
+            arr_output = self._show_pkg_depends(self.pkg_names)
+            self._create_whole_graph(arr_output)
+            self.distro = self._show_distro()
         if pkg_bloat_degrees_df is None:
             return self.root_node
 
-        def fill_bloat_degree(node):
-            res = pkg_bloat_degrees_df.query(
-                f'package=="{node.name}" and package_type=="apt"'
-            )
-            if len(res) != 1 and node != self.root_node:
-                logging.error(
-                    f"Expect matched only one package: {node.name}, get: {len(res)}"
-                )
-                # raise Exception(
-                #     f'Expect matched only one package: {node.name}')
-            if node != self.root_node:
-                node.bloat_degree = res["bloat_degree"][0]
-                node.size = res["size(KB)_total"][0]
-                if node in self.vul_table:
-                    node.num_vuls = self.vul_table[node]
-
-        self.traverse(node_func=fill_bloat_degree)
+        self._annotate(pkg_bloat_degrees_df, vuls, self.node_keys)
         return self.root_node
 
 
-class AptGraphNode(AptPackage):
+class AptGraphNode(CoreNode, AptPackage):
     def __init__(
         self,
         name,
@@ -556,12 +996,15 @@ class AptGraphNode(AptPackage):
         bloat_degree=None,
         desc=None,
         size=-1,
+        arch=None,
     ):
         super().__init__(name, version, desc, size)
-        self.deps = set()
+        self._init_core_node()
         self.depth = 0
         self.bloat_degree = bloat_degree
         self.num_vuls = 0
+        self.vuls_by_severity = {}
+        self.arch = arch  # Architecture of the dpkg status, if known
 
     # here we don't treat version as an identifier, as 'apt depends' command
     # doesn't accept a version as an argument.
@@ -576,3 +1019,122 @@ class AptGraphNode(AptPackage):
 
     def __repr__(self) -> str:
         return self.name
+
+
+# conda dependency graph, from the depends of conda-meta/*.json
+class CondaDependencyGraph(DepsGraph):
+    pkg_type = "conda"
+    grype_type = "conda"
+
+    def __init__(self, rootfs, direct_accessed_pkgs=None) -> None:
+        """
+        rootfs: RootFS of the image
+        direct_accessed_pkgs: list of (name, version), the start points are
+            the ones no other one of them depends on, all the packages if
+            None
+        """
+        super().__init__()
+        self.rootfs = rootfs
+        self.root_node = CondaGraphNode("app", "0")
+        self.root_node.type = "root"
+        self.table = {}  # (prefix, name) -> node
+        self.direct_accessed_packages = direct_accessed_pkgs
+
+    def _create_whole_graph(self):
+        """
+        The depends of a package are resolved in its own prefix, one pass
+        over the records.
+        """
+        envs = CondaEnvironments.load(self.rootfs)
+        _, prefixes = find_conda_prefixes(self.rootfs)
+        records = [r for r in envs.records if r.location in prefixes]
+        for r in records:
+            self.table.setdefault(
+                (r.location, r.name), CondaGraphNode(r.name, r.version, r.location)
+            )
+        for r in records:
+            node = self.table[(r.location, r.name)]
+            for spec in r.depends:
+                # 'python >=3.8,<3.9.0a0', virtual packages like __glibc
+                # aren't installed
+                name = spec.split()[0]
+                sub_node = self.table.get((r.location, name))
+                if sub_node is None:
+                    if not name.startswith("__"):
+                        logging.error(f"{r.name}: dependency {name} not found")
+                    continue
+                self._add_edge(node, sub_node)
+            self._node_id(node)
+
+        if self.direct_accessed_packages is None:
+            accessed = [self._node_id(n) for n in self.table.values()]
+        else:
+            by_key = {}
+            for n in self.table.values():
+                by_key.setdefault((n.name, n.version), []).append(n)
+            accessed = []
+            for name, version in self.direct_accessed_packages:
+                nodes = by_key.get((name, version))
+                if nodes is None:
+                    logging.error(f"package {name}_{version} not found")
+                    continue
+                accessed.extend(self._node_id(n) for n in nodes)
+        for node in self._uncovered(accessed):
+            self._add_edge(self.root_node, node)
+        return self.root_node
+
+    def build(
+        self, pkg_bloat_degrees_df=None, grype_json='{"matches":[]}', ownership=None
+    ):
+        """
+        pkg_bloat_degrees_df:  obtained from Image.analyze()
+        ownership: OwnershipIndex attributing the grype matches, see
+            _parse_grpye_json
+        """
+        vuls = self._parse_grpye_json(grype_json, ownership)
+        self._create_whole_graph()
+        if pkg_bloat_degrees_df is None:
+            return self.root_node
+
+        self._annotate(pkg_bloat_degrees_df, vuls, self.node_keys)
+        return self.root_node
+
+
+class CondaGraphNode(CoreNode, CondaPackage):
+    def __init__(
+        self,
+        name,
+        version,
+        location="",
+        bloat_degree=None,
+        desc=None,
+        size=-1,
+    ):
+        super().__init__(name, version, desc, size)
+        self._init_core_node()
+        # the prefix, a package can be installed in several environments
+        self.location = location
+        self.bloat_degree = bloat_degree
+        self.depth = 0
+        self.num_vuls = 0
+        self.vuls_by_severity = {}
+
+    def __hash__(self) -> int:
+        return hash(self.location + ":" + self.name + ":" + self.version)
+
+    def __eq__(self, __o: object) -> bool:
+        return (
+            self.__class__ == __o.__class__
+            and self.location == __o.location
+            and self.name == __o.name
+            and self.version == __o.version
+        )
+
+    def __str__(self) -> str:
+        # the same package can be in several prefixes
+        if not self.location:
+            return self.name + "_" + self.version
+        return self.name + "_" + self.version + "@" + self.location
+
+    def __repr__(self) -> str:
+        return str(self)
@@ -0,0 +1,214 @@
+import posixpath
+import re
+
+DPKG_STATUS_PATH = "/var/lib/dpkg/status"
+DPKG_INFO_DIR = "/var/lib/dpkg/info"
+# the first one found names the distribution, like `. /etc/os-release`
+OS_RELEASE_PATHS = ["/etc/os-release", "/usr/lib/os-release"]
+
+# fields whose packages must be installed for a package to work
+DEPENDS_FIELDS = ["Pre-Depends", "Depends"]
+
+# version constraints, arch lists and build profiles of a relation
+_RELATION_EXTRAS = re.compile(r"\([^)]*\)|\[[^\]]*\]|<[^>]*>")
+
+
+def parse_control(content):
+    """
+    Args:
+        content: deb822 paragraphs like
+            'Package: adduser
+            Status: install ok installed
+            Installed-Size: 624
+            Version: 3.118ubuntu5
+            Description: add and remove users and groups
+             This package includes the 'adduser' and 'deluser' commands for creating
+             and removing users.
+
+            Package: apt
+            ...'
+
+    Returns:
+        a list of dicts, one per paragraph. Continuation lines are joined
+        with '\\n'.
+    """
+    paragraphs = []
+    fields = {}
+    last_field = None
+    for line in content.splitlines():
+        if line.strip() == "":
+            if fields:
+                paragraphs.append(fields)
+            fields = {}
+            last_field = None
+            continue
+        if line[0] in " \t":
+            if last_field is not None:
+                fields[last_field] += "\n" + line.strip()
+            continue
+        field, _, value = line.partition(":")
+        last_field = field.strip()
+        fields[last_field] = value.strip()
+    if fields:
+        paragraphs.append(fields)
+    return paragraphs
+
+
+def parse_relations(value):
+    """
+    Args:
+        value: a relation field like
+            'libc6 (>= 2.14), debconf (>= 0.5) | debconf-2.0, python3:any'
+
+    Returns:
+        one list of alternative names per relation, like
+            [['libc6'], ['debconf', 'debconf-2.0'], ['python3']]
+    """
+    relations = []
+    for relation in value.split(","):
+        alternatives = []
+        for alternative in relation.split("|"):
+            alternative = _RELATION_EXTRAS.sub("", alternative).strip()
+            if alternative != "":
+                # name:any and name:arch are the package name
+                alternatives.append(alternative.split(":")[0])
+        if alternatives:
+            relations.append(alternatives)
+    return relations
+
+
+def parse_os_release(content):
+    """
+    Args:
+        content: an os-release file like
+            'NAME="Ubuntu"
+            VERSION_ID="22.04"
+            ID=ubuntu
+            ID_LIKE=debian'
+
+    Returns:
+        dict of its variables, unquoted
+    """
+    variables = {}
+    for line in content.splitlines():
+        line = line.strip()
+        if line == "" or line.startswith("#") or "=" not in line:
+            continue
+        key, _, value = line.partition("=")
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+            value = value[1:-1]
+        variables[key.strip()] = value
+    return variables
+
+
+def is_installed(fields):
+    """
+    `apt list --installed` only lists packages whose status is 'installed'
+    """
+    status = fields.get("Status", "").split()
+    return len(status) == 3 and status[2] == "installed"
+
+
+class DpkgDatabase(object):
+    """
+    Installed packages read from /var/lib/dpkg/status of a RootFS.
+    """
+
+    def __init__(self, rootfs) -> None:
+        self.rootfs = rootfs
+        self.pkgs = {}  # name -> fields of the installed package
+        self._providers = None
+        self.distro = None  # ID of os-release, like 'ubuntu'
+        for path in OS_RELEASE_PATHS:
+            content = rootfs.read_text(path)
+            if content is not None:
+                self.distro = parse_os_release(content).get("ID")
+                break
+        content = rootfs.read_text(DPKG_STATUS_PATH)
+        if content is None:
+            return
+        for fields in parse_control(content):
+            if "Package" in fields and is_installed(fields):
+                # the first one wins for multi-arch packages, like `apt list`
+                self.pkgs.setdefault(fields["Package"], fields)
+
+    @staticmethod
+    def load(rootfs):
+        """
+        The status file is parsed once per RootFS
+        """
+        return rootfs.memo("dpkg", lambda: DpkgDatabase(rootfs))
+
+    def names(self):
+        return list(self.pkgs.keys())
+
+    def installed_size(self, name):
+        value = self.pkgs[name].get("Installed-Size")
+        if value is None or value == "":
+            return None
+        return round(float(value), 2)
+
+    def summary(self, name):
+        return self.pkgs[name].get("Description", "").split("\n")[0]
+
+    def list_files(self, name):
+        """
+        Same paths as `dpkg -L`
+        """
+        fields = self.pkgs[name]
+        candidates = [name]
+        arch = fields.get("Architecture")
+        if arch is not None:
+            # Multi-Arch: same packages are named after their arch
+            candidates.insert(0, name + ":" + arch)
+        for candidate in candidates:
+            content = self.rootfs.read_text(
+                posixpath.join(DPKG_INFO_DIR, candidate + ".list")
+            )
+            if content is not None:
+                return [line for line in content.splitlines() if line.strip() != ""]
+        return []
+
+    def version(self, name):
+        return self.pkgs[name].get("Version")
+
+    def arch(self, name):
+        return self.pkgs[name].get("Architecture")
+
+    def providers(self):
+        """
+        Returns:
+            dict virtual package name -> installed packages providing it
+        """
+        if self._providers is None:
+            providers = {}
+            for name, fields in self.pkgs.items():
+                for relation in parse_relations(fields.get("Provides", "")):
+                    providers.setdefault(relation[0], []).append(name)
+            self._providers = providers
+        return self._providers
+
+    def depends(self, name):
+        """
+        Installed packages name depends on through DEPENDS_FIELDS. Each
+        relation is satisfied by its first installed alternative, a real
+        package before the providers of a virtual one, relations nothing
+        installed satisfies are left out like `apt depends --installed`.
+        """
+        providers = self.providers()
+        deps = []
+        for field in DEPENDS_FIELDS:
+            for relation in parse_relations(self.pkgs[name].get(field, "")):
+                dep = None
+                for alternative in relation:
+                    if alternative in self.pkgs:
+                        dep = alternative
+                        break
+                if dep is None:
+                    for alternative in relation:
+                        if alternative in providers:
+                            dep = providers[alternative][0]
+                            break
+                if dep is not None and dep != name and dep not in deps:
+                    deps.append(dep)
+        return deps
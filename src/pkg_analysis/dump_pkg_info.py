@@ -1,7 +1,118 @@
+import csv
+import os
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+# columns repeated on every row of a package, stored dictionary encoded
+PKG_CATEGORY_COLUMNS = ['package', 'version', 'package_type', 'container']
+
+PKG_FILES_COLUMNS = [
+    'path', 'size(KB)', 'package', 'version', 'package_type', 'container'
+]
+
+PKG_FILES_SCHEMA = pa.schema([
+    ('path', pa.string()),
+    ('size(KB)', pa.float64()),
+    ('package', pa.string()),
+    ('version', pa.string()),
+    ('package_type', pa.string()),
+    ('container', pa.string()),
+])
+
+# file formats of the tables, chosen by the extension of the file name.
+# parquet and feather keep the categorical dtypes and need pyarrow.
+TABLE_FORMATS = ['csv', 'parquet', 'feather']
+
+
+def table_format(file_name):
+    ext = os.path.splitext(file_name)[1].lstrip('.').lower()
+    return ext if ext in TABLE_FORMATS else 'csv'
+
+
+def write_table(df, file_name):
+    fmt = table_format(file_name)
+    if fmt == 'parquet':
+        df.to_parquet(file_name, index=False)
+    elif fmt == 'feather':
+        df.reset_index(drop=True).to_feather(file_name)
+    else:
+        df.to_csv(file_name, index=False)
+
+
+def stream_file_name(file_name):
+    """
+    The arrow ipc stream PkgFilesWriter writes the rows of file_name to
+    """
+    return file_name + '.arrows'
+
+
+def read_stream(stream_name, category_columns=PKG_CATEGORY_COLUMNS):
+    """
+    Reads the rows of an arrow ipc stream left by a PkgFilesWriter, up to
+    the last complete batch if the writer was killed.
+    """
+    batches = []
+    with pa.OSFile(stream_name) as source:
+        reader = pa.ipc.open_stream(source)
+        try:
+            for batch in reader:
+                batches.append(batch)
+        except (pa.ArrowInvalid, OSError):
+            pass
+    df = pa.Table.from_batches(batches, reader.schema).to_pandas()
+    return to_categorical(df, category_columns)
+
+
+def read_table(file_name, category_columns=PKG_CATEGORY_COLUMNS):
+    """
+    Reads a table written by write_table, category_columns are loaded as
+    categorical dtypes whatever the format is.
+    """
+    fmt = table_format(file_name)
+    if fmt == 'parquet':
+        columns = pq.read_schema(file_name).names
+        df = pd.read_parquet(
+            file_name,
+            read_dictionary=[c for c in category_columns if c in columns]
+        )
+    elif fmt == 'feather':
+        table = feather.read_table(file_name)
+        # the streamed files hold plain strings, encode them before they
+        # are converted to python objects
+        for c in category_columns:
+            if c in table.column_names:
+                i = table.column_names.index(c)
+                table = table.set_column(
+                    i, c, table.column(c).dictionary_encode()
+                )
+        df = table.to_pandas()
+    else:
+        header = pd.read_csv(file_name, nrows=0).columns
+        dtype = {c: 'category' for c in category_columns if c in header}
+        return pd.read_csv(file_name, dtype=dtype)
+    return to_categorical(df, category_columns)
+
+
+def to_categorical(df, category_columns=PKG_CATEGORY_COLUMNS):
+    columns = [
+        c for c in category_columns
+        if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype)
+    ]
+    if len(columns) == 0:
+        return df
+    return df.astype({c: 'category' for c in columns})
 
 
 class PkgInfoDumper(object):
+    """
+    The format of the dumped tables follows the extension of file_name,
+    see TABLE_FORMATS.
+    """
+
     @staticmethod
     def dump_pkg_info(pkgs, container, file_name):
         names = []
@@ -23,31 +134,147 @@ class PkgInfoDumper(object):
             'desc': descs
         }
         df = pd.DataFrame(data=data)
-        df.to_csv(file_name, index=False)
+        write_table(to_categorical(df), file_name)
 
     @staticmethod
-    def dump_pkg_files_info(pkgs, container, file_name, mode='w'):
+    def pkg_files_table(pkgs, container):
+        """
+        One row per file of pkgs. The package columns are built from one
+        value per package and repeated as categorical codes, the strings
+        are never copied to each row.
+        """
         paths = []
         sizes = []
-        pkg_names = []
-        versions = []
-        pkg_types = []
-        containers = []
+        counts = []
         for p in pkgs:
             for f in p.files:
                 paths.append(f.name)
                 sizes.append(f.size)
-                pkg_names.append(p.name)
-                versions.append(p.version)
-                pkg_types.append(p.type)
-                containers.append(container)
+            counts.append(len(p.files))
+        rows = np.repeat(np.arange(len(pkgs)), counts)
+
+        def per_pkg(values):
+            return pd.Categorical(values)[rows]
+
         data = {
             'path': paths,
-            'size(KB)': sizes,
-            'package': pkg_names,
-            'version': versions,
-            'package_type': pkg_types,
-            'container': containers
+            'size(KB)': np.array(sizes, dtype=np.float64),
+            'package': per_pkg([p.name for p in pkgs]),
+            'version': per_pkg([p.version for p in pkgs]),
+            'package_type': per_pkg([p.type for p in pkgs]),
+            'container': pd.Categorical.from_codes(
+                np.zeros(len(paths), dtype=np.int8), [container]
+            )
         }
-        df = pd.DataFrame(data=data)
-        df.to_csv(file_name, index=False)
+        return pd.DataFrame(data=data)
+
+    @staticmethod
+    def dump_pkg_files_info(pkgs, container, file_name, mode='w'):
+        df = PkgInfoDumper.pkg_files_table(pkgs, container)
+        write_table(df, file_name)
+
+
+class PkgFilesWriter(object):
+    """
+    Incremental writer of the packages_files table, the files of a package
+    are written as soon as a PkgFileFiller yields them, so they never have
+    to be kept for the whole image.
+
+    csv rows are flushed after every package. parquet and feather files are
+    only readable once their footer is written, so their rows go first to
+    an arrow ipc stream, `<file_name>.arrows`, one record batch flushed per
+    package. close() converts the stream to file_name by batches of
+    rows_per_batch rows and removes it, including when the analysis fails.
+
+    After a hard crash (OOM kill, SIGKILL) file_name is missing or left from
+    a previous run. The stream holds every package written before the crash,
+    it is read with read_stream().
+
+    Usage:
+        with PkgFilesWriter('img_packages_files.csv', 'img') as writer:
+            for p, files in file_filler.iter_files(pkgs):
+                writer.write(p, files)
+    """
+
+    def __init__(self, file_name, container, rows_per_batch=65536) -> None:
+        self.file_name = file_name
+        self.container = container
+        self.rows_per_batch = rows_per_batch
+        self.format = table_format(file_name)
+        self.rows = 0
+        self._file = None
+        self._csv = None
+        self._stream = None
+        self.closed = False
+        if self.format == 'csv':
+            self._file = open(file_name, 'w', newline='')
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(PKG_FILES_COLUMNS)
+            self._file.flush()
+        else:
+            self.stream_name = stream_file_name(file_name)
+            self._file = open(self.stream_name, 'wb')
+            self._stream = pa.ipc.new_stream(self._file, PKG_FILES_SCHEMA)
+            self._file.flush()
+
+    def write(self, pkg, files):
+        rows = [
+            (f.name, f.size, pkg.name, pkg.version, pkg.type, self.container)
+            for f in files
+        ]
+        self.rows += len(rows)
+        if self._csv is not None:
+            self._csv.writerows(rows)
+        elif rows:
+            columns = list(zip(*rows))
+            self._stream.write_batch(pa.record_batch(
+                [pa.array(c, type=f.type)
+                 for c, f in zip(columns, PKG_FILES_SCHEMA)],
+                schema=PKG_FILES_SCHEMA
+            ))
+        self._file.flush()
+
+    def flush(self):
+        self._file.flush()
+
+    def _convert(self):
+        # the batches of the stream are regrouped, one package per row group
+        # would make a slow parquet file
+        tmp_name = self.file_name + '.tmp'
+        if self.format == 'parquet':
+            writer = pq.ParquetWriter(tmp_name, PKG_FILES_SCHEMA)
+        else:
+            # feather v2 is the arrow ipc file format
+            writer = pa.ipc.new_file(tmp_name, PKG_FILES_SCHEMA)
+        with writer, pa.OSFile(self.stream_name) as source:
+            batches = []
+            rows = 0
+            for batch in pa.ipc.open_stream(source):
+                batches.append(batch)
+                rows += batch.num_rows
+                if rows >= self.rows_per_batch:
+                    writer.write_table(pa.Table.from_batches(
+                        batches, PKG_FILES_SCHEMA).combine_chunks())
+                    batches = []
+                    rows = 0
+            if batches:
+                writer.write_table(pa.Table.from_batches(
+                    batches, PKG_FILES_SCHEMA).combine_chunks())
+        os.replace(tmp_name, self.file_name)
+        os.remove(self.stream_name)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self._stream is not None:
+            self._stream.close()
+        self._file.close()
+        if self._stream is not None:
+            self._convert()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
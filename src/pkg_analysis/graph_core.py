@@ -0,0 +1,337 @@
+from array import array
+from collections import deque
+
+import numpy as np
+
+
+class GraphCore(object):
+    """
+    Directed graph over integer ids. Nodes are numbered in insertion order,
+    edges are appended to two flat arrays and turned into CSR adjacency
+    (offsets + targets) in both directions when they are first queried
+    after a change. Traversals only touch these arrays.
+    """
+
+    def __init__(self) -> None:
+        self.nodes = []  # id -> node object
+        self._src = array("I")
+        self._dst = array("I")
+        self._edge_keys = set()
+        self._csr = None
+        self._reverse_csr = None
+        # bumped on every change, lets callers cache traversal results
+        self.version = 0
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def add_node(self, node):
+        self.nodes.append(node)
+        self.version += 1
+        self._csr = self._reverse_csr = None
+        return len(self.nodes) - 1
+
+    def add_edge(self, src, dst):
+        """
+        Returns False if the edge already exists
+        """
+        key = (src << 32) | dst
+        if key in self._edge_keys:
+            return False
+        self._edge_keys.add(key)
+        self._src.append(src)
+        self._dst.append(dst)
+        self.version += 1
+        self._csr = self._reverse_csr = None
+        return True
+
+    def num_edges(self):
+        return len(self._src)
+
+    def _build_csr(self, src, dst):
+        # counting sort by source, stable so insertion order is kept
+        n = len(self.nodes)
+        offsets = array("I", [0]) * (n + 1)
+        for s in src:
+            offsets[s + 1] += 1
+        for i in range(n):
+            offsets[i + 1] += offsets[i]
+        fill = array("I", offsets)
+        targets = array("I", [0]) * len(src)
+        for s, d in zip(src, dst):
+            targets[fill[s]] = d
+            fill[s] += 1
+        return offsets, targets
+
+    def csr(self):
+        if self._csr is None:
+            self._csr = self._build_csr(self._src, self._dst)
+        return self._csr
+
+    def reverse_csr(self):
+        if self._reverse_csr is None:
+            self._reverse_csr = self._build_csr(self._dst, self._src)
+        return self._reverse_csr
+
+    def successors(self, i):
+        offsets, targets = self.csr()
+        return targets[offsets[i] : offsets[i + 1]]
+
+    def predecessors(self, i):
+        offsets, targets = self.reverse_csr()
+        return targets[offsets[i] : offsets[i + 1]]
+
+    def bfs(self, start, reverse=False):
+        """
+        Returns:
+            (order, depth, parent): the ids reached from start in BFS
+            order, and for every id its BFS depth and BFS parent, -1 if it
+            isn't reached.
+        """
+        offsets, targets = self.reverse_csr() if reverse else self.csr()
+        n = len(self.nodes)
+        depth = array("i", [-1]) * n
+        parent = array("i", [-1]) * n
+        depth[start] = 0
+        order = array("I", [start])
+        to_be_visited = deque([start])
+        while to_be_visited:
+            i = to_be_visited.popleft()
+            d = depth[i] + 1
+            for j in targets[offsets[i] : offsets[i + 1]]:
+                if depth[j] < 0:
+                    depth[j] = d
+                    parent[j] = i
+                    order.append(j)
+                    to_be_visited.append(j)
+        return order, depth, parent
+
+    def reachable(self, start, reverse=False):
+        """
+        Returns:
+            bytearray, 1 for the ids reached from start
+        """
+        mask = bytearray(len(self.nodes))
+        for i in self.bfs(start, reverse)[0]:
+            mask[i] = 1
+        return mask
+
+    def topological_order(self):
+        """
+        Topological order of the strongly connected components, the
+        condensation of the graph is a DAG.
+
+        Returns:
+            array of all the ids, every node before its dependencies, except
+            between the nodes of one cycle (one component), which come
+            together in id order.
+        """
+        comp, num = self.strongly_connected_components()
+        members = [[] for _ in range(num)]
+        for i in range(len(self.nodes)):
+            members[comp[i]].append(i)
+        order = array("I")
+        # components are numbered in reverse topological order
+        for c in range(num - 1, -1, -1):
+            order.extend(members[c])
+        return order
+
+    def strongly_connected_components(self):
+        """
+        Tarjan's algorithm, without recursion.
+
+        Returns:
+            (comp, num): the component id of every node and the number of
+            components. Components are numbered in reverse topological
+            order, the successors of a component have smaller ids.
+        """
+        offsets, targets = self.csr()
+        n = len(self.nodes)
+        index = array("i", [-1]) * n
+        low = array("I", [0]) * n
+        on_stack = bytearray(n)
+        comp = array("i", [-1]) * n
+        stack = []
+        counter = 0
+        num = 0
+        for s in range(n):
+            if index[s] >= 0:
+                continue
+            index[s] = low[s] = counter
+            counter += 1
+            stack.append(s)
+            on_stack[s] = 1
+            work = [(s, offsets[s])]
+            while work:
+                v, k = work[-1]
+                if k < offsets[v + 1]:
+                    work[-1] = (v, k + 1)
+                    w = targets[k]
+                    if index[w] < 0:
+                        index[w] = low[w] = counter
+                        counter += 1
+                        stack.append(w)
+                        on_stack[w] = 1
+                        work.append((w, offsets[w]))
+                    elif on_stack[w] and index[w] < low[v]:
+                        low[v] = index[w]
+                    continue
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    if low[v] < low[u]:
+                        low[u] = low[v]
+                if low[v] == index[v]:
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = 0
+                        comp[w] = num
+                        if w == v:
+                            break
+                    num += 1
+        return comp, num
+
+    def _postorder(self, start):
+        offsets, targets = self.csr()
+        visited = bytearray(len(self.nodes))
+        visited[start] = 1
+        postorder = array("I")
+        work = [(start, offsets[start])]
+        while work:
+            v, k = work[-1]
+            if k < offsets[v + 1]:
+                work[-1] = (v, k + 1)
+                w = targets[k]
+                if not visited[w]:
+                    visited[w] = 1
+                    work.append((w, offsets[w]))
+            else:
+                work.pop()
+                postorder.append(v)
+        return postorder
+
+    def dominators(self, start):
+        """
+        Immediate dominators of the nodes reached from start, with the
+        iterative algorithm of Cooper, Harvey and Kennedy. A node is
+        dominated by d if every path from start to it goes through d.
+
+        Returns:
+            (idom, postorder): the immediate dominator of every node, -1 if
+            it isn't reached, start for start itself; and the reached ids in
+            DFS postorder, where every node comes before its dominators.
+        """
+        postorder = self._postorder(start)
+        n = len(self.nodes)
+        rank = array("i", [-1]) * n
+        for r, v in enumerate(postorder):
+            rank[v] = r
+        offsets, sources = self.reverse_csr()
+        idom = array("i", [-1]) * n
+        idom[start] = start
+        changed = True
+        while changed:
+            changed = False
+            for v in reversed(postorder):
+                if v == start:
+                    continue
+                new_idom = -1
+                for p in sources[offsets[v] : offsets[v + 1]]:
+                    if idom[p] < 0:
+                        continue
+                    if new_idom < 0:
+                        new_idom = p
+                        continue
+                    a, b = p, new_idom
+                    while a != b:
+                        while rank[a] < rank[b]:
+                            a = idom[a]
+                        while rank[b] < rank[a]:
+                            b = idom[b]
+                    new_idom = a
+                if idom[v] != new_idom:
+                    idom[v] = new_idom
+                    changed = True
+        return idom, postorder
+
+    def dominated_sums(self, start, values):
+        """
+        Args:
+            values: np.ndarray of shape (len(self), k)
+
+        Returns:
+            np.ndarray of the same shape, for every node reached from start
+            the sum of values over the nodes it dominates, itself included:
+            what is only reachable through it. 0 for the other nodes.
+        """
+        idom, postorder = self.dominators(start)
+        sums = np.zeros_like(values)
+        for v in postorder:
+            sums[v] += values[v]
+            if v != start:
+                sums[idom[v]] += sums[v]
+        return sums
+
+    def closure_sums(self, values):
+        """
+        Args:
+            values: np.ndarray of shape (len(self), k)
+
+        Returns:
+            np.ndarray of the same shape, for every node the sum of values
+            over the nodes it reaches, itself included. Reachable sets are
+            bitsets over the strongly connected components, built in one
+            pass from the sinks up, so cycles and shared dependencies are
+            only counted once.
+
+        This is quadratic: O(E * V / 64) word operations to merge the
+        bitsets, O(V * V) to sum them and up to V * V / 8 bytes of bitsets.
+        Summing the sums of the successors would be linear but counts a
+        shared dependency once per path to it, and counting it once needs
+        the reachable sets. Dependency graphs have a few thousand packages,
+        where this takes a few MB and well under a second; dominated_sums
+        is the linear, exclusive counterpart.
+        """
+        comp, num = self.strongly_connected_components()
+        offsets, targets = self.csr()
+        n = len(self.nodes)
+        reach = [0] * num
+        for v in range(n):
+            reach[comp[v]] |= 1 << v
+        members = [[] for _ in range(num)]
+        for v in range(n):
+            members[comp[v]].append(v)
+        sums = np.zeros_like(values)
+        nbytes = (n + 7) // 8
+        for c in range(num):
+            mask = reach[c]
+            for v in members[c]:
+                for w in targets[offsets[v] : offsets[v + 1]]:
+                    if comp[w] != c:
+                        mask |= reach[comp[w]]
+            reach[c] = mask
+            bits = np.unpackbits(
+                np.frombuffer(mask.to_bytes(nbytes, "little"), dtype=np.uint8),
+                count=n,
+                bitorder="little",
+            ).astype(bool)
+            sums[members[c]] = values[bits].sum(axis=0)
+        return sums
+
+
+class CoreNode(object):
+    """
+    Graph node whose edges live in a GraphCore, deps is a view over it.
+    The node is registered in the core by DepsGraph._add_edge.
+    """
+
+    def _init_core_node(self):
+        self.core = None
+        self.id = None
+
+    @property
+    def deps(self):
+        if self.core is None:
+            return ()
+        nodes = self.core.nodes
+        return [nodes[i] for i in self.core.successors(self.id)]
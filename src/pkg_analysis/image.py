@@ -1,10 +1,11 @@
-import json
-import os
-
 import docker
 import matplotlib.pyplot as plt
+import pandas as pd
 
+from pkg_analysis.dump_pkg_info import to_categorical
+from pkg_analysis.ownership import PKG_KEYS, OwnershipIndex
 from pkg_analysis.package import PkgFile
+from pkg_analysis.summary_store import ImageSummaryStore
 from vul_analysis.vul_analysis import ContainerCreator
 
 CRITICAL = "Critical"
@@ -12,12 +13,37 @@ HIGH = "High"
 MEDIUM = "Medium"
 LOW = "Low"
 NEGLIBILE = "Negligible"
+SEVERITIES = [CRITICAL, HIGH, MEDIUM, LOW, NEGLIBILE]
+
+
+class PkgBreakdown(object):
+    """
+    Files of one package split by the debloating.
+    """
+
+    __slots__ = ("used_files", "removed_files", "bloat_degree")
+
+    def __init__(self, used_files, removed_files, bloat_degree) -> None:
+        self.used_files = used_files  # set of PkgFile
+        self.removed_files = removed_files  # set of PkgFile
+        self.bloat_degree = bloat_degree
+
+    def __repr__(self) -> str:
+        return (
+            f"PkgBreakdown(used={len(self.used_files)}, "
+            f"removed={len(self.removed_files)}, bloat_degree={self.bloat_degree})"
+        )
 
 
 class Image(object):
-    def __init__(self, image, cache_path="./img_summary.json") -> None:
+    def __init__(self, image, cache_path="./img_summary.db") -> None:
+        """
+        cache_path: sqlite file of the ImageSummaryStore
+        """
         self.image = image
         self.cache_path = cache_path
+        self.store = ImageSummaryStore(cache_path)
+        self.api_client = None
 
     def _plot(self):
         labels = ["apt_size(KB)", "pip_size(KB)", "conda_size(KB)", "others_size(KB)"]
@@ -53,18 +79,42 @@ class Image(object):
         axs[1].set_title("debloated")
         plt.show()
 
-    def _cache_img_summary(self):
-        if not os.path.exists(self.cache_path):
-            with open(self.cache_path, "w") as f:
-                f.write("{}")
-
-        with open(self.cache_path, "r") as f:
-            data = json.load(f)
-            data[self.image] = self.size
-            data[self.debloated_img_name] = self.debloated_img_size
-
-        with open(self.cache_path, "w") as f:
-            json.dump(data, f)
+    def _img_record(self, name, use_cache):
+        """
+        Size and layers of image name. If use_cache, name is resolved
+        through the aliases of the store and docker isn't called when its
+        record has a size. Otherwise, or on a miss, the image is inspected,
+        so a moved tag gives the new image, and its record is refreshed.
+        """
+        if use_cache:
+            record = self.store.get(name)
+            if record is not None and record["size_kb"] is not None:
+                return record
+
+        if self.api_client is None:
+            self.api_client = docker.APIClient(base_url="unix://var/run/docker.sock")
+        info = self.api_client.inspect_image(name)
+        refs = [name] + (info.get("RepoTags") or []) + (info.get("RepoDigests") or [])
+        self.store.put(
+            info["Id"],
+            size_kb=round(info["Size"] * 1.0 / 1024, 2),
+            layers=info.get("RootFS", {}).get("Layers"),
+            refs=refs,
+        )
+        return self.store.get(info["Id"])
+
+    def _cache_img_summary(self, original_image_desc, debloated_desc):
+        def to_json(desc):
+            return {k: float(v) for k, v in desc.items()}
+
+        self.store.put_summary(
+            self.digest,
+            f"debloated:{self.debloated_digest}",
+            {
+                "original": to_json(original_image_desc),
+                "debloated": to_json(debloated_desc),
+            },
+        )
 
     # todo: another subclass of image, targeted for debloated imgs
     def analyze(
@@ -75,40 +125,43 @@ class Image(object):
         pkg_df,
         plot=True,
         use_cache=False,
+        ownership=None,
     ):
+        """
+        use_cache: sizes of the images are read from the summary store when
+        it knows their names, without asking docker. Moved tags keep their
+        old sizes, so the images are inspected by default.
+        ownership: OwnershipIndex of package_files_df, built here if None
+        """
         self.debloated_img_name = debloated_img_name
-        if not use_cache:
-            self.api_client = docker.APIClient(base_url="unix://var/run/docker.sock")
-            info = self.api_client.inspect_image(self.image)
-            self.size = round(info["Size"] * 1.0 / 1024, 2)  # (kb)
-
-            info = self.api_client.inspect_image(debloated_img_name)
-            self.debloated_img_size = round(info["Size"] * 1.0 / 1024, 2)  # (kb)
-        else:
-            print("use cache img summary.")
-            with open(self.cache_path, "r") as f:
-                data = json.load(f)
-                self.size = data[self.image]
-                self.debloated_img_size = data[self.debloated_img_name]
-        self._cache_img_summary()
+        record = self._img_record(self.image, use_cache)
+        self.digest = record["digest"]
+        self.size = record["size_kb"]  # (kb)
+
+        record = self._img_record(debloated_img_name, use_cache)
+        self.debloated_digest = record["digest"]
+        self.debloated_img_size = record["size_kb"]  # (kb)
 
         original_image_desc = {"image_size(KB)": self.size}
 
-        self.pkg_df = pkg_df
+        self.pkg_df = to_categorical(pkg_df)
 
-        # these file paths are dispaly file paths, it can be like this:
+        # the display file paths, like
         # '/usr/local/lib/python3.8/dist-packages/../../../bin/tqdm'
-        self.package_files_df = package_files_df.sort_values(
-            by=["size(KB)"], ascending=False
-        )
-        # convert to normpath
-        self.package_files_df["path"] = self.package_files_df["path"].apply(
-            os.path.normpath
-        )
-
-        pkg_by_type = self.package_files_df.groupby("package_type").sum()
+        # are normalized by the ownership index.
+        # package columns are categorical, so the groupbys below only
+        # keep the observed combinations.
+        if ownership is None:
+            ownership = OwnershipIndex.build(package_files_df)
+        self.ownership = ownership
+        self.package_files_df = ownership.table
+        pkg_by_type = self.package_files_df.groupby("package_type", observed=True)[
+            ["size(KB)"]
+        ].sum()
         self.pacakge_sizes_df = (
-            self.package_files_df.groupby(["package", "package_type", "version"])
+            self.package_files_df.groupby(
+                ["package", "package_type", "version"], observed=True
+            )[["size(KB)"]]
             .sum()
             .sort_values("size(KB)", ascending=False)
         )
@@ -145,16 +198,29 @@ class Image(object):
         }
         debloated_desc["debloated_img_size(KB)"] = self.debloated_img_size
 
+        # one lookup of all the removed files, sizes are the package ones
         self.debloated_pkg_files_df = (
-            self.deboated_files_df.set_index("name")
-            .join(self.package_files_df.set_index("path"), lsuffix="debloated")
-            .dropna()[["size(KB)", "package", "version", "package_type"]]
+            ownership.owners(
+                self.deboated_files_df["name"],
+                ["size(KB)", "package", "version", "package_type"],
+            )
+            .dropna()
             .sort_values(by=["size(KB)"], ascending=False)
         )
+        # whether each row of package_files_df is removed, computed once for
+        # pkg_breakdowns. A removed path is removed for all its owners.
+        self._removed_mask = (
+            self.package_files_df["path"].isin(self.debloated_pkg_files_df.index).values
+        )
+        # rows of package_files_df of every package, so pkg_breakdowns and
+        # get_used_files only touch the files of the packages asked for
+        self._pkg_groups = self.package_files_df.groupby(
+            PKG_KEYS, observed=True, sort=False
+        ).indices
 
         debloated_pkg_by_type = self.debloated_pkg_files_df.groupby(
-            "package_type"
-        ).sum()
+            "package_type", observed=True
+        )[["size(KB)"]].sum()
         debloated_desc["debloated_apt_size(KB)"] = 0
         if "apt" in debloated_pkg_by_type.index:
             debloated_desc["debloated_apt_size(KB)"] = debloated_pkg_by_type.loc["apt"][
@@ -185,18 +251,22 @@ class Image(object):
             - debloated_desc["total_debloated_pkg_size(KB)"]
         )
 
-        self.debloated_other_files_df = debloated_files_df.set_index("name").drop(
-            self.debloated_pkg_files_df.index
-        )
+        self.debloated_other_files_df = debloated_files_df[
+            ~debloated_files_df["name"].isin(self.debloated_pkg_files_df.index)
+        ].set_index("name")
 
         self.pkg_sizes = (
-            self.package_files_df.groupby(["package", "package_type", "version"])
+            self.package_files_df.groupby(
+                ["package", "package_type", "version"], observed=True
+            )[["size(KB)"]]
             .sum()
             .sort_values(by=["size(KB)"], ascending=False)
         )
 
         self.debloated_pkg_sizes = (
-            self.debloated_pkg_files_df.groupby(["package", "package_type", "version"])
+            self.debloated_pkg_files_df.groupby(
+                ["package", "package_type", "version"], observed=True
+            )[["size(KB)"]]
             .sum()
             .sort_values(by=["size(KB)"], ascending=False)
         )
@@ -214,69 +284,113 @@ class Image(object):
 
         self.original_image_desc = original_image_desc
         self.debloated_desc = debloated_desc
+        self._cache_img_summary(original_image_desc, debloated_desc)
 
         if plot:
             self._plot()
         return original_image_desc, debloated_desc
 
     def set_pkg_category(self, ml_pkgs_df, gpu_pkgs_df):
-        ml_pkgs = ml_pkgs_df[["name", "type", "version"]]
-        gpu_pkgs = gpu_pkgs_df[["name", "type", "version"]]
-        self.pkg_bloat_degrees["category"] = "Generic"
-        for p in list(ml_pkgs.itertuples(index=False, name=None)):
-            if p in self.pkg_bloat_degrees.index:
-                self.pkg_bloat_degrees.loc[p, "category"] = "ML"
-        for p in list(gpu_pkgs.itertuples(index=False, name=None)):
-            if p in self.pkg_bloat_degrees.index:
-                self.pkg_bloat_degrees.loc[p, "category"] = "GPU"
+        # one lookup of all the packages, GPU wins over ML
+        categories = pd.concat(
+            [
+                ml_pkgs_df[["name", "type", "version"]].assign(category="ML"),
+                gpu_pkgs_df[["name", "type", "version"]].assign(category="GPU"),
+            ]
+        ).astype({"name": str, "type": str, "version": str})
+        categories = categories.drop_duplicates(
+            ["name", "type", "version"], keep="last"
+        ).set_index(["name", "type", "version"])["category"]
+        keys = pd.MultiIndex.from_arrays(
+            [
+                self.pkg_bloat_degrees.index.get_level_values(level).astype(str)
+                for level in PKG_KEYS
+            ]
+        )
+        self.pkg_bloat_degrees["category"] = (
+            categories.reindex(keys).fillna("Generic").values
+        )
 
     def vul_analysis(self, cmd, working_dir="/home/ubuntu/projects/20220510/vuls"):
         cc = ContainerCreator(working_dir)
         original_report, cve_by_pkg = cc.analyze_original_container(self.image, cmd)
         self.original_cve_report = original_report
-        cve_by_pkg_agg = {}
-        for i in range(len(cve_by_pkg["pkg_name"])):
-            pkg_name = cve_by_pkg["pkg_name"][i]
-            # pkg_type = cve_by_pkg['pkg_type'][i]
-            severity = cve_by_pkg["severity"][i]
-            key = (pkg_name, cve_by_pkg["pkg_version"][i])
-            if key not in cve_by_pkg_agg:
-                cve_by_pkg_agg[key] = {
-                    CRITICAL: 0,
-                    HIGH: 0,
-                    MEDIUM: 0,
-                    LOW: 0,
-                    NEGLIBILE: 0,
-                }
-            cve_by_pkg_agg[key][severity] = cve_by_pkg_agg[key][severity] + 1
-        for n in cve_by_pkg_agg.keys():
-            for i in self.pkg_bloat_degrees.index:
-                if n[0] == i[0] and n[1] == i[2]:
-                    severities = cve_by_pkg_agg[n]
-                    for s, c in severities.items():
-                        self.pkg_bloat_degrees.loc[i, s] = c
 
-    def get_used_files(self, pkg_name, pkg_type, pkg_version):
-        # these file paths are dispaly file paths, it can be like this:
-        # '/usr/local/lib/python3.8/dist-packages/../../../bin/tqdm'
-        all_pkg_files = set(
-            self.package_files_df.groupby(
-                ["package", "package_type", "version"]
-            ).get_group((pkg_name, pkg_type, pkg_version))["path"]
+        # number of cves of each severity by (package, version), joined to
+        # every package type with the same name and version
+        cves = pd.DataFrame(
+            {
+                "package": pd.Series(cve_by_pkg["pkg_name"], dtype=str),
+                "version": pd.Series(cve_by_pkg["pkg_version"], dtype=str),
+                "severity": cve_by_pkg["severity"],
+            }
         )
-
-        # These file paths are real paths, like this: /usr/local/bin/tqdm
-        debloated_pkg_files = set(
-            self.debloated_pkg_files_df.groupby(["package", "package_type", "version"])
-            .get_group((pkg_name, pkg_type, pkg_version))
-            .index
+        cves = cves[cves["severity"].isin(SEVERITIES)]
+        if len(cves) == 0:
+            return
+        counts = pd.crosstab(
+            [cves["package"], cves["version"]], cves["severity"]
+        ).reindex(columns=SEVERITIES, fill_value=0)
+        counts.columns = list(counts.columns)
+
+        pkgs = self.pkg_bloat_degrees.drop(
+            columns=[s for s in SEVERITIES if s in self.pkg_bloat_degrees.columns]
         )
+        keys = pd.DataFrame(
+            {
+                level: pkgs.index.get_level_values(level).astype(str)
+                for level in ["package", "version"]
+            }
+        )
+        joined = keys.merge(
+            counts, left_on=["package", "version"], right_index=True, how="left"
+        )
+        for severity in SEVERITIES:
+            pkgs[severity] = joined[severity].values
+        self.pkg_bloat_degrees = pkgs
+
+    def pkg_breakdowns(self, pkgs=None):
+        """
+        Args:
+            pkgs: list of (package, package_type, version), all the packages
+                  if None
+
+        Returns:
+            dict (package, package_type, version) -> PkgBreakdown, the
+            packages without files are left out. Only the files of pkgs are
+            read. Must be called after analyze.
+        """
+        paths = self.package_files_df["path"].values
+        sizes = self.package_files_df["size(KB)"].values
+        if pkgs is None:
+            pkgs = self._pkg_groups.keys()
+
+        bloat_degrees = self.pkg_bloat_degrees["bloat_degree"]
+        breakdowns = {}
+        for key in pkgs:
+            key = tuple(key)
+            rows = self._pkg_groups.get(key)
+            if rows is None:
+                continue
+            used_files = set()
+            removed_files = set()
+            for path, size, removed in zip(
+                paths[rows], sizes[rows], self._removed_mask[rows]
+            ):
+                if removed:
+                    removed_files.add(PkgFile(path, size))
+                else:
+                    used_files.add(PkgFile(path, size))
+            breakdowns[key] = PkgBreakdown(
+                used_files, removed_files, bloat_degrees.get(key, 0.0)
+            )
+        return breakdowns
 
-        used_files_set = all_pkg_files - debloated_pkg_files
-        path_as_index = self.package_files_df.set_index("path")
-        used_pkg_files = []
-        for f in used_files_set:
-            size = path_as_index.loc[f]["size(KB)"]
-            used_pkg_files.append(PkgFile(f, size))
-
-        return set(used_pkg_files)
+    def get_used_files(self, pkg_name, pkg_type, pkg_version):
+        """
+        Returns:
+            set of PkgFile of the package kept by the debloating, the paths
+            are normalized. Only reads the files of the package.
+        """
+        key = (pkg_name, pkg_type, pkg_version)
+        return self.pkg_breakdowns([key])[key].used_files
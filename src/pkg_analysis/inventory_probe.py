@@ -0,0 +1,100 @@
+"""
+Inventory probe, runs inside a container of the analyzed image.
+
+It walks the root filesystem once and writes one JSON document per line
+to stdout:
+    ["e", path, kind, size, linkname]   an entry, kind is one of f/l/d/o
+    ["c", path, content]                content of a metadata file
+    ["end", number_of_entries]          the last line, a missing one means
+                                        the output is truncated
+Paths and contents are decoded with surrogateescape and json escapes every
+control char, so NUL, newlines or non utf-8 bytes in names are kept.
+
+Usage:
+    python3 inventory_probe.py '<json list of fnmatch patterns>' [skipped dirs...]
+
+Only the standard library is used and the code avoids f-strings, so that it
+runs on python 3.5 and later. python 2 isn't supported, its os.scandir
+doesn't exist and it has no os.fsencode.
+"""
+
+import fnmatch
+import json
+import os
+import stat
+import sys
+
+DEFAULT_SKIPPED_DIRS = ["/proc", "/sys", "/dev"]
+
+
+def decode(b):
+    return b.decode("utf-8", "surrogateescape")
+
+
+def kind_of(mode):
+    if stat.S_ISLNK(mode):
+        return "l"
+    if stat.S_ISREG(mode):
+        return "f"
+    if stat.S_ISDIR(mode):
+        return "d"
+    return "o"
+
+
+def is_metadata_path(path, patterns):
+    for pattern in patterns:
+        if fnmatch.fnmatchcase(path, pattern):
+            return True
+    return False
+
+
+def emit(out, record):
+    out.write(json.dumps(record, separators=(",", ":")))
+    out.write("\n")
+
+
+def probe(patterns, skipped_dirs, out):
+    skipped = set(os.fsencode(d) for d in skipped_dirs)
+    count = 0
+    todo = [b"/"]
+    while todo:
+        d = todo.pop()
+        try:
+            dir_entries = list(os.scandir(d))
+        except OSError:
+            continue
+        for e in dir_entries:
+            path = e.path
+            if path.startswith(b"//"):
+                path = path[1:]
+            if path in skipped:
+                continue
+            try:
+                st = e.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            kind = kind_of(st.st_mode)
+            linkname = None
+            if kind == "l":
+                try:
+                    linkname = decode(os.readlink(path))
+                except OSError:
+                    pass
+            name = decode(path)
+            emit(out, ["e", name, kind, st.st_size, linkname])
+            count += 1
+            if kind == "d":
+                todo.append(path)
+            elif kind == "f" and is_metadata_path(name, patterns):
+                try:
+                    with open(path, "rb") as f:
+                        emit(out, ["c", name, decode(f.read())])
+                except OSError:
+                    pass
+    emit(out, ["end", count])
+
+
+if __name__ == "__main__":
+    skipped_dirs = DEFAULT_SKIPPED_DIRS + sys.argv[2:]
+    probe(json.loads(sys.argv[1]), skipped_dirs, sys.stdout)
+    sys.stdout.flush()
@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+
+# bump it whenever the content of a cached layer changes, like the parsing
+# of layer tarballs or METADATA_PATTERNS, the old caches are then dropped.
+ANALYZER_VERSION = 3
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "mmlb", "layers")
+DEFAULT_MAX_BYTES = 5 * 1024**3
+
+
+def chain_ids(diff_ids):
+    """
+    Same chain IDs as docker and the OCI image spec:
+        ChainID(L0) = DiffID(L0)
+        ChainID(L0|...|Ln) = sha256(ChainID(L0|...|Ln-1) + " " + DiffID(Ln))
+    so a chain ID identifies a layer together with all the layers below it.
+    """
+    ids = []
+    for diff_id in diff_ids:
+        if not ids:
+            ids.append(diff_id)
+        else:
+            digest = hashlib.sha256(f"{ids[-1]} {diff_id}".encode()).hexdigest()
+            ids.append(f"sha256:{digest}")
+    return ids
+
+
+class LayerCache(object):
+    """
+    Persistent cache of parsed image layers, keyed by layer chain ID.
+
+    A cached layer holds the entries, whiteouts, hardlinks and metadata
+    contents (dpkg status and lists, site-packages metadata, conda-meta)
+    of one layer, so images sharing lower layers only read their new
+    layers from the tarball. Layers are stored as gzipped json files in
+    `<cache_dir>/v<ANALYZER_VERSION>-<patterns digest>/`, the least recently
+    used ones of all the patterns are evicted once the cache is larger
+    than max_bytes. The caches of older analyzer versions are dropped.
+    """
+
+    def __init__(
+        self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, patterns=()
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        patterns_digest = hashlib.sha256(
+            json.dumps(list(patterns)).encode()
+        ).hexdigest()[:12]
+        self.version = f"v{ANALYZER_VERSION}-{patterns_digest}"
+        self.path = os.path.join(cache_dir, self.version)
+        os.makedirs(self.path, exist_ok=True)
+        self._drop_old_versions()
+
+    def _cache_dirs(self):
+        """
+        Returns:
+            list of (analyzer version, path) of the layer caches in cache_dir
+        """
+        dirs = []
+        for name in os.listdir(self.cache_dir):
+            match = re.fullmatch(r"v(\d+)-[0-9a-f]{12}", name)
+            path = os.path.join(self.cache_dir, name)
+            if match and os.path.isdir(path):
+                dirs.append((int(match.group(1)), path))
+        return dirs
+
+    def _drop_old_versions(self):
+        # cache_dir may be shared with newer analyzers, and with analyzers
+        # keeping other patterns, their layers are left to the eviction
+        for version, path in self._cache_dirs():
+            if version < ANALYZER_VERSION:
+                logging.info(f"drop layer cache {path} of an old analyzer version")
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _file(self, chain_id):
+        return os.path.join(self.path, chain_id.replace(":", "_") + ".json.gz")
+
+    def get(self, chain_id):
+        path = self._file(chain_id)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                layer = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, json.decoder.JSONDecodeError):
+            logging.error(f"layer cache {path} is broken, drop it")
+            self._remove(path)
+            return None
+        # mtime tracks the last use for the eviction
+        os.utime(path)
+        return layer
+
+    def put(self, chain_id, layer):
+        path = self._file(chain_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(layer, f, separators=(",", ":"))
+        # atomic, concurrent analyses never read half written layers
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """
+        Evict the least recently used layers of every cache of this
+        analyzer version, whatever its patterns, until they fit in max_bytes
+        """
+        files = []
+        for version, cache_path in self._cache_dirs():
+            if version != ANALYZER_VERSION:
+                continue
+            try:
+                names = os.listdir(cache_path)
+            except FileNotFoundError:
+                continue
+            for name in names:
+                if not name.endswith(".json.gz"):
+                    continue
+                path = os.path.join(cache_path, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            logging.info(f"evict layer cache {path}")
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import logging
+import os
+import posixpath
+
+import pandas as pd
+
+from .dump_pkg_info import read_table, to_categorical, write_table
+
+PKG_KEYS = ["package", "package_type", "version"]
+
+# bytes of the head and of the tail of the packages_files table in the key
+# of its persisted index
+KEY_BYTES = 1 << 16
+
+# a path only needs os.path.normpath if it has one of these
+_NOT_NORMAL = r"//|/\.\.?(?:/|$)|./$"
+
+
+def normalize_paths(paths, rootfs=None):
+    """
+    Args:
+        paths: pd.Series of display paths, like
+            '/usr/local/lib/python3.8/dist-packages/../../../bin/tqdm'
+        rootfs: RootFS of the image, if given the symlinks in the parent
+            dirs are resolved too, like '/lib/x.so' -> '/usr/lib/x.so'
+            on merged /usr images.
+
+    Returns:
+        pd.Series of the normalized paths, same index as paths
+    """
+    paths = paths.astype(str)
+    mask = paths.str.contains(_NOT_NORMAL, regex=True)
+    if mask.any():
+        paths = paths.copy()
+        paths[mask] = paths[mask].map(os.path.normpath)
+    if rootfs is None:
+        return paths
+
+    # one resolution per dir, not per file
+    parts = paths.str.rpartition("/")
+    dirs = parts[0].where(parts[0] != "", "/")
+    resolved = {d: rootfs.resolve(d) or d for d in dirs.unique()}
+    resolved_dirs = dirs.map(resolved)
+    return (resolved_dirs.str.rstrip("/") + "/" + parts[2]).where(parts[1] != "", paths)
+
+
+class OwnershipIndex(object):
+    """
+    Index from normalized path to its owning packages, built once from the
+    packages_files table and shared by Image.analyze, Image.get_used_files
+    and the attribution of vulnerabilities.
+
+    table: the packages_files table, its path column normalized, sorted by
+    size like Image.package_files_df. A path owned by several packages has
+    one row per owner.
+
+    Usage:
+        index = OwnershipIndex.load_or_build('img_packages_files.csv')
+        owners = index.owners(removed_files_df['name'])
+    """
+
+    def __init__(self, table) -> None:
+        self.table = table
+
+    @staticmethod
+    def build(package_files_df, rootfs=None):
+        table = to_categorical(package_files_df).sort_values(
+            by=["size(KB)"], ascending=False
+        )
+        table["path"] = normalize_paths(table["path"], rootfs)
+        return OwnershipIndex(table)
+
+    @staticmethod
+    def cache_path(package_files_path):
+        return package_files_path + ".owners.parquet"
+
+    @staticmethod
+    def source_key(package_files_path, rootfs=None):
+        """
+        Digest of the size, mtime and first and last KEY_BYTES of the
+        packages_files table, and of the rootfs its paths are resolved in.
+        Cheap whatever the size of the table is.
+        """
+        digest = hashlib.sha256()
+        st = os.stat(package_files_path)
+        digest.update(f"{st.st_size}:{st.st_mtime_ns}".encode())
+        with open(package_files_path, "rb") as f:
+            digest.update(f.read(KEY_BYTES))
+            if st.st_size > KEY_BYTES:
+                f.seek(max(KEY_BYTES, st.st_size - KEY_BYTES))
+                digest.update(f.read(KEY_BYTES))
+        if rootfs is not None:
+            chain_ids = getattr(rootfs, "chain_ids", None)
+            if chain_ids:
+                rootfs_id = chain_ids[-1]
+            else:
+                rootfs_id = getattr(rootfs, "root", getattr(rootfs, "tar_path", ""))
+            digest.update(f"\0{type(rootfs).__name__}:{rootfs_id}".encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def load_or_build(package_files_path, package_files_df=None, rootfs=None):
+        """
+        The index is persisted next to the packages_files table with the
+        source_key it was built from, and rebuilt when the key changes.
+        """
+        cache_path = OwnershipIndex.cache_path(package_files_path)
+        key_path = cache_path + ".key"
+        key = OwnershipIndex.source_key(package_files_path, rootfs)
+        if os.path.exists(cache_path) and os.path.exists(key_path):
+            with open(key_path) as f:
+                if f.read() == key:
+                    return OwnershipIndex(read_table(cache_path))
+
+        if package_files_df is None:
+            package_files_df = read_table(package_files_path)
+        index = OwnershipIndex.build(package_files_df, rootfs)
+        try:
+            index.save(cache_path)
+            # the key goes last, a partly saved index is never used
+            with open(key_path, "w") as f:
+                f.write(key)
+        except OSError as e:
+            logging.warning(f"cannot persist ownership index {cache_path}: {e}")
+        return index
+
+    def save(self, path):
+        write_table(self.table, path)
+
+    def owners(self, paths, columns=None):
+        """
+        Args:
+            paths: list or pd.Series of normalized paths
+            columns: columns of table to return, all of them by default
+
+        Returns:
+            pd.DataFrame indexed by path, one row per (path, owner), the
+            paths without owner are left out. One hash join, whatever the
+            number of paths is.
+        """
+        columns = list(self.table.columns) if columns is None else columns
+        columns = [c for c in columns if c != "path"]
+        query = pd.DataFrame({"path": pd.Series(paths, dtype=object)})
+        owned = query.merge(self.table[["path"] + columns], on="path", how="inner")
+        return owned.set_index("path")
+
+    def grype_owners(self, grype_json):
+        """
+        Attribute the matches of a grype json report to packages by the
+        paths of their artifacts.
+
+        Returns:
+            pd.DataFrame with columns match (index of the match in the
+            report), vulnerability, severity, artifact, path and PKG_KEYS,
+            one row per (match, location, owner). The matches without owner
+            are left out.
+        """
+        rows = []
+        for i, m in enumerate(json.loads(grype_json)["matches"]):
+            for location in m["artifact"].get("locations", []):
+                rows.append(
+                    (
+                        i,
+                        m["vulnerability"]["id"],
+                        m["vulnerability"].get("severity"),
+                        m["artifact"]["name"],
+                        posixpath.normpath(location["path"]),
+                    )
+                )
+        matches = pd.DataFrame(
+            rows, columns=["match", "vulnerability", "severity", "artifact", "path"]
+        )
+        return matches.merge(self.table[["path"] + PKG_KEYS], on="path", how="inner")
@@ -62,6 +62,8 @@ class CondaPackage(Package):
 
 
 class PkgFile(object):
+    __slots__ = ("name", "size")
+
     def __init__(self, name, size=0) -> None:
         self.name = name
         self.size = size
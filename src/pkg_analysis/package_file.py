@@ -3,11 +3,31 @@ import os
 
 import docker
 
+from common.file_store import FileStore
+from container.session import run_in_image
+
+from .conda_meta import CondaEnvironments
+from .dpkg import DpkgDatabase
 from .package import PkgFile
+from .rootfs import FILE, LINK, size_in_kb
+from .site_packages import SitePackages
 
 
 class PkgFileFiller(ABC):
     @abstractmethod
+    def iter_files(self, pkgs):
+        """
+        Args:
+            pkgs: list of Package
+
+        Returns:
+            a generator of (package, list of PkgFile), one package at a time.
+            The occupied_size of each package is filled, its files field
+            is left untouched, so the files of a package can be dropped
+            once they are consumed.
+        """
+        raise NotImplementedError()
+
     def fit(self, pkgs):
         """
         Args:
@@ -16,20 +36,27 @@ class PkgFileFiller(ABC):
         Returns:
             None
 
-        Fill the files field of each package in pkgs.
+        Fill the files field of each package in pkgs with a FileView of
+        one FileStore shared by pkgs, the owner of a file is the index of
+        its package in pkgs.
         """
-        raise NotImplementedError()
+        store = FileStore(PkgFile)
+        for i, (p, files) in enumerate(self.iter_files(pkgs)):
+            start = len(store)
+            store.extend(files, owner=i)
+            p.files = store.view(start, len(store))
 
 
 class AptPkgFileFiller(PkgFileFiller):
-    def __init__(self, container) -> None:
+    def __init__(self, container, session=None) -> None:
         self.container = container
+        self.session = session
         self.client = docker.from_env()
 
     def _list_files(self, pkg_name):
 
-        raw_output = self.client.containers.run(
-            self.container, "dpkg -L " + pkg_name, remove=True, entrypoint=""
+        raw_output = run_in_image(
+            self.client, self.container, "dpkg -L " + pkg_name, self.session
         ).decode("utf-8")
         pkg_files = raw_output.splitlines()
         # filter irrelevant msgs
@@ -55,11 +82,11 @@ class AptPkgFileFiller(PkgFileFiller):
 
         ls_files = " ".join(quote_pkg_files)
         try:
-            output = self.client.containers.run(
+            output = run_in_image(
+                self.client,
                 self.container,
                 "ls -lsd --block-size=k " + ls_files,
-                remove=True,
-                entrypoint="",
+                self.session,
             ).decode("utf-8")
         except docker.errors.ContainerError as e:
             # remove these non exist files
@@ -75,11 +102,11 @@ class AptPkgFileFiller(PkgFileFiller):
             for f in exist_file:
                 quote_pkg_files.append("'" + f + "'")
 
-            output = self.client.containers.run(
+            output = run_in_image(
+                self.client,
                 self.container,
                 "ls -lsd --block-size=k " + " ".join(quote_pkg_files),
-                remove=True,
-                entrypoint="",
+                self.session,
             ).decode("utf-8")
         return output
 
@@ -127,25 +154,53 @@ class AptPkgFileFiller(PkgFileFiller):
                     files.append(file)
         return files
 
-    def fit(self, pkgs):
+    def iter_files(self, pkgs):
         for i, p in enumerate(pkgs):
             print(f"get apt package files {i}/{len(pkgs)}: ", p.name)
             files_str = self._list_files(p.name)
             files = self._parse_files(files_str)
-            p.files = files
-            for f in p.files:
+            for f in files:
                 p.occupied_size += f.size
+            yield p, files
+
+
+class RootfsAptPkgFileFiller(PkgFileFiller):
+    """
+    Read the files of each package from /var/lib/dpkg/info/*.list and
+    stat them in the RootFS, instead of `dpkg -L` and `ls -lsd`.
+    """
+
+    def __init__(self, rootfs) -> None:
+        self.rootfs = rootfs
+
+    def _list_files(self, pkg_name):
+        db = DpkgDatabase.load(self.rootfs)
+        files = []
+        for path in db.list_files(pkg_name):
+            entry = self.rootfs.lstat(path)
+            # we only care about files and links.
+            if entry is not None and entry.kind in (FILE, LINK):
+                files.append(PkgFile(path, size_in_kb(entry.size)))
+        return files
+
+    def iter_files(self, pkgs):
+        for p in pkgs:
+            files = self._list_files(p.name)
+            for f in files:
+                p.occupied_size += f.size
+            yield p, files
 
 
 class PipPkgFileFiller(PkgFileFiller):
-    def __init__(self, container) -> None:
+    def __init__(self, container, session=None) -> None:
         self.container = container
+        self.session = session
         self.client = docker.from_env()
 
     def _list_files(self, pkg_name, pkg_location):
         raw_output = (
-            self.client.containers.run(
-                self.container, "pip show -f " + pkg_name, remove=True, entrypoint=""
+            run_in_image(
+                self.client, self.container, "pip show -f " + pkg_name, self.session
             )
             .decode("utf-8")
             .splitlines()
@@ -175,11 +230,11 @@ class PipPkgFileFiller(PkgFileFiller):
 
                 # not work for pip pkg like  keyrings.alt-3.0.egg-info
                 raw_output = (
-                    self.client.containers.run(
+                    run_in_image(
+                        self.client,
                         self.container,
                         "find " + pkg_location + "/" + pkg_name,
-                        remove=True,
-                        entrypoint="",
+                        self.session,
                     )
                     .decode("utf-8")
                     .splitlines()
@@ -211,11 +266,11 @@ class PipPkgFileFiller(PkgFileFiller):
         for line in pkg_files:
             quote_pkg_files.append("'" + line + "'")
         try:
-            output = self.client.containers.run(
+            output = run_in_image(
+                self.client,
                 self.container,
                 "ls -lsd --block-size=k " + " ".join(quote_pkg_files),
-                remove=True,
-                entrypoint="",
+                self.session,
             ).decode("utf-8")
         except docker.errors.ContainerError as e:
             # remove these non exist files
@@ -228,11 +283,11 @@ class PipPkgFileFiller(PkgFileFiller):
             for f in exist_file:
                 quote_pkg_files.append("'" + f + "'")
 
-            output = self.client.containers.run(
+            output = run_in_image(
+                self.client,
                 self.container,
                 "ls -lsd --block-size=k " + " ".join(quote_pkg_files),
-                remove=True,
-                entrypoint="",
+                self.session,
             ).decode("utf-8")
 
         return output
@@ -281,22 +336,56 @@ class PipPkgFileFiller(PkgFileFiller):
                     files.append(file)
         return files
 
-    def fit(self, pkgs):
+    def iter_files(self, pkgs):
         for i, p in enumerate(pkgs):
             print(f"get pip package files {i}/{len(pkgs)}: ", p.name)
             files_str = self._list_files(p.name, p.location)
             files = self._parse_files(files_str)
-            p.files = files
-            for f in p.files:
+            for f in files:
                 p.occupied_size += f.size
+            yield p, files
+
+
+class RootfsPipPkgFileFiller(PkgFileFiller):
+    """
+    Read the files of each package from RECORD or installed-files.txt and
+    stat them in the RootFS, instead of `pip show -f` and `ls -lsd`.
+    """
+
+    def __init__(self, rootfs) -> None:
+        self.rootfs = rootfs
+
+    def _list_files(self, pkg_name, pkg_location):
+        dist = SitePackages.load(self.rootfs).dists[pkg_name]
+        files = []
+        for rel_path in dist.files():
+            path = pkg_location + "/" + rel_path
+            entry = self.rootfs.lstat(path)
+            # we only care about files.
+            if entry is not None and entry.kind == FILE:
+                files.append(PkgFile(path, size_in_kb(entry.size)))
+        return files
+
+    def iter_files(self, pkgs):
+        for p in pkgs:
+            files = self._list_files(p.name, p.location)
+            for f in files:
+                p.occupied_size += f.size
+            yield p, files
 
 
 class CondaPkgFileFiller(PkgFileFiller):
-    def __init__(self, container) -> None:
+    def __init__(self, container, session=None) -> None:
         self.container = container
+        self.session = session
         self.client = docker.from_env()
 
     def _get_file_content(self, json_file_path):
+        if self.session is not None:
+            try:
+                return self.session.run(f"cat {json_file_path}")
+            except docker.errors.ContainerError:
+                return b""
         tmp_container = self.client.containers.create(
             self.container, f"cat {json_file_path}", detach=False, entrypoint=""
         )
@@ -319,11 +408,11 @@ class CondaPkgFileFiller(PkgFileFiller):
                 quote_pkg_files.append("'" + line + "'")
         ls_files = " ".join(quote_pkg_files)
 
-        output = self.client.containers.run(
+        output = run_in_image(
+            self.client,
             self.container,
             "ls -lsd --block-size=k " + ls_files,
-            remove=True,
-            entrypoint="",
+            self.session,
         ).decode("utf-8")
         return output
 
@@ -363,11 +452,39 @@ class CondaPkgFileFiller(PkgFileFiller):
                     files.append(file)
         return files
 
-    def fit(self, pkgs):
+    def iter_files(self, pkgs):
         for i, p in enumerate(pkgs):
             print(f"get conda package files {i}/{len(pkgs)}: ", p.name)
             files_str = self._list_files(p)
             files = self._parse_files(files_str)
-            p.files = files
-            for f in p.files:
+            for f in files:
+                p.occupied_size += f.size
+            yield p, files
+
+
+class RootfsCondaPkgFileFiller(PkgFileFiller):
+    """
+    Read the files of each package from its conda-meta record or
+    info/files and stat them in the RootFS, instead of `cat` and `ls -lsd`.
+    """
+
+    def __init__(self, rootfs) -> None:
+        self.rootfs = rootfs
+
+    def _list_files(self, pkg):
+        record = CondaEnvironments.load(self.rootfs).get(pkg)
+        files = []
+        for rel_path in record.files:
+            path = os.path.join(pkg.location, rel_path)
+            entry = self.rootfs.lstat(path)
+            # we only care about files.
+            if entry is not None and entry.kind == FILE:
+                files.append(PkgFile(path, size_in_kb(entry.size)))
+        return files
+
+    def iter_files(self, pkgs):
+        for p in pkgs:
+            files = self._list_files(p)
+            for f in files:
                 p.occupied_size += f.size
+            yield p, files
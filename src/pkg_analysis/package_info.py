@@ -4,6 +4,12 @@ import os
 
 import docker
 
+from container.session import run_in_image
+
+from .conda_meta import CondaEnvironments
+from .dpkg import DpkgDatabase
+from .site_packages import SitePackages
+
 
 class PkgInfoFiller(ABC):
     @abstractmethod
@@ -21,8 +27,9 @@ class PkgInfoFiller(ABC):
 
 
 class AptPkgInfoFiller(PkgInfoFiller):
-    def __init__(self, container):
+    def __init__(self, container, session=None):
         self.container = container
+        self.session = session
         self.client = docker.from_env()
 
     def _show_info(self, pkgs):
@@ -30,7 +37,7 @@ class AptPkgInfoFiller(PkgInfoFiller):
         for p in pkgs:
             cmd = cmd + p.name + " "
         output = (
-            self.client.containers.run(self.container, cmd, remove=True, entrypoint="")
+            run_in_image(self.client, self.container, cmd, self.session)
             .decode("utf-8")
             .split("\n\n")
         )
@@ -119,14 +126,30 @@ class AptPkgInfoFiller(PkgInfoFiller):
         return pkgs
 
 
+class RootfsAptPkgInfoFiller(PkgInfoFiller):
+    def __init__(self, rootfs):
+        self.rootfs = rootfs
+
+    def fit(self, pkgs):
+        if len(pkgs) == 0:
+            print("no apt packages")
+            return
+        db = DpkgDatabase.load(self.rootfs)
+        for p in pkgs:
+            p.desc = db.summary(p.name)
+            p.installed_size = db.installed_size(p.name)
+        return pkgs
+
+
 class PipPkgInfoFiller(PkgInfoFiller):
-    def __init__(self, container) -> None:
+    def __init__(self, container, session=None) -> None:
         self.container = container
+        self.session = session
         self.client = docker.from_env()
 
     def _show_info(self, pkg_name):
-        output = self.client.containers.run(
-            self.container, "pip show " + pkg_name, remove=True, entrypoint=""
+        output = run_in_image(
+            self.client, self.container, "pip show " + pkg_name, self.session
         ).decode("utf-8")
         return output
 
@@ -167,11 +190,11 @@ class PipPkgInfoFiller(PkgInfoFiller):
         return round(float(output.split("\t")[0]), 2)
 
     def _get_size(self, location, pkg_name):
-        output = self.client.containers.run(
+        output = run_in_image(
+            self.client,
             self.container,
             "du -sk " + location + "/" + pkg_name,
-            remove=True,
-            entrypoint="",
+            self.session,
         ).decode("utf-8")
 
         return self._parse_size_info(output)
@@ -190,12 +213,31 @@ class PipPkgInfoFiller(PkgInfoFiller):
         return pkgs
 
 
+class RootfsPipPkgInfoFiller(PkgInfoFiller):
+    def __init__(self, rootfs) -> None:
+        self.rootfs = rootfs
+
+    def fit(self, pkgs):
+        site_packages = SitePackages.load(self.rootfs)
+        for p in pkgs:
+            dist = site_packages.dists[p.name]
+            p.desc = dist.summary
+            p.location = dist.location
+        return pkgs
+
+
 class CondaPkgInfoFiller(PkgInfoFiller):
-    def __init__(self, container) -> None:
+    def __init__(self, container, session=None) -> None:
         self.container = container
+        self.session = session
         self.client = docker.from_env()
 
     def _get_file_content(self, json_file_path):
+        if self.session is not None:
+            try:
+                return self.session.run(f"cat {json_file_path}")
+            except docker.errors.ContainerError:
+                return b""
         tmp_container = self.client.containers.create(
             self.container, f"cat {json_file_path}", detach=False, entrypoint=""
         )
@@ -216,3 +258,14 @@ class CondaPkgInfoFiller(PkgInfoFiller):
             print(f"get conda package info {i}/{len(pkgs)}: ", p.name)
             self._parse_one_package(p)
         return pkgs
+
+
+class RootfsCondaPkgInfoFiller(PkgInfoFiller):
+    def __init__(self, rootfs) -> None:
+        self.rootfs = rootfs
+
+    def fit(self, pkgs):
+        envs = CondaEnvironments.load(self.rootfs)
+        for p in pkgs:
+            p.desc = envs.get(p).summary
+        return pkgs
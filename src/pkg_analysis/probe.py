@@ -0,0 +1,105 @@
+import json
+import logging
+from pathlib import Path
+
+import docker
+
+from container.session import ExecSession
+from .rootfs import METADATA_PATTERNS, FileEntry, IndexedRootFS, normalize
+
+PROBE_SCRIPT_PATH = Path(__file__).with_name("inventory_probe.py")
+PROBE_TARGET = "/.mmlb_inventory_probe.py"
+# exit code of the probe command when the image has no python3
+NO_PYTHON3 = 127
+
+
+class ProbeError(Exception):
+    pass
+
+
+class ProbeRootFS(IndexedRootFS):
+    """
+    Root filesystem of an image collected by running inventory_probe.py in
+    one container of the image, which needs python3. The probe is mounted
+    read-only and streams every entry plus the content of the files
+    matching METADATA_PATTERNS as JSON lines, so the Rootfs* analyzers and
+    fillers work on the result without any other container run.
+    """
+
+    def __init__(self, image_name) -> None:
+        super().__init__()
+        self.image_name = image_name
+        self.client = docker.from_env()
+        self._load()
+
+    def _cmd(self):
+        patterns = json.dumps(METADATA_PATTERNS).replace("'", "'\\''")
+        return [
+            "sh",
+            "-c",
+            f"command -v python3 >/dev/null 2>&1 || exit {NO_PYTHON3}; "
+            f"exec python3 {PROBE_TARGET} '{patterns}' {PROBE_TARGET}",
+        ]
+
+    def _records(self):
+        """
+        The output of the probe is streamed from a `docker exec` in an idle
+        container, not through the logs of the container, which go to the
+        log driver and may be rotated or dropped.
+        """
+        container = self.client.containers.run(
+            self.image_name,
+            ExecSession.IDLE_CMD,
+            entrypoint="",
+            detach=True,
+            volumes={str(PROBE_SCRIPT_PATH): {"bind": PROBE_TARGET, "mode": "ro"}},
+        )
+        try:
+            api = self.client.api
+            exec_id = api.exec_create(container.id, self._cmd())["Id"]
+            pending = b""
+            stderr = b""
+            for out, err in api.exec_start(exec_id, stream=True, demux=True):
+                if err is not None:
+                    stderr += err
+                if out is None:
+                    continue
+                pending += out
+                lines = pending.split(b"\n")
+                pending = lines.pop()
+                for line in lines:
+                    if line.strip() != b"":
+                        yield json.loads(line)
+            if pending.strip() != b"":
+                yield json.loads(pending)
+
+            exit_code = api.exec_inspect(exec_id)["ExitCode"]
+            if exit_code == NO_PYTHON3:
+                raise ProbeError(
+                    f"python3 is not found in {self.image_name}, the inventory "
+                    "probe needs it, analyze the image from its rootfs instead"
+                )
+            if exit_code != 0:
+                raise docker.errors.ContainerError(
+                    container, exit_code, self._cmd(), self.image_name, stderr
+                )
+        finally:
+            container.remove(force=True)
+
+    def _load(self):
+        count = None
+        for record in self._records():
+            if record[0] == "e":
+                _, path, kind, size, linkname = record
+                self.entries[normalize(path)] = FileEntry(kind, size, linkname)
+            elif record[0] == "c":
+                _, path, content = record
+                self.contents[normalize(path)] = content.encode(
+                    "utf-8", "surrogateescape"
+                )
+            elif record[0] == "end":
+                count = record[1]
+        if count is None:
+            raise ProbeError(f"output of the probe in {self.image_name} is truncated")
+        logging.info(f"probe found {count} entries in {self.image_name}")
+        self._add_parents(list(self.entries))
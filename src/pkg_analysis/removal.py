@@ -0,0 +1,228 @@
+import numpy as np
+import pandas as pd
+
+from .image import SEVERITIES
+
+
+class RemovalResult(object):
+    """
+    What goes away with a removal: the packages removed or orphaned, the
+    size of their files and their vulnerabilities.
+    """
+
+    __slots__ = ("removed", "size", "num_vuls", "vuls_by_severity")
+
+    def __init__(self, removed, size, num_vuls, vuls_by_severity) -> None:
+        self.removed = removed  # list of graph nodes
+        self.size = size  # KB
+        self.num_vuls = num_vuls
+        self.vuls_by_severity = vuls_by_severity
+
+    def __repr__(self) -> str:
+        return (
+            f"RemovalResult(removed={len(self.removed)}, size={self.size}KB, "
+            f"num_vuls={self.num_vuls})"
+        )
+
+
+class RemovalSimulator(object):
+    """
+    What-if removals of packages over a built DepsGraph. Removing a package
+    also removes the packages orphaned by it, the ones no longer reachable
+    from the root.
+
+    A removal only looks at the packages reachable from the removed ones,
+    the others keep their path from the root. Freed sizes come from the
+    package files table if given, a file shared by several packages is only
+    freed with its last alive owner; from the size of the nodes otherwise.
+
+    Usage:
+        simulator = RemovalSimulator(dep_graph, image.package_files_df)
+        simulator.simulate([simulator.node('scipy')]).size
+        for node, result in simulator.best_removals(5):
+            print(node, result)
+    """
+
+    def __init__(self, graph, package_files_df=None) -> None:
+        self.graph = graph
+        self.core = graph.core
+        nodes = self.core.nodes
+        self.root = graph.root_node.id
+        # packages not reached from the root are never part of a result
+        self.dead = bytearray(b"\x01") * len(nodes)
+        if self.root is not None:
+            for i in self.core.bfs(self.root)[0]:
+                self.dead[i] = 0
+
+        self.vuls = np.zeros((len(nodes), 1 + len(SEVERITIES)), dtype=np.int64)
+        for i, node in enumerate(nodes):
+            if node is graph.root_node:
+                continue
+            self.vuls[i, 0] = node.num_vuls
+            for j, severity in enumerate(SEVERITIES):
+                self.vuls[i, 1 + j] = node.vuls_by_severity.get(severity, 0)
+
+        self.files = None
+        if package_files_df is not None:
+            self._index_files(package_files_df)
+
+    def _index_files(self, package_files_df):
+        keys = self.graph.node_keys
+        files = package_files_df[
+            package_files_df["package_type"].astype(str) == self.graph.pkg_type
+        ][["path", "size(KB)"] + keys]
+        files = files.astype({k: str for k in keys})
+        files = files.drop_duplicates(["path"] + keys)
+
+        codes, paths = pd.factorize(files["path"])
+        self.file_sizes = np.zeros(len(paths))
+        self.file_sizes[codes] = files["size(KB)"].values
+
+        # only the alive packages own files, the ones not in the graph or
+        # not reached from the root are already gone
+        nodes = self.core.nodes
+        alive = [i for i in range(len(nodes)) if not self.dead[i]]
+        node_df = pd.DataFrame(
+            {
+                "node": alive,
+                "package": [nodes[i].name for i in alive],
+                "version": [str(nodes[i].version) for i in alive],
+            }
+        )[["node"] + keys]
+        owned = node_df.merge(files.assign(code=codes), on=keys, how="inner")
+        # alive owners of every file
+        self.file_owners = np.bincount(owned["code"], minlength=len(paths))
+        self.files = {
+            node: group.values
+            for node, group in owned.groupby("node", sort=False)["code"]
+        }
+
+    def node(self, name, version=None):
+        """
+        Returns the node of package name, of this version if given
+        """
+        for n in self.core.nodes:
+            if n.name == name and (version is None or n.version == version):
+                if n is not self.graph.root_node:
+                    return n
+        raise KeyError(f"package {name} {version} is not in the graph")
+
+    def _remove(self, ids, dead):
+        """
+        Mark ids and the packages they orphan as dead, in place.
+
+        Returns:
+            list of the newly dead ids
+        """
+        successors = self.core.successors
+        predecessors = self.core.predecessors
+        died = []
+        for x in ids:
+            if dead[x] or x == self.root:
+                continue
+            # the alive packages reachable from x, the only ones that can
+            # lose their path from the root
+            reached = {x}
+            stack = [x]
+            while stack:
+                v = stack.pop()
+                for w in successors(v):
+                    if not dead[w] and w not in reached and w != self.root:
+                        reached.add(w)
+                        stack.append(w)
+            dead[x] = 1
+            reached.discard(x)
+            # alive parents outside of reached still have their path
+            alive = set()
+            stack = []
+            for v in reached:
+                for p in predecessors(v):
+                    if not dead[p] and p not in reached:
+                        alive.add(v)
+                        stack.append(v)
+                        break
+            while stack:
+                v = stack.pop()
+                for w in successors(v):
+                    if w in reached and w not in alive:
+                        alive.add(w)
+                        stack.append(w)
+            died.append(x)
+            for v in reached:
+                if v not in alive:
+                    dead[v] = 1
+                    died.append(v)
+        return died
+
+    def _result(self, died):
+        nodes = self.core.nodes
+        if self.files is None:
+            size = sum(max(getattr(nodes[i], "size", -1), 0) for i in died)
+        else:
+            owned = [self.files[i] for i in died if i in self.files]
+            size = 0.0
+            if owned:
+                codes, counts = np.unique(np.concatenate(owned), return_counts=True)
+                freed = self.file_owners[codes] == counts
+                size = float(self.file_sizes[codes[freed]].sum())
+        vuls = self.vuls[died].sum(axis=0) if died else np.zeros(1 + len(SEVERITIES))
+        return RemovalResult(
+            [nodes[i] for i in died],
+            size,
+            int(vuls[0]),
+            {s: int(vuls[1 + j]) for j, s in enumerate(SEVERITIES)},
+        )
+
+    def simulate(self, pkgs):
+        """
+        Args:
+            pkgs: graph nodes to remove together
+
+        Returns:
+            RemovalResult of removing pkgs after the removals already done
+        """
+        return self._result(self._remove([n.id for n in pkgs], bytearray(self.dead)))
+
+    def remove(self, pkgs):
+        """
+        Same as simulate, the removal is kept for the next ones
+        """
+        died = self._remove([n.id for n in pkgs], self.dead)
+        result = self._result(died)
+        if self.files is not None:
+            for i in died:
+                if i in self.files:
+                    np.subtract.at(self.file_owners, self.files[i], 1)
+        return result
+
+    def best_removals(self, k, candidates=None, by="size"):
+        """
+        Greedy search of the k removals freeing the most, one package at a
+        time, each chosen given the previous ones. The removals are kept.
+
+        Args:
+            candidates: graph nodes that can be removed, all by default
+            by: 'size' or 'num_vuls'
+
+        Returns:
+            list of (node, RemovalResult)
+        """
+        if candidates is None:
+            candidates = [n for n in self.core.nodes if n is not self.graph.root_node]
+        chosen = []
+        for _ in range(k):
+            best = None
+            best_result = None
+            for n in candidates:
+                if self.dead[n.id]:
+                    continue
+                result = self.simulate([n])
+                if best_result is None or (
+                    getattr(result, by),
+                    result.size,
+                ) > (getattr(best_result, by), best_result.size):
+                    best, best_result = n, result
+            if best is None:
+                break
+            chosen.append((best, self.remove([best])))
+        return chosen
@@ -0,0 +1,507 @@
+from abc import ABC, abstractmethod
+import fnmatch
+import json
+import logging
+import math
+import os
+import posixpath
+import stat
+import subprocess
+import tarfile
+
+from common.utils import image_to_filename
+
+from .layer_cache import chain_ids
+
+# files whose content is kept in memory when a tarball is indexed,
+# every other member only contributes its type and size.
+METADATA_PATTERNS = [
+    "/etc/os-release",
+    "/usr/lib/os-release",
+    "/var/lib/dpkg/status",
+    "/var/lib/dpkg/info/*.list",
+    "*-packages/*.dist-info/METADATA",
+    "*-packages/*.dist-info/RECORD",
+    "*-packages/*.dist-info/top_level.txt",
+    "*-packages/*.egg-info",
+    "*-packages/*.egg-info/PKG-INFO",
+    "*-packages/*.egg-info/installed-files.txt",
+    "*-packages/*.egg-info/requires.txt",
+    "*-packages/*.egg-info/top_level.txt",
+    "*/conda-meta/*.json",
+    "*/pkgs/*/info/index.json",
+    "*/pkgs/*/info/about.json",
+    "*/pkgs/*/info/files",
+]
+
+# max number of symlinks followed when resolving a path, same as linux
+MAX_SYMLINKS = 40
+
+FILE = "f"
+LINK = "l"
+DIR = "d"
+OTHER = "o"
+
+
+def is_metadata_path(path):
+    for pattern in METADATA_PATTERNS:
+        if fnmatch.fnmatchcase(path, pattern):
+            return True
+    return False
+
+
+def size_in_kb(size):
+    """
+    Same number as the size column of `ls -lsd --block-size=k`
+    """
+    return float(math.ceil(size / 1024))
+
+
+def normalize(path):
+    """
+    Args:
+        path: like './usr/bin/adduser' or 'usr/bin/adduser'
+
+    Returns:
+        '/usr/bin/adduser'
+    """
+    path = posixpath.normpath("/" + path)
+    # posixpath keeps a leading '//'
+    if path.startswith("//"):
+        path = "/" + path.lstrip("/")
+    return path
+
+
+class FileEntry(object):
+    __slots__ = ("kind", "size", "linkname")
+
+    def __init__(self, kind, size=0, linkname=None) -> None:
+        self.kind = kind
+        self.size = size  # bytes
+        self.linkname = linkname
+
+    def __repr__(self) -> str:
+        return self.kind + ":" + str(self.size)
+
+
+class RootFS(ABC):
+    """
+    Read only view of the root filesystem of an image.
+
+    Paths are absolute paths inside the image. Symlinks are resolved
+    inside the image, so an absolute link like `/lib64 -> /usr/lib64`
+    never escapes to the host.
+    """
+
+    def __init__(self) -> None:
+        # parsed package databases, shared by all analyzers of the image
+        self.cache = {}
+
+    @abstractmethod
+    def _lstat(self, path):
+        """
+        Returns the FileEntry of path without resolving any symlink, or None.
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def _read(self, path):
+        """
+        Returns the content of a resolved path as bytes, or None.
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def _listdir(self, path):
+        """
+        Returns the names in a resolved dir, or [].
+        """
+        raise NotImplementedError()
+
+    def memo(self, key, func):
+        if key not in self.cache:
+            self.cache[key] = func()
+        return self.cache[key]
+
+    def _resolve(self, path, follow_last):
+        path = normalize(path)
+        todo = [c for c in path.split("/") if c != ""]
+        todo.reverse()
+        resolved = "/"
+        links = 0
+        while todo:
+            component = todo.pop()
+            if component == ".":
+                continue
+            if component == "..":
+                resolved = posixpath.dirname(resolved)
+                continue
+            candidate = posixpath.join(resolved, component)
+            if not todo and not follow_last:
+                return candidate
+            entry = self._lstat(candidate)
+            if entry is None or entry.kind != LINK:
+                resolved = candidate
+                continue
+            links += 1
+            if links > MAX_SYMLINKS:
+                return None
+            target = entry.linkname
+            if target.startswith("/"):
+                resolved = "/"
+            extra = [c for c in target.split("/") if c != ""]
+            extra.reverse()
+            todo.extend(extra)
+        return resolved
+
+    def resolve(self, path):
+        """
+        Resolve all symlinks of path, like os.path.realpath
+        """
+        return self._resolve(path, follow_last=True)
+
+    def lstat(self, path):
+        """
+        Like os.lstat: symlinks in the parent dirs are followed, the last
+        component is not.
+        """
+        resolved = self._resolve(path, follow_last=False)
+        if resolved is None:
+            return None
+        return self._lstat(resolved)
+
+    def read_file(self, path):
+        resolved = self.resolve(path)
+        if resolved is None:
+            return None
+        return self._read(resolved)
+
+    def read_text(self, path):
+        content = self.read_file(path)
+        if content is None:
+            return None
+        return content.decode("utf-8", errors="replace")
+
+    def listdir(self, path):
+        resolved = self.resolve(path)
+        if resolved is None:
+            return []
+        return self._listdir(resolved)
+
+    def exists(self, path):
+        return self.lstat(path) is not None
+
+    def glob(self, pattern):
+        """
+        Args:
+            pattern: an absolute path whose components may contain
+                     fnmatch wildcards, like '/usr/lib/python3*/site-packages'
+        """
+        matches = ["/"]
+        for component in [c for c in pattern.split("/") if c != ""]:
+            next_matches = []
+            for m in matches:
+                if any(c in component for c in "*?["):
+                    for name in sorted(self.listdir(m)):
+                        if fnmatch.fnmatchcase(name, component):
+                            next_matches.append(posixpath.join(m, name))
+                elif self.exists(posixpath.join(m, component)):
+                    next_matches.append(posixpath.join(m, component))
+            matches = next_matches
+        return matches
+
+    def walk_files(self, path):
+        """
+        Yields every non dir path under path, symlinks to dirs are not
+        followed, like `find <path>`
+        """
+        entry = self.lstat(path)
+        if entry is None:
+            return
+        if entry.kind != DIR:
+            yield path
+            return
+        todo = [path]
+        while todo:
+            d = todo.pop()
+            for name in sorted(self.listdir(d)):
+                p = posixpath.join(d, name)
+                entry = self.lstat(p)
+                if entry is None:
+                    continue
+                if entry.kind == DIR:
+                    todo.append(p)
+                else:
+                    yield p
+
+
+class DirRootFS(RootFS):
+    """
+    Root filesystem exported into a local directory, e.g. by
+    `docker export <container> | tar -x -C <root>`
+    """
+
+    def __init__(self, root) -> None:
+        super().__init__()
+        self.root = os.path.abspath(root)
+
+    def _host_path(self, path):
+        return os.path.join(self.root, path.lstrip("/"))
+
+    def _lstat(self, path):
+        try:
+            st = os.lstat(self._host_path(path))
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        if stat.S_ISLNK(st.st_mode):
+            return FileEntry(LINK, st.st_size, os.readlink(self._host_path(path)))
+        if stat.S_ISREG(st.st_mode):
+            return FileEntry(FILE, st.st_size)
+        if stat.S_ISDIR(st.st_mode):
+            return FileEntry(DIR, st.st_size)
+        return FileEntry(OTHER, st.st_size)
+
+    def _read(self, path):
+        try:
+            with open(self._host_path(path), "rb") as f:
+                return f.read()
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            return None
+
+    def _listdir(self, path):
+        try:
+            return os.listdir(self._host_path(path))
+        except (FileNotFoundError, NotADirectoryError):
+            return []
+
+
+class IndexedRootFS(RootFS):
+    """
+    Root filesystem kept as an in-memory index of its entries, plus the
+    content of the files matching METADATA_PATTERNS.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.entries = {"/": FileEntry(DIR)}
+        self.contents = {}
+        self._children = None
+
+    def _add_parents(self, paths):
+        # parent dirs are not always listed
+        for path in paths:
+            parent = posixpath.dirname(path)
+            while parent not in self.entries:
+                self.entries[parent] = FileEntry(DIR)
+                parent = posixpath.dirname(parent)
+        self._children = None
+
+    def _lstat(self, path):
+        return self.entries.get(path)
+
+    def _read(self, path):
+        return self.contents.get(path)
+
+    def _listdir(self, path):
+        if self._children is None:
+            children = {}
+            for p in self.entries:
+                if p == "/":
+                    continue
+                dirname, basename = posixpath.split(p)
+                children.setdefault(dirname, []).append(basename)
+            self._children = children
+        return list(self._children.get(path, []))
+
+
+class TarRootFS(IndexedRootFS):
+    """
+    Root filesystem read from a tarball in a single pass, without
+    extracting it. Two kinds of tarballs are supported:
+        - `docker export <container>`: the tarball is the filesystem.
+        - `docker save <image>`: the layers listed in manifest.json are
+          applied in order, including whiteout files.
+    Only the files matching METADATA_PATTERNS are kept in memory, the
+    other members only keep their type and size.
+
+    With a LayerCache, the layers of a `docker save` tarball are looked up
+    by chain ID first and only the layers missing in the cache are read.
+    """
+
+    WHITEOUT_PREFIX = ".wh."
+    OPAQUE_WHITEOUT = ".wh..wh..opq"
+
+    def __init__(self, tar_path, keep=is_metadata_path, layer_cache=None) -> None:
+        super().__init__()
+        self.tar_path = tar_path
+        self.keep = keep
+        self.layer_cache = layer_cache
+        self.chain_ids = []
+        self._load()
+
+    def _load(self):
+        with tarfile.open(self.tar_path, "r:*") as tar:
+            manifest = None
+            try:
+                manifest = tar.extractfile("manifest.json")
+            except KeyError:
+                pass
+            if manifest is None:
+                self._apply_layer(self._read_layer(tar))
+                return
+
+            manifest = json.load(manifest)[0]
+            layers = manifest["Layers"]
+            self.chain_ids = self._chain_ids(tar, manifest)
+            for i, layer_name in enumerate(layers):
+                chain_id = self.chain_ids[i] if self.chain_ids else None
+                layer = None
+                if self.layer_cache is not None and chain_id is not None:
+                    layer = self.layer_cache.get(chain_id)
+                if layer is None:
+                    logging.info(f"read layer {layer_name} of {self.tar_path}")
+                    layer_file = tar.extractfile(layer_name)
+                    with tarfile.open(fileobj=layer_file, mode="r:*") as layer_tar:
+                        layer = self._read_layer(layer_tar)
+                    if self.layer_cache is not None and chain_id is not None:
+                        self.layer_cache.put(chain_id, layer)
+                else:
+                    logging.info(f"layer {layer_name} of {self.tar_path} is cached")
+                self._apply_layer(layer)
+
+    def _chain_ids(self, tar, manifest):
+        """
+        Chain IDs of the layers, from the diff_ids of the image config.
+        Empty if the config can't be read, the layers are not cached then.
+        """
+        try:
+            config = json.load(tar.extractfile(manifest["Config"]))
+            return chain_ids(config["rootfs"]["diff_ids"])
+        except (KeyError, TypeError, json.decoder.JSONDecodeError):
+            logging.warning(f"no image config in {self.tar_path}, layers not cached")
+            return []
+
+    def _read_layer(self, tar):
+        """
+        Returns:
+            the changes of the layer as a json serializable dict
+            {
+                'entries': {path: [kind, size, linkname]},
+                'contents': {path: content decoded with surrogateescape},
+                'hardlinks': [[path, target]],
+                'removed': [paths of whiteout files],
+                'opaque': [dirs with an opaque whiteout],
+            }
+        """
+        entries = {}
+        contents = {}
+        hardlinks = []
+        removed = []
+        opaque = []
+        for member in tar:
+            path = normalize(member.name)
+            dirname, basename = posixpath.split(path)
+            if basename == self.OPAQUE_WHITEOUT:
+                opaque.append(dirname)
+                continue
+            if basename.startswith(self.WHITEOUT_PREFIX):
+                removed.append(
+                    posixpath.join(dirname, basename[len(self.WHITEOUT_PREFIX) :])
+                )
+                continue
+
+            if member.issym():
+                entry = [LINK, len(member.linkname), member.linkname]
+            elif member.islnk():
+                entry = [FILE, 0, None]
+                hardlinks.append([path, normalize(member.linkname)])
+            elif member.isreg():
+                entry = [FILE, member.size, None]
+                if self.keep(path):
+                    contents[path] = (
+                        tar.extractfile(member)
+                        .read()
+                        .decode("utf-8", "surrogateescape")
+                    )
+            elif member.isdir():
+                entry = [DIR, 0, None]
+            else:
+                entry = [OTHER, 0, None]
+            entries[path] = entry
+        return {
+            "entries": entries,
+            "contents": contents,
+            "hardlinks": hardlinks,
+            "removed": removed,
+            "opaque": opaque,
+        }
+
+    def _apply_layer(self, layer):
+        if layer["removed"] or layer["opaque"]:
+            self._remove_lower(set(layer["removed"]), set(layer["opaque"]))
+        for path, (kind, size, linkname) in layer["entries"].items():
+            self.entries[path] = FileEntry(kind, size, linkname)
+        for path, content in layer["contents"].items():
+            self.contents[path] = content.encode("utf-8", "surrogateescape")
+        self._add_parents(layer["entries"])
+
+        # hard links point to a file of the same layer or a lower one
+        for path, target in layer["hardlinks"]:
+            target_entry = self.entries.get(target)
+            if target_entry is not None:
+                self.entries[path].size = target_entry.size
+            if target in self.contents:
+                self.contents[path] = self.contents[target]
+
+    def _remove_lower(self, removed, opaque):
+        def is_removed(path):
+            p = path
+            while p != "/":
+                if p in removed:
+                    return True
+                parent = posixpath.dirname(p)
+                if parent in opaque:
+                    return True
+                p = parent
+            return False
+
+        for path in [p for p in self.entries if is_removed(p)]:
+            del self.entries[path]
+            self.contents.pop(path, None)
+
+
+def open_rootfs(path, layer_cache=None):
+    """
+    Args:
+        path: a directory holding an exported root filesystem, or a
+              tarball created by `docker export` or `docker save`.
+        layer_cache: LayerCache of the layers of `docker save` tarballs
+    """
+    if os.path.isdir(path):
+        return DirRootFS(path)
+    return TarRootFS(path, layer_cache=layer_cache)
+
+
+def export_rootfs(image_name, rootfs_dir, layer_cache=None):
+    """
+    Returns the root filesystem of image_name stored in rootfs_dir,
+    `docker save` the image first if neither `<rootfs_dir>/<image>` nor
+    `<rootfs_dir>/<image>.tar` exists.
+    """
+    name = image_to_filename(image_name)
+    dir_path = os.path.join(rootfs_dir, name)
+    if os.path.isdir(dir_path):
+        return DirRootFS(dir_path)
+
+    tar_path = dir_path + ".tar"
+    if not os.path.exists(tar_path):
+        os.makedirs(rootfs_dir, exist_ok=True)
+        # a failed or interrupted save must not leave a tarball behind
+        tmp_path = tar_path + ".tmp"
+        try:
+            subprocess.run(["docker", "save", "-o", tmp_path, image_name], check=True)
+            os.replace(tmp_path, tar_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return TarRootFS(tar_path, layer_cache=layer_cache)
@@ -0,0 +1,264 @@
+import json
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+SBOM_FORMATS = ["cyclonedx", "spdx"]
+
+PURL_TYPES = {"pip": "pypi", "apt": "deb", "conda": "conda"}
+
+# namespace of the deb purls when the distribution of the image is unknown
+DEFAULT_DISTRO = "debian"
+
+
+def is_left(node):
+    """
+    Whether some of the package is left after the debloating, bloat_degree
+    being the removed fraction of its size
+    """
+    return node.bloat_degree is not None and node.bloat_degree < 1
+
+
+class _JsonArray(object):
+    """
+    Writes the items of a json array as they come.
+    """
+
+    def __init__(self, fp) -> None:
+        self.fp = fp
+        self.empty = True
+
+    def append(self, item):
+        self.fp.write("\n    " if self.empty else ",\n    ")
+        self.fp.write(json.dumps(item))
+        self.empty = False
+
+    def close(self):
+        self.fp.write("]" if self.empty else "\n  ]")
+
+
+class SbomWriter(object):
+    """
+    Writes the SBOM of a DepsGraph as CycloneDX 1.5 or SPDX 2.3 json while
+    traversing the graph. Every package is written once and its
+    dependencies refer to it by id, nothing but the ids of the packages is
+    kept in memory.
+
+    The debloated SBOM leaves out the packages fully removed by the
+    debloating, bloat_degree 1, and the ones without bloat_degree; the size
+    of the others is what is left of them, size * (1 - bloat_degree).
+
+    Usage:
+        with open('tf_pip.cdx.json', 'w') as f:
+            SbomWriter(f, 'cyclonedx', is_debloated=True).write(dep_graph)
+    """
+
+    def __init__(self, fp, sbom_format="cyclonedx", is_debloated=False) -> None:
+        if sbom_format not in SBOM_FORMATS:
+            raise ValueError(f"unknown sbom format: {sbom_format}")
+        self.fp = fp
+        self.sbom_format = sbom_format
+        self.is_debloated = is_debloated
+
+    def _is_included(self, node):
+        if not self.is_debloated:
+            return True
+        return is_left(node)
+
+    def _size(self, node):
+        size = getattr(node, "size", -1)
+        if size < 0:
+            return None
+        if self.is_debloated:
+            return size * (1 - node.bloat_degree)
+        return size
+
+    def _ref(self, graph, node):
+        if self.sbom_format == "spdx":
+            if node is graph.root_node:
+                return "SPDXRef-app"
+            return f"SPDXRef-{graph.pkg_type}-{node.id}"
+        ref = f"{graph.pkg_type}:{node.name}"
+        if node.version is not None:
+            ref += f"@{node.version}"
+        # conda packages are per prefix, the same one can be in several
+        location = getattr(node, "location", "")
+        if location:
+            ref += f"?location={location}"
+        return ref
+
+    def _purl(self, graph, node):
+        purl_type = PURL_TYPES[graph.pkg_type]
+        if purl_type == "deb":
+            distro = getattr(graph, "distro", None) or DEFAULT_DISTRO
+            purl = f"pkg:deb/{distro}/{node.name}"
+        else:
+            purl = f"pkg:{purl_type}/{node.name}"
+        if node.version is not None:
+            # epochs, like 1:2.35, are percent-encoded
+            purl += "@" + quote(node.version, safe="")
+        arch = getattr(node, "arch", None)
+        if arch is not None:
+            purl += f"?arch={arch}"
+        return purl
+
+    def _properties(self, node):
+        properties = {"mmlb:depth": node.depth, "mmlb:num_vuls": node.num_vuls}
+        size = self._size(node)
+        if size is not None:
+            properties["mmlb:size(KB)"] = size
+        if node.bloat_degree is not None:
+            properties["mmlb:bloat_degree"] = node.bloat_degree
+        return properties
+
+    def write(self, graph, name=None):
+        """
+        Args:
+            graph: a built DepsGraph
+            name: name of the document, the type of the graph by default
+        """
+        name = name if name is not None else f"{graph.pkg_type} dependencies"
+        created = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        if self.sbom_format == "cyclonedx":
+            self._write_cyclonedx(graph, name, created)
+        else:
+            self._write_spdx(graph, name, created)
+
+    def _write_cyclonedx(self, graph, name, created):
+        root = graph.root_node
+        header = {
+            "bomFormat": "CycloneDX",
+            "specVersion": "1.5",
+            "serialNumber": f"urn:uuid:{uuid.uuid4()}",
+            "version": 1,
+            "metadata": {
+                "timestamp": created,
+                "tools": [{"name": "mmlb"}],
+                "component": {
+                    "type": "application",
+                    "bom-ref": self._ref(graph, root),
+                    "name": root.name,
+                    "description": name,
+                },
+            },
+        }
+        self.fp.write(json.dumps(header)[:-1] + ',\n  "components": [')
+        components = _JsonArray(self.fp)
+
+        def write_component(node):
+            if node is root or not self._is_included(node):
+                return
+            component = {
+                "type": "library",
+                "bom-ref": self._ref(graph, node),
+                "name": node.name,
+            }
+            if node.version is not None:
+                component["version"] = node.version
+            component["purl"] = self._purl(graph, node)
+            component["properties"] = [
+                {"name": k, "value": str(v)} for k, v in self._properties(node).items()
+            ]
+            components.append(component)
+
+        graph.traverse(node_func=write_component)
+        components.close()
+
+        self.fp.write(',\n  "dependencies": [')
+        dependencies = _JsonArray(self.fp)
+
+        def write_dependency(node):
+            if node is not root and not self._is_included(node):
+                return
+            dependencies.append(
+                {
+                    "ref": self._ref(graph, node),
+                    "dependsOn": [
+                        self._ref(graph, d)
+                        for d in node.deps
+                        if self._is_included(d) and d is not root
+                    ],
+                }
+            )
+
+        graph.traverse(node_func=write_dependency)
+        dependencies.close()
+        self.fp.write("\n}\n")
+
+    def _write_spdx(self, graph, name, created):
+        root = graph.root_node
+        root_ref = self._ref(graph, root)
+        header = {
+            "spdxVersion": "SPDX-2.3",
+            "dataLicense": "CC0-1.0",
+            "SPDXID": "SPDXRef-DOCUMENT",
+            "name": name,
+            "documentNamespace": f"https://spdx.org/spdxdocs/mmlb-{uuid.uuid4()}",
+            "creationInfo": {"created": created, "creators": ["Tool: mmlb"]},
+            "documentDescribes": [root_ref],
+        }
+        self.fp.write(json.dumps(header)[:-1] + ',\n  "packages": [')
+        packages = _JsonArray(self.fp)
+        packages.append(
+            {
+                "SPDXID": root_ref,
+                "name": root.name,
+                "downloadLocation": "NOASSERTION",
+                "primaryPackagePurpose": "APPLICATION",
+            }
+        )
+
+        def write_package(node):
+            if node is root or not self._is_included(node):
+                return
+            package = {"SPDXID": self._ref(graph, node), "name": node.name}
+            if node.version is not None:
+                package["versionInfo"] = node.version
+            package["downloadLocation"] = "NOASSERTION"
+            package["externalRefs"] = [
+                {
+                    "referenceCategory": "PACKAGE-MANAGER",
+                    "referenceType": "purl",
+                    "referenceLocator": self._purl(graph, node),
+                }
+            ]
+            package["annotations"] = [
+                {
+                    "annotationType": "OTHER",
+                    "annotator": "Tool: mmlb",
+                    "annotationDate": created,
+                    "comment": json.dumps(self._properties(node)),
+                }
+            ]
+            packages.append(package)
+
+        graph.traverse(node_func=write_package)
+        packages.close()
+
+        self.fp.write(',\n  "relationships": [')
+        relationships = _JsonArray(self.fp)
+        relationships.append(
+            {
+                "spdxElementId": "SPDXRef-DOCUMENT",
+                "relationshipType": "DESCRIBES",
+                "relatedSpdxElement": root_ref,
+            }
+        )
+
+        def write_relationships(node):
+            if node is not root and not self._is_included(node):
+                return
+            ref = self._ref(graph, node)
+            for d in node.deps:
+                if self._is_included(d) and d is not root:
+                    relationships.append(
+                        {
+                            "spdxElementId": ref,
+                            "relationshipType": "DEPENDS_ON",
+                            "relatedSpdxElement": self._ref(graph, d),
+                        }
+                    )
+
+        graph.traverse(node_func=write_relationships)
+        relationships.close()
+        self.fp.write("\n}\n")
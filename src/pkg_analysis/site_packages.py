@@ -0,0 +1,341 @@
+import csv
+import logging
+import posixpath
+import re
+
+from packaging.markers import default_environment
+from packaging.requirements import InvalidRequirement, Requirement
+
+# site-packages dirs in the order python searches them, so that the first
+# distribution found for a name is the one `pip list` reports
+SITE_PACKAGES_PATTERNS = [
+    "/usr/local/lib/python*/site-packages",
+    "/usr/local/lib/python*/dist-packages",
+    "/usr/lib/python*/site-packages",
+    "/usr/lib/python*/dist-packages",
+    "/opt/conda/lib/python*/site-packages",
+    "/opt/conda/envs/*/lib/python*/site-packages",
+    "/root/.local/lib/python*/site-packages",
+    "/home/*/.local/lib/python*/site-packages",
+    "/opt/*/lib/python*/site-packages",
+    "/opt/*/lib/python*/dist-packages",
+]
+
+
+def normalize_name(name):
+    # cython == Cython, absl_py == absl-py
+    return name.strip().replace("_", "-").lower()
+
+
+def python_version(location):
+    """
+    Returns:
+        the python version of a site-packages dir, like '3.10' for
+        /usr/local/lib/python3.10/site-packages, None if unknown
+    """
+    m = re.search(r"/python(\d+\.\d+)/", location + "/")
+    return m.group(1) if m else None
+
+
+def marker_environment(version):
+    """
+    Environment to evaluate the markers of requirements for the python
+    version of an image, like 'python_version < "3.8"'. Only the python
+    version is known, the image runs linux.
+    """
+    env = default_environment()
+    env.update(
+        {
+            "implementation_name": "cpython",
+            "platform_python_implementation": "CPython",
+            "os_name": "posix",
+            "sys_platform": "linux",
+            "platform_system": "Linux",
+        }
+    )
+    if version is not None:
+        env["python_version"] = version
+        env["python_full_version"] = version + ".0"
+        env["implementation_version"] = version + ".0"
+    return env
+
+
+def parse_requires_txt(content):
+    """
+    Args:
+        content: requires.txt of an egg-info, like
+            'numpy>=1.17
+
+            [:python_version < "3.8"]
+            typing-extensions
+
+            [testing]
+            pytest'
+
+    Returns:
+        list of requirements in the Requires-Dist form, like
+        'typing-extensions ; (python_version < "3.8")'
+    """
+    requires = []
+    section = ""
+    for line in content.splitlines():
+        line = line.strip()
+        if line == "" or line.startswith("#"):
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            section = line[1:-1]
+            continue
+        extra, _, marker = section.partition(":")
+        markers = []
+        if extra:
+            markers.append(f'extra == "{extra}"')
+        if marker:
+            markers.append(f"({marker})")
+        requires.append(line + (" ; " + " and ".join(markers) if markers else ""))
+    return requires
+
+
+def parse_metadata(content):
+    """
+    Args:
+        content: METADATA or PKG-INFO like
+            'Metadata-Version: 2.1
+            Name: setuptools
+            Version: 63.2.0
+            Summary: Easily download, build, install, upgrade, and uninstall Python packages
+            Requires-Dist: ...
+
+            long description'
+
+    Returns:
+        a dict from header names to the list of their values
+    """
+    headers = {}
+    last = None
+    for line in content.splitlines():
+        if line.strip() == "":
+            break
+        if line[0] in " \t":
+            if last is not None:
+                headers[last][-1] += "\n" + line.strip()
+            continue
+        key, _, value = line.partition(":")
+        last = key.strip()
+        headers.setdefault(last, []).append(value.strip())
+    return headers
+
+
+class PythonDistribution(object):
+    def __init__(self, rootfs, location, info_dir) -> None:
+        """
+        location: site-packages dir, like /usr/local/lib/python3.10/site-packages
+        info_dir: name of the metadata of the distribution in location,
+                  like setuptools-63.2.0.dist-info
+        """
+        self.rootfs = rootfs
+        self.location = location
+        self.info_dir = info_dir
+        self.info_path = posixpath.join(location, info_dir)
+        self.headers = {}
+
+        if info_dir.endswith(".dist-info"):
+            content = rootfs.read_text(posixpath.join(self.info_path, "METADATA"))
+        else:
+            # an egg-info is either a dir or a single PKG-INFO file
+            content = rootfs.read_text(posixpath.join(self.info_path, "PKG-INFO"))
+            if content is None:
+                content = rootfs.read_text(self.info_path)
+        if content is not None:
+            self.headers = parse_metadata(content)
+
+    def _header(self, key):
+        values = self.headers.get(key)
+        if not values:
+            return None
+        return values[0]
+
+    @property
+    def name(self):
+        name = self._header("Name")
+        if name is None:
+            name = self.info_dir.split("-")[0]
+        return normalize_name(name)
+
+    @property
+    def version(self):
+        version = self._header("Version")
+        if version is None:
+            stem = self.info_dir.rsplit(".", 1)[0]
+            version = stem.split("-")[1] if "-" in stem else ""
+        return version
+
+    @property
+    def summary(self):
+        return self._header("Summary")
+
+    def requires(self):
+        """
+        Requires-Dist of the distribution, from requires.txt for an egg-info
+        """
+        if self.info_dir.endswith(".dist-info") or "Requires-Dist" in self.headers:
+            return self.headers.get("Requires-Dist", [])
+        content = self.rootfs.read_text(posixpath.join(self.info_path, "requires.txt"))
+        if content is None:
+            return []
+        return parse_requires_txt(content)
+
+    def dependencies(self, env=None):
+        """
+        Args:
+            env: marker environment, see marker_environment, the one of the
+                python version of location by default
+
+        Returns:
+            normalized names of the required distributions whose markers
+            hold in env, the extras left out
+        """
+        if env is None:
+            env = marker_environment(python_version(self.location))
+        names = []
+        for line in self.requires():
+            try:
+                req = Requirement(line)
+            except InvalidRequirement:
+                logging.warning(f"{self.name}: invalid requirement {line}")
+                continue
+            if req.marker is not None and not req.marker.evaluate(dict(env, extra="")):
+                continue
+            name = normalize_name(req.name)
+            if name not in names:
+                names.append(name)
+        return names
+
+    def _record_files(self):
+        content = self.rootfs.read_text(posixpath.join(self.info_path, "RECORD"))
+        if content is None:
+            return None
+        return [row[0] for row in csv.reader(content.splitlines()) if row]
+
+    def _installed_files(self):
+        content = self.rootfs.read_text(
+            posixpath.join(self.info_path, "installed-files.txt")
+        )
+        if content is None:
+            return None
+        # paths are relative to the egg-info dir, pip shows them relative
+        # to the location
+        files = []
+        for line in content.splitlines():
+            if line.strip() != "":
+                files.append(
+                    posixpath.relpath(
+                        posixpath.normpath(
+                            posixpath.join(self.info_path, line.strip())
+                        ),
+                        self.location,
+                    )
+                )
+        return files
+
+    def _top_level_files(self):
+        """
+        Same as searching `<location>/<top level module>` when pip can't
+        locate RECORD or installed-files.txt
+        """
+        top_levels = []
+        content = self.rootfs.read_text(posixpath.join(self.info_path, "top_level.txt"))
+        if content is not None:
+            top_levels = [l.strip() for l in content.splitlines() if l.strip()]
+        if not top_levels:
+            name = self.name
+            # ugly code, special care for PyYAML package
+            if name == "pyyaml":
+                name = "yaml"
+            top_levels = [name]
+            if "-" in name:
+                top_levels.append(name.replace("-", "_"))
+
+        files = []
+        for top_level in top_levels:
+            for candidate in [top_level, top_level + ".py"]:
+                path = posixpath.join(self.location, candidate)
+                for p in self.rootfs.walk_files(path):
+                    files.append(posixpath.relpath(p, self.location))
+        if not files:
+            logging.error(f"cannot locate files of pip pkg: {self.name}")
+        return files
+
+    def files(self):
+        """
+        Paths of the files relative to location, same as `pip show -f`
+        """
+        files = self._record_files()
+        if files is None:
+            files = self._installed_files()
+        if files is None:
+            files = self._top_level_files()
+        return files
+
+
+def find_site_packages(rootfs):
+    dirs = []
+    resolved_dirs = set()
+    for pattern in SITE_PACKAGES_PATTERNS:
+        for d in rootfs.glob(pattern):
+            # e.g. /usr/local/lib/python3.8/site-packages -> dist-packages
+            resolved = rootfs.resolve(d)
+            if resolved not in resolved_dirs:
+                resolved_dirs.add(resolved)
+                dirs.append(d)
+    return dirs
+
+
+class SitePackages(object):
+    """
+    Python distributions installed in all site-packages dirs of a RootFS.
+    """
+
+    def __init__(self, rootfs) -> None:
+        self.rootfs = rootfs
+        self.dists = {}  # normalized name -> PythonDistribution
+        for location in find_site_packages(rootfs):
+            for info_dir in sorted(rootfs.listdir(location)):
+                if not (
+                    info_dir.endswith(".dist-info") or info_dir.endswith(".egg-info")
+                ):
+                    continue
+                dist = PythonDistribution(rootfs, location, info_dir)
+                self.dists.setdefault(dist.name, dist)
+
+    def python_version(self, location=None):
+        """
+        Python version of location, or of the image if location doesn't
+        tell it, like /usr/lib/python3/dist-packages: the highest version
+        of the python3.X dirs of the standard library.
+        """
+        version = python_version(location) if location is not None else None
+        if version is not None:
+            return version
+        versions = set()
+        for pattern in ["/usr/local/lib/python3.*", "/usr/lib/python3.*"]:
+            for d in self.rootfs.glob(pattern):
+                m = re.fullmatch(r"python(\d+)\.(\d+)", posixpath.basename(d))
+                if m:
+                    versions.add((int(m.group(1)), int(m.group(2))))
+        if not versions:
+            return None
+        return "%d.%d" % max(versions)
+
+    def dependencies(self, dist):
+        """
+        Dependencies of dist evaluated for the python version of its
+        location, see PythonDistribution.dependencies
+        """
+        return dist.dependencies(marker_environment(self.python_version(dist.location)))
+
+    @staticmethod
+    def load(rootfs):
+        """
+        site-packages dirs are scanned once per RootFS
+        """
+        return rootfs.memo("site-packages", lambda: SitePackages(rootfs))
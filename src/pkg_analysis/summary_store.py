@@ -0,0 +1,148 @@
+import json
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    digest TEXT PRIMARY KEY,
+    size_kb REAL,
+    layers TEXT,
+    summaries TEXT NOT NULL DEFAULT '{}',
+    updated REAL
+);
+CREATE TABLE IF NOT EXISTS refs (
+    ref TEXT PRIMARY KEY,
+    digest TEXT NOT NULL
+);
+"""
+
+
+class ImageSummaryStore(object):
+    """
+    Image sizes, layers and derived summaries, stored in a sqlite file and
+    keyed by image digest (the image ID, `sha256:...`). Tags and other
+    references are aliases of a digest, refreshed every time an image is
+    inspected.
+
+    The database is in WAL mode, so any number of analyses can read and
+    write it concurrently, every write is a short transaction.
+
+    Usage:
+        store = ImageSummaryStore('./img_summary.db')
+        store.put('sha256:...', size_kb=1024.0, layers=[...], refs=['tf:1'])
+        store.get('tf:1')['size_kb']
+    """
+
+    # seconds a writer waits for the others before failing
+    BUSY_TIMEOUT = 60
+
+    def __init__(self, path="./img_summary.db") -> None:
+        self.path = path
+        self.conn = sqlite3.connect(
+            path, timeout=self.BUSY_TIMEOUT, isolation_level=None
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _transaction(self):
+        # take the write lock up front, no upgrade deadlocks between writers
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def digest_of(self, ref):
+        """
+        Returns the digest of ref, a digest itself, an image ID or an alias
+        """
+        if ref.startswith("sha256:"):
+            return ref
+        row = self.conn.execute(
+            "SELECT digest FROM refs WHERE ref = ?", (ref,)
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def get(self, ref):
+        """
+        Returns:
+            dict with digest, size_kb, layers and summaries, or None
+        """
+        digest = self.digest_of(ref)
+        if digest is None:
+            return None
+        row = self.conn.execute(
+            "SELECT digest, size_kb, layers, summaries FROM images WHERE digest = ?",
+            (digest,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "digest": row[0],
+            "size_kb": row[1],
+            "layers": json.loads(row[2]) if row[2] is not None else None,
+            "summaries": json.loads(row[3]),
+        }
+
+    def put(self, digest, size_kb=None, layers=None, refs=()):
+        """
+        Insert or update an image, fields left to None are kept
+        """
+        self._transaction()
+        try:
+            self.conn.execute(
+                """
+                INSERT INTO images (digest, size_kb, layers, updated)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(digest) DO UPDATE SET
+                    size_kb = COALESCE(excluded.size_kb, size_kb),
+                    layers = COALESCE(excluded.layers, layers),
+                    updated = excluded.updated
+                """,
+                (
+                    digest,
+                    size_kb,
+                    json.dumps(layers) if layers is not None else None,
+                    time.time(),
+                ),
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO refs (ref, digest) VALUES (?, ?)",
+                [(ref, digest) for ref in refs],
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def put_summary(self, digest, name, summary):
+        """
+        Store a derived summary of the image under name, the other
+        summaries of the image are kept.
+        """
+        self._transaction()
+        try:
+            row = self.conn.execute(
+                "SELECT summaries FROM images WHERE digest = ?", (digest,)
+            ).fetchone()
+            summaries = json.loads(row[0]) if row is not None else {}
+            summaries[name] = summary
+            self.conn.execute(
+                """
+                INSERT INTO images (digest, summaries, updated) VALUES (?, ?, ?)
+                ON CONFLICT(digest) DO UPDATE SET
+                    summaries = excluded.summaries,
+                    updated = excluded.updated
+                """,
+                (digest, json.dumps(summaries), time.time()),
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
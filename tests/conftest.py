@@ -0,0 +1,90 @@
+import hashlib
+import io
+import json
+import os
+import sys
+import tarfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+
+def layer_tar(files):
+    """
+    Args:
+        files: dict path -> content, str for a regular file, None for a dir,
+               ('symlink', target) for a symlink
+
+    Returns:
+        bytes of a tar archive of files
+    """
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for path, content in files.items():
+            info = tarfile.TarInfo(path.lstrip("/"))
+            if content is None:
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            elif isinstance(content, tuple):
+                info.type = tarfile.SYMTYPE
+                info.linkname = content[1]
+                tar.addfile(info)
+            else:
+                data = content.encode()
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def add_bytes(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+
+@pytest.fixture
+def save_tarball(tmp_path):
+    """
+    Factory of `docker save` like tarballs, one layer per dict of files,
+    see layer_tar.
+    """
+
+    def make(layers, name="image.tar", config=True):
+        path = str(tmp_path / name)
+        blobs = [layer_tar(files) for files in layers]
+        layer_names = [f"layer{i}/layer.tar" for i in range(len(blobs))]
+        diff_ids = ["sha256:" + hashlib.sha256(b).hexdigest() for b in blobs]
+        with tarfile.open(path, "w") as tar:
+            manifest = [{"Config": "config.json", "Layers": layer_names}]
+            add_bytes(tar, "manifest.json", json.dumps(manifest).encode())
+            if config:
+                config_json = {"rootfs": {"type": "layers", "diff_ids": diff_ids}}
+                add_bytes(tar, "config.json", json.dumps(config_json).encode())
+            for layer_name, blob in zip(layer_names, blobs):
+                add_bytes(tar, layer_name, blob)
+        return path
+
+    return make
+
+
+@pytest.fixture
+def dir_rootfs(tmp_path):
+    """
+    Factory of directory root filesystems, files as in layer_tar
+    """
+
+    def make(files, name="rootfs"):
+        root = tmp_path / name
+        for path, content in files.items():
+            full = root / path.lstrip("/")
+            full.parent.mkdir(parents=True, exist_ok=True)
+            if content is None:
+                full.mkdir(parents=True, exist_ok=True)
+            elif isinstance(content, tuple):
+                os.symlink(content[1], full)
+            else:
+                full.write_text(content)
+        return str(root)
+
+    return make
@@ -0,0 +1,67 @@
+import json
+
+from pkg_analysis.analyzer import RootfsCondaPkgAnalyzer
+from pkg_analysis.conda_meta import CondaEnvironments, find_conda_prefixes
+from pkg_analysis.rootfs import DirRootFS
+
+
+def meta(name, version, files, extracted_dir=None, depends=()):
+    data = {"name": name, "version": version, "files": files, "depends": depends}
+    if extracted_dir is not None:
+        data["extracted_package_dir"] = extracted_dir
+    return json.dumps(data)
+
+
+ROOTFS_FILES = {
+    "/opt/conda/conda-meta/python-3.10.4-h0.json": meta(
+        "python",
+        "3.10.4",
+        ["bin/python3.10"],
+        extracted_dir="/opt/conda/pkgs/python-3.10.4-h0",
+        depends=["libffi >=3.4"],
+    ),
+    "/opt/conda/conda-meta/history": "",
+    "/opt/conda/conda-meta/broken.json": "{",
+    "/opt/conda/pkgs/python-3.10.4-h0/info/index.json": json.dumps(
+        {"name": "python", "version": "3.10.4"}
+    ),
+    "/opt/conda/pkgs/python-3.10.4-h0/info/about.json": json.dumps(
+        {"summary": "General purpose programming language"}
+    ),
+    "/opt/conda/envs/tf/conda-meta/python-3.8.13-h1.json": meta(
+        "python", "3.8.13", ["bin/python3.8"]
+    ),
+    # extracted but linked into no prefix
+    "/opt/conda/pkgs/zlib-1.2.12-h2/info/index.json": json.dumps(
+        {"name": "zlib", "version": "1.2.12", "depends": ["libgcc-ng >=7.5.0"]}
+    ),
+    "/opt/conda/pkgs/zlib-1.2.12-h2/info/files": "lib/libz.so\ninclude/zlib.h\n",
+    "/opt/conda/pkgs/urls.txt": "",
+}
+
+
+def test_find_conda_prefixes(dir_rootfs):
+    rootfs = DirRootFS(dir_rootfs(ROOTFS_FILES))
+    assert find_conda_prefixes(rootfs) == (
+        ["/opt/conda"],
+        ["/opt/conda", "/opt/conda/envs/tf"],
+    )
+
+
+def test_records_of_prefixes_and_pkgs_dirs(dir_rootfs):
+    rootfs = DirRootFS(dir_rootfs(ROOTFS_FILES))
+    envs = CondaEnvironments.load(rootfs)
+    assert CondaEnvironments.load(rootfs) is envs
+    assert [(r.name, r.version, r.location) for r in envs.records] == [
+        ("python", "3.10.4", "/opt/conda"),
+        ("python", "3.8.13", "/opt/conda/envs/tf"),
+        ("zlib", "1.2.12", "/opt/conda/pkgs/zlib-1.2.12-h2"),
+    ]
+    python, _, zlib = envs.records
+    assert python.summary == "General purpose programming language"
+    assert python.depends == ["libffi >=3.4"]
+    assert zlib.files == ["lib/libz.so", "include/zlib.h"]
+    assert zlib.depends == ["libgcc-ng >=7.5.0"]
+
+    pkgs = RootfsCondaPkgAnalyzer(rootfs).list_pkgs()
+    assert [envs.get(p) for p in pkgs] == envs.records
@@ -0,0 +1,54 @@
+import pytest
+
+from pkg_analysis.dependency_graph import PipDependencyGraph, PipGraphNode
+from pkg_analysis.rootfs import DirRootFS, TarRootFS
+
+
+def pip_graph(edges):
+    graph = PipDependencyGraph()
+    table = {}
+    for name in ["d", "b", "c", "a"]:
+        table[name + "_1"] = PipGraphNode(name, "1")
+        graph._node_id(table[name + "_1"])
+    for src, dst in edges:
+        graph._add_edge(table[src + "_1"], table[dst + "_1"])
+    return graph, table
+
+
+def test_uncovered_skips_dependencies_of_a_cycle():
+    # b and c require each other, c requires d
+    graph, table = pip_graph([("b", "c"), ("c", "b"), ("c", "d")])
+    ids = [table[k].id for k in ["d_1", "b_1", "c_1"]]
+    assert [str(n) for n in graph._uncovered(ids)] == ["b_1"]
+
+
+def test_infer_project_deps_with_a_cycle():
+    # a requires b, b and c require each other, c requires d
+    graph, table = pip_graph([("a", "b"), ("b", "c"), ("c", "b"), ("c", "d")])
+    assert graph._infer_project_deps(table, None) == [("a", "1")]
+    accessed = [("d", "1"), ("c", "1"), ("b", "1")]
+    assert graph._infer_project_deps(table, accessed) == [("b", "1")]
+
+
+SITE_PACKAGES = "/usr/local/lib/python3.10/site-packages"
+
+EGG_INFO_FILES = {
+    f"{SITE_PACKAGES}/foo-1.0.egg-info/PKG-INFO": "Name: foo\nVersion: 1.0\n",
+    f"{SITE_PACKAGES}/foo-1.0.egg-info/requires.txt": "bar>=2\n\n[test]\npytest\n",
+    f"{SITE_PACKAGES}/bar-2.0.dist-info/METADATA": "Name: bar\nVersion: 2.0\n",
+}
+
+
+def site_packages_deps(rootfs):
+    graph = PipDependencyGraph(rootfs=rootfs)
+    table = graph._pase_site_packages()
+    return {key: sorted(str(d) for d in node.deps) for key, node in table.items()}
+
+
+@pytest.mark.parametrize("kind", ["dir", "tar"])
+def test_egg_info_requires(kind, dir_rootfs, save_tarball):
+    if kind == "dir":
+        rootfs = DirRootFS(dir_rootfs(EGG_INFO_FILES))
+    else:
+        rootfs = TarRootFS(save_tarball([EGG_INFO_FILES]))
+    assert site_packages_deps(rootfs) == {"foo_1.0": ["bar_2.0"], "bar_2.0": []}
@@ -0,0 +1,112 @@
+from pkg_analysis.analyzer import RootfsAptPkgAnalyzer
+from pkg_analysis.dpkg import (
+    DpkgDatabase,
+    parse_control,
+    parse_os_release,
+    parse_relations,
+)
+from pkg_analysis.package_file import RootfsAptPkgFileFiller
+from pkg_analysis.rootfs import DirRootFS
+
+DPKG_STATUS = """\
+Package: libc6
+Status: install ok installed
+Architecture: amd64
+Multi-Arch: same
+Version: 2.35-0ubuntu3
+Installed-Size: 13000
+Description: GNU C Library: Shared libraries
+ Contains the standard libraries that are used by nearly all programs on
+ the system.
+
+Package: mawk
+Status: install ok installed
+Architecture: amd64
+Version: 1.3.4
+Provides: awk
+Pre-Depends: libc6 (>= 2.34)
+
+Package: adduser
+Status: install ok installed
+Architecture: all
+Version: 3.118ubuntu5
+Depends: passwd, debconf (>= 0.5) | debconf-2.0, awk:any, adduser
+
+Package: passwd
+Status: deinstall ok config-files
+Version: 1:4.8.1-2ubuntu2
+
+Package: debconf
+Status: install ok installed
+Version: 1.5.79ubuntu1
+"""
+
+ROOTFS_FILES = {
+    "/var/lib/dpkg/status": DPKG_STATUS,
+    "/var/lib/dpkg/info/libc6:amd64.list": "/.\n/usr/lib\n/lib/libc.so.6\n",
+    "/var/lib/dpkg/info/mawk.list": "/usr/bin/mawk\n/usr/bin/awk\n",
+    "/usr/lib/libc.so.6": "x" * 2048,
+    "/lib": ("symlink", "usr/lib"),
+    "/usr/bin/mawk": "x" * 1024,
+    "/usr/bin/awk": ("symlink", "mawk"),
+}
+
+
+def test_parse_control():
+    paragraphs = parse_control(DPKG_STATUS)
+    assert [p["Package"] for p in paragraphs] == [
+        "libc6",
+        "mawk",
+        "adduser",
+        "passwd",
+        "debconf",
+    ]
+    assert paragraphs[0]["Description"].split("\n") == [
+        "GNU C Library: Shared libraries",
+        "Contains the standard libraries that are used by nearly all programs on",
+        "the system.",
+    ]
+
+
+def test_parse_relations():
+    assert parse_relations(
+        "libc6 (>= 2.14), debconf (>= 0.5) | debconf-2.0, python3:any, "
+        "gcc [amd64] <!nocheck>"
+    ) == [["libc6"], ["debconf", "debconf-2.0"], ["python3"], ["gcc"]]
+    assert parse_relations("") == []
+
+
+def test_parse_os_release():
+    assert parse_os_release('# comment\nID=ubuntu\nNAME="Ubuntu"\n') == {
+        "ID": "ubuntu",
+        "NAME": "Ubuntu",
+    }
+
+
+def test_installed_packages_and_depends(dir_rootfs):
+    db = DpkgDatabase(DirRootFS(dir_rootfs(ROOTFS_FILES)))
+    assert db.names() == ["libc6", "mawk", "adduser", "debconf"]
+    assert db.installed_size("libc6") == 13000.0
+    assert db.installed_size("mawk") is None
+    assert db.summary("libc6") == "GNU C Library: Shared libraries"
+    assert db.arch("mawk") == "amd64"
+    assert db.depends("mawk") == ["libc6"]
+    # passwd isn't installed, awk is provided by mawk, itself is skipped
+    assert db.depends("adduser") == ["debconf", "mawk"]
+
+
+def test_list_files(dir_rootfs):
+    rootfs = DirRootFS(dir_rootfs(ROOTFS_FILES))
+    db = DpkgDatabase.load(rootfs)
+    assert DpkgDatabase.load(rootfs) is db
+    assert db.list_files("libc6") == ["/.", "/usr/lib", "/lib/libc.so.6"]
+    assert db.list_files("debconf") == []
+
+    pkgs = RootfsAptPkgAnalyzer(rootfs).list_pkgs()
+    files = {
+        p.name: sorted((f.name, f.size) for f in pkg_files)
+        for p, pkg_files in RootfsAptPkgFileFiller(rootfs).iter_files(pkgs)
+    }
+    # dirs are left out, links are kept
+    assert files["libc6"] == [("/lib/libc.so.6", 2.0)]
+    assert files["mawk"] == [("/usr/bin/awk", 1.0), ("/usr/bin/mawk", 1.0)]
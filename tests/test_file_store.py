@@ -0,0 +1,78 @@
+import os
+
+from common.file_store import FileStore, PathTable
+from image_diff.diff import ImageFile, diff_dirs
+from pkg_analysis.package import PkgFile
+
+PATHS = ["/usr/bin/b", "/usr/bin/a", "/etc/z", "/usr/bin-x/a", "/x\udcff"]
+
+
+def store_of(paths, table=None):
+    store = FileStore(PkgFile, paths=table)
+    for i, path in enumerate(paths):
+        store.append(path, float(i), owner=i % 2)
+    return store
+
+
+def test_records_round_trip():
+    store = store_of(PATHS)
+    assert len(store) == len(PATHS)
+    assert [f.name for f in store] == PATHS
+    assert [store.size(i) for i in range(len(store))] == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert store.owner(3) == 1
+    assert store.name(4) == b"x\xff"
+    # directories are interned
+    assert len(store.paths) == 4
+
+
+def test_shared_path_table():
+    table = PathTable()
+    store_of(["/usr/bin/a"], table)
+    store_of(["/usr/bin/b", "/opt/c"], table)
+    assert table.dirs == ["/usr/bin/", "/opt/"]
+
+
+def test_sorted_indices_and_views():
+    store = store_of(PATHS)
+    order = store.sorted_indices()
+    assert [store.path(i) for i in order] == [
+        "/x\udcff",
+        "/etc/z",
+        "/usr/bin-x/a",
+        "/usr/bin/a",
+        "/usr/bin/b",
+    ]
+    assert [store.sort_key(i) for i in order] == sorted(
+        store.sort_key(i) for i in range(len(store))
+    )
+
+    view = store.view(1, 3)
+    assert [f.name for f in view] == ["/usr/bin/a", "/etc/z"]
+    assert view[1].size == 2.0
+    assert view.total_size() == 3.0
+    assert [f.name for f in store.select([4, 0])] == ["/x\udcff", "/usr/bin/b"]
+
+
+def write_tree(root, files):
+    for path, size in files.items():
+        full = os.path.join(root, path)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        with open(full, "wb") as f:
+            f.write(b"x" * size)
+
+
+def test_diff_dirs(tmp_path):
+    dir0, dir1 = str(tmp_path / "0"), str(tmp_path / "1")
+    write_tree(dir0, {"bin/a": 1, "bin/b": 2048, "lib/c": 1, "etc/only0": 1})
+    write_tree(dir1, {"bin/a": 3000, "bin/b": 1, "lib/c": 1, "lib/d/only1": 1})
+
+    only0, common, only1 = diff_dirs(dir0, dir1)
+    assert [(f.name, f.size) for f in only0] == [("/etc/only0", 1)]
+    # sizes of the common files are the ones in dir0
+    assert [(f.name, f.size) for f in common] == [
+        ("/bin/a", 1),
+        ("/bin/b", 2),
+        ("/lib/c", 1),
+    ]
+    assert [f.name for f in only1] == ["/lib/d/only1"]
+    assert all(isinstance(f, ImageFile) for f in only1)
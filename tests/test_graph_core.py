@@ -0,0 +1,92 @@
+import random
+
+import numpy as np
+
+from pkg_analysis.graph_core import GraphCore
+
+
+def graph(n, edges):
+    core = GraphCore()
+    for i in range(n):
+        core.add_node(i)
+    for src, dst in edges:
+        core.add_edge(src, dst)
+    return core
+
+
+# 0 -> 1 -> 2 <-> 3 -> 4, 0 -> 5 -> 4
+EDGES = [(0, 1), (1, 2), (2, 3), (3, 2), (3, 4), (0, 5), (5, 4)]
+
+
+def test_duplicate_edges_and_csr():
+    core = graph(3, [(0, 1), (0, 2)])
+    assert not core.add_edge(0, 1)
+    assert core.num_edges() == 2
+    assert list(core.successors(0)) == [1, 2]
+    assert list(core.predecessors(2)) == [0]
+
+
+def test_bfs_depth_and_parent():
+    order, depth, parent = graph(6, EDGES).bfs(0)
+    assert list(order) == [0, 1, 5, 2, 4, 3]
+    assert depth[4] == 2 and parent[4] == 5
+    assert list(graph(6, EDGES).reachable(2, reverse=True)) == [1, 1, 1, 1, 0, 0]
+
+
+def test_strongly_connected_components():
+    comp, num = graph(6, EDGES).strongly_connected_components()
+    assert num == 5
+    assert comp[2] == comp[3]
+    # successors have smaller component ids
+    for src, dst in EDGES:
+        assert comp[src] >= comp[dst]
+
+
+def test_topological_order():
+    order = list(graph(6, EDGES).topological_order())
+    assert sorted(order) == list(range(6))
+    position = {v: i for i, v in enumerate(order)}
+    for src, dst in EDGES:
+        if {src, dst} != {2, 3}:
+            assert position[src] < position[dst]
+    assert abs(position[2] - position[3]) == 1
+
+
+def test_dominators():
+    idom, postorder = graph(6, EDGES).dominators(0)
+    assert list(idom) == [0, 0, 1, 2, 0, 0]
+    assert postorder[-1] == 0
+    idom, _ = graph(7, EDGES).dominators(0)
+    assert idom[6] == -1
+
+
+def test_dominated_and_closure_sums():
+    core = graph(6, EDGES)
+    values = np.arange(1, 7, dtype=float).reshape(6, 1) * [1, 10]
+    # 4 is reached through 3 and through 5, it is only dominated by 0
+    assert core.dominated_sums(0, values)[:, 0].tolist() == [21, 9, 7, 4, 5, 6]
+    assert core.closure_sums(values)[:, 0].tolist() == [21, 14, 12, 12, 5, 11]
+    assert core.closure_sums(values)[:, 1].tolist() == [210, 140, 120, 120, 50, 110]
+
+
+def brute_closure_sums(core, values):
+    return np.array(
+        [
+            values[np.array(core.reachable(v), dtype=bool)].sum(axis=0)
+            for v in range(len(core))
+        ]
+    )
+
+
+def test_closure_sums_of_random_graphs():
+    rand = random.Random(0)
+    for _ in range(20):
+        n = rand.randrange(1, 40)
+        edges = [
+            (rand.randrange(n), rand.randrange(n)) for _ in range(rand.randrange(3 * n))
+        ]
+        core = graph(n, edges)
+        values = np.array([[rand.randrange(100)] for _ in range(n)], dtype=float)
+        assert np.array_equal(
+            core.closure_sums(values), brute_closure_sums(core, values)
+        )
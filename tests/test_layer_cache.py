@@ -0,0 +1,81 @@
+import hashlib
+import os
+
+from pkg_analysis.layer_cache import ANALYZER_VERSION, LayerCache, chain_ids
+from pkg_analysis.rootfs import METADATA_PATTERNS, TarRootFS
+
+
+def test_chain_ids():
+    a, b = "sha256:" + "a" * 64, "sha256:" + "b" * 64
+    expected = "sha256:" + hashlib.sha256(f"{a} {b}".encode()).hexdigest()
+    assert chain_ids([a, b]) == [a, expected]
+
+
+def make_cache_dir(cache_dir, name, files=()):
+    path = os.path.join(cache_dir, name)
+    os.makedirs(path)
+    for file_name in files:
+        with open(os.path.join(path, file_name), "wb") as f:
+            f.write(b"x" * 100)
+    return path
+
+
+def test_only_older_versions_are_dropped(tmp_path):
+    cache_dir = str(tmp_path)
+    old = make_cache_dir(cache_dir, f"v{ANALYZER_VERSION - 1}-{'0' * 12}")
+    newer = make_cache_dir(cache_dir, f"v{ANALYZER_VERSION + 1}-{'0' * 12}")
+    other_patterns = make_cache_dir(cache_dir, f"v{ANALYZER_VERSION}-{'1' * 12}")
+    unrelated = make_cache_dir(cache_dir, "v1-not-a-cache")
+
+    cache = LayerCache(cache_dir, patterns=["/a"])
+    assert sorted(os.listdir(cache_dir)) == sorted(
+        os.path.basename(p) for p in [newer, other_patterns, unrelated, cache.path]
+    )
+    assert not os.path.exists(old)
+
+
+def test_eviction_covers_every_patterns_dir(tmp_path):
+    cache_dir = str(tmp_path)
+    other_patterns = make_cache_dir(
+        cache_dir, f"v{ANALYZER_VERSION}-{'1' * 12}", ["sha256_old.json.gz"]
+    )
+    newer = make_cache_dir(
+        cache_dir, f"v{ANALYZER_VERSION + 1}-{'0' * 12}", ["sha256_newer.json.gz"]
+    )
+    old_file = os.path.join(other_patterns, "sha256_old.json.gz")
+    os.utime(old_file, (0, 0))
+
+    cache = LayerCache(cache_dir, max_bytes=100, patterns=["/a"])
+    cache.put("sha256:l1", {"entries": {}})
+    assert not os.path.exists(old_file)
+    assert cache.get("sha256:l1") == {"entries": {}}
+    # the caches of newer analyzers are theirs to evict
+    assert os.listdir(newer) == ["sha256_newer.json.gz"]
+
+
+def test_broken_layer_is_dropped(tmp_path):
+    cache = LayerCache(str(tmp_path), patterns=["/a"])
+    with open(cache._file("sha256:l1"), "wb") as f:
+        f.write(b"not gzip")
+    assert cache.get("sha256:l1") is None
+    assert not os.path.exists(cache._file("sha256:l1"))
+
+
+def test_tar_layers_are_read_once(tmp_path, save_tarball, monkeypatch):
+    cache = LayerCache(str(tmp_path / "cache"), patterns=METADATA_PATTERNS)
+    base = {"/var/lib/dpkg/status": "Package: a\n", "/etc/a.conf": "a"}
+    first = save_tarball([base, {"/etc/b.conf": "b"}], name="first.tar")
+    second = save_tarball([base, {"/etc/.wh.a.conf": ""}], name="second.tar")
+    TarRootFS(first, layer_cache=cache)
+
+    read = []
+    read_layer = TarRootFS._read_layer
+    monkeypatch.setattr(
+        TarRootFS,
+        "_read_layer",
+        lambda self, tar: read.append(1) or read_layer(self, tar),
+    )
+    rootfs = TarRootFS(second, layer_cache=cache)
+    assert len(read) == 1
+    assert rootfs.read_text("/var/lib/dpkg/status") == "Package: a\n"
+    assert not rootfs.exists("/etc/a.conf")
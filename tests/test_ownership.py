@@ -0,0 +1,129 @@
+import json
+import os
+
+import pandas as pd
+
+from pkg_analysis.dependency_graph import AptDependencyGraph, PipDependencyGraph
+from pkg_analysis.ownership import OwnershipIndex, normalize_paths
+from pkg_analysis.rootfs import DirRootFS
+
+
+def files_table(rows):
+    return pd.DataFrame(
+        rows,
+        columns=["path", "size(KB)", "package", "version", "package_type", "container"],
+    )
+
+
+def test_normalize_paths(dir_rootfs):
+    rootfs = DirRootFS(dir_rootfs({"/usr/lib": None, "/lib": ("symlink", "usr/lib")}))
+    paths = pd.Series(["/usr/lib/python3/../../bin/tqdm", "/lib/x.so", "/etc//a"])
+    assert normalize_paths(paths).tolist() == ["/usr/bin/tqdm", "/lib/x.so", "/etc/a"]
+    assert normalize_paths(paths, rootfs).tolist() == [
+        "/usr/bin/tqdm",
+        "/usr/lib/x.so",
+        "/etc/a",
+    ]
+
+
+def test_owners_of_shared_paths():
+    index = OwnershipIndex.build(
+        files_table(
+            [
+                ["/usr/lib/a.so", 4.0, "liba", "1", "apt", "c"],
+                ["/usr/lib/./a.so", 4.0, "liba-dev", "1", "apt", "c"],
+                ["/usr/bin/b", 1.0, "b", "2", "apt", "c"],
+            ]
+        )
+    )
+    owners = index.owners(["/usr/lib/a.so", "/nowhere"], ["package"])
+    assert sorted(owners["package"].astype(str)) == ["liba", "liba-dev"]
+    assert set(owners.index) == {"/usr/lib/a.so"}
+
+
+def test_load_or_build_follows_the_table(tmp_path):
+    path = str(tmp_path / "files.csv")
+    files_table([["/a", 1.0, "a", "1", "apt", "c"]]).to_csv(path, index=False)
+    assert OwnershipIndex.load_or_build(path).table["path"].tolist() == ["/a"]
+    assert os.path.exists(OwnershipIndex.cache_path(path))
+
+    # same size and mtime, other content
+    st = os.stat(path)
+    files_table([["/b", 1.0, "a", "1", "apt", "c"]]).to_csv(path, index=False)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert OwnershipIndex.load_or_build(path).table["path"].tolist() == ["/b"]
+
+
+def grype_match(cve, severity, artifact_type, name, version, paths):
+    return {
+        "vulnerability": {"id": cve, "severity": severity},
+        "artifact": {
+            "type": artifact_type,
+            "name": name,
+            "version": version,
+            "locations": [{"path": p} for p in paths],
+        },
+    }
+
+
+def test_grype_matches_are_attributed_by_location():
+    index = OwnershipIndex.build(
+        files_table(
+            [
+                [
+                    "/usr/lib/python3/dist-packages/numpy/core.so",
+                    9.0,
+                    "python3-numpy",
+                    "1:1.21",
+                    "apt",
+                    "c",
+                ],
+                [
+                    "/usr/local/lib/python3.10/site-packages/six.py",
+                    1.0,
+                    "six",
+                    "1.16",
+                    "pip",
+                    "c",
+                ],
+            ]
+        )
+    )
+    grype_json = json.dumps(
+        {
+            "matches": [
+                # a python artifact installed by apt goes to its deb
+                grype_match(
+                    "CVE-1",
+                    "High",
+                    "python",
+                    "numpy",
+                    "1.21",
+                    ["/usr/lib/python3/dist-packages/numpy/core.so"],
+                ),
+                grype_match(
+                    "CVE-2",
+                    "Low",
+                    "python",
+                    "six",
+                    "1.16",
+                    ["/usr/local/lib/python3.10/site-packages/six.py"],
+                ),
+                # no owner, attributed by artifact name
+                grype_match(
+                    "CVE-3", "Medium", "deb", "libc6", "2.35", ["/var/lib/dpkg/status"]
+                ),
+            ]
+        }
+    )
+
+    apt = AptDependencyGraph("img", [])._parse_grpye_json(grype_json, index)
+    assert sorted(map(tuple, apt.values.tolist())) == [
+        ("libc6", "2.35", "Medium"),
+        ("python3-numpy", "1:1.21", "High"),
+    ]
+    pip = PipDependencyGraph()._parse_grpye_json(grype_json, index)
+    assert pip.values.tolist() == [["six", "1.16", "Low"]]
+    # without the index, artifacts are matched by name and type
+    pip = PipDependencyGraph()._parse_grpye_json(grype_json)
+    assert sorted(pip["package"]) == ["numpy", "six"]
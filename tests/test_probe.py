@@ -0,0 +1,127 @@
+import io
+import json
+import os
+
+import pytest
+
+from pkg_analysis import inventory_probe, probe
+from pkg_analysis.dpkg import DPKG_STATUS_PATH
+from pkg_analysis.probe import NO_PYTHON3, ProbeError, ProbeRootFS
+
+
+class FakeContainer(object):
+    id = "c1"
+    removed = False
+
+    def remove(self, force=False):
+        self.removed = True
+
+
+class FakeAPI(object):
+    def __init__(self, chunks, exit_code):
+        self.chunks = chunks
+        self.exit_code = exit_code
+        self.cmds = []
+
+    def exec_create(self, container, cmd):
+        self.cmds.append(cmd)
+        return {"Id": "e1"}
+
+    def exec_start(self, exec_id, stream=False, demux=False):
+        assert stream and demux
+        return iter(self.chunks)
+
+    def exec_inspect(self, exec_id):
+        return {"ExitCode": self.exit_code}
+
+
+class FakeClient(object):
+    def __init__(self, chunks, exit_code=0):
+        self.api = FakeAPI(chunks, exit_code)
+        self.container = FakeContainer()
+        self.containers = self
+
+    def run(self, image, cmd, **kwargs):
+        return self.container
+
+
+def probe_rootfs(monkeypatch, chunks, exit_code=0):
+    client = FakeClient(chunks, exit_code)
+    monkeypatch.setattr(probe.docker, "from_env", lambda: client)
+    return client, lambda: ProbeRootFS("img")
+
+
+def test_records_are_streamed_from_the_exec(monkeypatch):
+    records = [
+        ["e", "/var", "d", 4096, None],
+        ["e", "/var/lib/dpkg/status", "f", 9, None],
+        ["c", "/var/lib/dpkg/status", "Package: a\udcff"],
+        ["e", "/bin", "l", 7, "usr/bin"],
+        ["end", 3],
+    ]
+    out = "".join(json.dumps(r) + "\n" for r in records).encode()
+    # lines split across the chunks, stderr in between
+    chunks = [(out[:10], None), (None, b"warning\n"), (out[10:], None)]
+    client, make = probe_rootfs(monkeypatch, chunks)
+
+    rootfs = make()
+    assert rootfs.read_file(DPKG_STATUS_PATH) == "Package: a\udcff".encode(
+        "utf-8", "surrogateescape"
+    )
+    assert rootfs.lstat("/bin").linkname == "usr/bin"
+    assert rootfs.exists("/var/lib/dpkg")
+    assert client.container.removed
+
+
+def test_truncated_output(monkeypatch):
+    _, make = probe_rootfs(monkeypatch, [(b'["e", "/a", "f", 1, null]\n', None)])
+    with pytest.raises(ProbeError, match="truncated"):
+        make()
+
+
+def test_image_without_python3(monkeypatch):
+    client, make = probe_rootfs(monkeypatch, [], exit_code=NO_PYTHON3)
+    with pytest.raises(ProbeError, match="python3 is not found"):
+        make()
+    assert "python3" in client.api.cmds[0][-1]
+    assert client.container.removed
+
+
+def confined_skipped_dirs(root):
+    """
+    Every sibling of root and of its ancestors, so the probe only walks
+    root and the dirs leading to it
+    """
+    skipped = []
+    path = str(root)
+    while path != "/":
+        parent = os.path.dirname(path)
+        for name in os.listdir(parent):
+            sibling = os.path.join(parent, name)
+            if sibling != path:
+                skipped.append(sibling)
+        path = parent
+    return skipped
+
+
+def test_inventory_probe(tmp_path):
+    root = tmp_path / "probe"
+    (root / "var/lib/dpkg").mkdir(parents=True)
+    (root / "var/lib/dpkg/status").write_text("Package: a\n")
+    (root / "bin").symlink_to("usr/bin")
+    os.mkdir(os.fsencode(str(root / "odd")) + b"\xff")
+
+    out = io.StringIO()
+    inventory_probe.probe(["*/dpkg/status"], confined_skipped_dirs(root), out)
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    prefix = str(root)
+    entries = {
+        r[1][len(prefix) :]: r[2:]
+        for r in records
+        if r[0] == "e" and r[1].startswith(prefix + "/")
+    }
+    assert entries["/bin"] == ["l", len("usr/bin"), "usr/bin"]
+    assert entries["/var/lib/dpkg/status"][0] == "f"
+    assert entries["/odd\udcff"][0] == "d"
+    assert ["c", prefix + "/var/lib/dpkg/status", "Package: a\n"] in records
+    assert records[-1] == ["end", sum(r[0] == "e" for r in records)]
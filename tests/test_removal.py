@@ -0,0 +1,82 @@
+import pandas as pd
+
+from pkg_analysis.dependency_graph import PipDependencyGraph, PipGraphNode
+
+
+def pip_graph(edges, names):
+    """
+    edges: (src, dst) package names, "app" is the root
+    """
+    graph = PipDependencyGraph()
+    table = {"app": graph.root_node}
+    for name in names:
+        table[name] = PipGraphNode(name, "1")
+        graph._node_id(table[name])
+    for src, dst in edges:
+        graph._add_edge(table[src], table[dst])
+    return graph, table
+
+
+def files_table(rows):
+    return pd.DataFrame(
+        [[path, size, package, "1", "pip"] for path, size, package in rows],
+        columns=["path", "size(KB)", "package", "version", "package_type"],
+    )
+
+
+# app requires a and b, both require c; z is installed but unused
+EDGES = [("app", "a"), ("app", "b"), ("a", "c"), ("b", "c")]
+FILES = files_table(
+    [
+        ["/a.py", 1.0, "a"],
+        ["/b.py", 2.0, "b"],
+        ["/c.py", 4.0, "c"],
+        ["/shared.so", 8.0, "a"],
+        ["/shared.so", 8.0, "b"],
+        ["/vendored.so", 16.0, "b"],
+        ["/vendored.so", 16.0, "z"],
+    ]
+)
+
+
+def simulator():
+    graph, table = pip_graph(EDGES, ["a", "b", "c", "z"])
+    return graph.removal_simulator(FILES), table
+
+
+def names(result):
+    return sorted(n.name for n in result.removed)
+
+
+def test_shared_file_is_freed_with_its_last_owner():
+    sim, table = simulator()
+    result = sim.simulate([table["a"]])
+    assert names(result) == ["a"]
+    assert result.size == 1.0
+
+    result = sim.simulate([table["a"], table["b"]])
+    assert names(result) == ["a", "b", "c"]
+    assert result.size == 1.0 + 2.0 + 4.0 + 8.0 + 16.0
+
+
+def test_removals_are_kept():
+    sim, table = simulator()
+    assert sim.remove([table["a"]]).size == 1.0
+    result = sim.remove([table["b"]])
+    assert names(result) == ["b", "c"]
+    assert result.size == 2.0 + 4.0 + 8.0 + 16.0
+    assert sim.simulate([table["b"]]).removed == []
+
+
+def test_unused_owners_keep_no_file():
+    # z isn't reached from the root, /vendored.so goes away with b
+    sim, table = simulator()
+    assert sim.simulate([table["b"]]).size == 2.0 + 16.0
+    assert sim.simulate([table["z"]]).removed == []
+
+
+def test_best_removals():
+    sim, table = simulator()
+    chosen = sim.best_removals(2)
+    assert [n.name for n, _ in chosen] == ["b", "a"]
+    assert [r.size for _, r in chosen] == [18.0, 1.0 + 4.0 + 8.0]
@@ -0,0 +1,86 @@
+import pytest
+
+from conftest import layer_tar
+from pkg_analysis.rootfs import DIR, FILE, LINK, DirRootFS, TarRootFS, open_rootfs
+
+FILES = {
+    "/usr/lib/x86_64-linux-gnu/libz.so.1": "z",
+    "/usr/lib/python3/dist-packages/six.py": "six",
+    "/lib": ("symlink", "usr/lib"),
+    "/usr/bin/python3": ("symlink", "/usr/bin/python3.10"),
+    "/usr/bin/python3.10": "elf",
+    "/etc/loop": ("symlink", "loop"),
+    "/var/lib/dpkg/status": "Package: zlib1g\n",
+}
+
+
+@pytest.fixture(params=["dir", "export", "save"])
+def rootfs(request, dir_rootfs, save_tarball, tmp_path):
+    if request.param == "dir":
+        return DirRootFS(dir_rootfs(FILES))
+    if request.param == "export":
+        path = tmp_path / "export.tar"
+        path.write_bytes(layer_tar(FILES))
+        return open_rootfs(str(path))
+    return open_rootfs(save_tarball([FILES]))
+
+
+def test_symlinks_resolve_inside_the_image(rootfs):
+    assert rootfs.resolve("/lib/x86_64-linux-gnu/libz.so.1") == (
+        "/usr/lib/x86_64-linux-gnu/libz.so.1"
+    )
+    assert rootfs.resolve("/usr/bin/python3") == "/usr/bin/python3.10"
+    assert rootfs.lstat("/lib").kind == LINK
+    assert rootfs.lstat("/lib/x86_64-linux-gnu").kind == DIR
+    assert rootfs.lstat("/usr/bin/python3.10").kind == FILE
+    assert rootfs.resolve("/etc/loop") is None
+    assert not rootfs.exists("/nowhere")
+
+
+def test_metadata_contents(rootfs):
+    assert rootfs.read_text("/var/lib/dpkg/status") == "Package: zlib1g\n"
+    assert rootfs.read_text("/nowhere") is None
+
+
+def test_glob_and_walk(rootfs):
+    assert rootfs.glob("/usr/lib/python3*/dist-packages") == [
+        "/usr/lib/python3/dist-packages"
+    ]
+    assert rootfs.glob("/lib/*-linux-gnu") == ["/lib/x86_64-linux-gnu"]
+    assert sorted(rootfs.walk_files("/usr/bin")) == [
+        "/usr/bin/python3",
+        "/usr/bin/python3.10",
+    ]
+    # /lib is a link, its target isn't walked
+    assert list(rootfs.walk_files("/lib")) == ["/lib"]
+
+
+def test_tar_keeps_only_metadata_contents(tmp_path):
+    path = tmp_path / "export.tar"
+    path.write_bytes(layer_tar(FILES))
+    rootfs = TarRootFS(str(path))
+    assert rootfs.read_file("/usr/bin/python3.10") is None
+    assert rootfs.lstat("/usr/bin/python3.10").size == 3
+
+
+def test_layers_and_whiteouts(save_tarball):
+    lower = {
+        "/etc/a.conf": "a",
+        "/etc/b.conf": "b",
+        "/opt/app/old.py": "old",
+        "/opt/app/lib/old.so": "old",
+        "/var/lib/dpkg/status": "Package: old\n",
+    }
+    upper = {
+        "/etc/.wh.a.conf": "",
+        "/opt/app/.wh..wh..opq": "",
+        "/opt/app/new.py": "new",
+        "/var/lib/dpkg/status": "Package: new\n",
+    }
+    rootfs = TarRootFS(save_tarball([lower, upper]))
+    assert not rootfs.exists("/etc/a.conf")
+    assert rootfs.exists("/etc/b.conf")
+    assert sorted(rootfs.listdir("/opt/app")) == ["new.py"]
+    assert not rootfs.exists("/opt/app/lib/old.so")
+    assert rootfs.read_text("/var/lib/dpkg/status") == "Package: new\n"
+    assert rootfs.listdir("/etc") == ["b.conf"]
@@ -0,0 +1,117 @@
+import io
+import json
+
+import pandas as pd
+import pytest
+
+from pkg_analysis.dependency_graph import AptDependencyGraph
+from pkg_analysis.rootfs import DirRootFS
+from pkg_analysis.sbom import SbomWriter
+
+DPKG_STATUS = """\
+Package: curl
+Status: install ok installed
+Architecture: amd64
+Version: 7.81.0-1ubuntu1.4
+Depends: libc6 (>= 2.34), libcurl4 (= 7.81.0-1ubuntu1.4)
+
+Package: libcurl4
+Status: install ok installed
+Architecture: amd64
+Version: 7.81.0-1ubuntu1.4
+Depends: libc6 (>= 2.34)
+
+Package: libc6
+Status: install ok installed
+Architecture: amd64
+Version: 2.35-0ubuntu3
+"""
+
+ROOTFS_FILES = {
+    "/var/lib/dpkg/status": DPKG_STATUS,
+    "/usr/lib/os-release": 'NAME="Ubuntu"\nVERSION_ID="22.04"\nID=ubuntu\n',
+    "/etc/os-release": ("symlink", "../usr/lib/os-release"),
+}
+
+# bloat_degree is the removed fraction of the size
+BLOAT_DEGREES = pd.DataFrame(
+    [
+        ["curl", "apt", "7.81.0-1ubuntu1.4", 0.5, 400.0],
+        ["libcurl4", "apt", "7.81.0-1ubuntu1.4", 1.0, 800.0],
+        ["libc6", "apt", "2.35-0ubuntu3", 0.25, 12000.0],
+    ],
+    columns=["package", "package_type", "version", "bloat_degree", "size(KB)_total"],
+).set_index(["package", "package_type", "version"])
+
+
+@pytest.fixture
+def apt_graph(dir_rootfs):
+    graph = AptDependencyGraph(
+        "img", ["curl"], rootfs=DirRootFS(dir_rootfs(ROOTFS_FILES))
+    )
+    graph.build(BLOAT_DEGREES)
+    return graph
+
+
+def cyclonedx(graph, is_debloated):
+    f = io.StringIO()
+    SbomWriter(f, "cyclonedx", is_debloated).write(graph)
+    return json.loads(f.getvalue())
+
+
+def properties(component):
+    return {p["name"]: p["value"] for p in component["properties"]}
+
+
+def test_deb_purls_have_the_distro_and_arch(apt_graph):
+    components = {c["name"]: c for c in cyclonedx(apt_graph, False)["components"]}
+    assert (
+        components["libc6"]["purl"] == "pkg:deb/ubuntu/libc6@2.35-0ubuntu3?arch=amd64"
+    )
+
+
+def test_debloated_sbom_keeps_what_is_left(apt_graph):
+    bom = cyclonedx(apt_graph, True)
+    components = {c["name"]: c for c in bom["components"]}
+    assert sorted(components) == ["curl", "libc6"]
+    assert float(properties(components["curl"])["mmlb:size(KB)"]) == 200.0
+    assert float(properties(components["libc6"])["mmlb:size(KB)"]) == 9000.0
+
+    depends_on = {d["ref"]: d["dependsOn"] for d in bom["dependencies"]}
+    curl = components["curl"]["bom-ref"]
+    assert depends_on[curl] == [components["libc6"]["bom-ref"]]
+
+
+def test_spdx_relationships(apt_graph):
+    f = io.StringIO()
+    SbomWriter(f, "spdx").write(apt_graph)
+    doc = json.loads(f.getvalue())
+    names = {p["SPDXID"]: p["name"] for p in doc["packages"]}
+    depends = sorted(
+        (names[r["spdxElementId"]], names[r["relatedSpdxElement"]])
+        for r in doc["relationships"]
+        if r["relationshipType"] == "DEPENDS_ON"
+    )
+    assert depends == [
+        ("app", "curl"),
+        ("curl", "libc6"),
+        ("curl", "libcurl4"),
+        ("libcurl4", "libc6"),
+    ]
+
+
+def test_generate_sbom_sizes_match_the_writer(apt_graph):
+    entries = {
+        e["name"]: e for e in apt_graph.generate_sbom(is_debloated=True)["packages"]
+    }
+    assert sorted(entries) == ["curl", "libc6"]
+    assert entries["curl"]["size"] == 200
+    assert entries["curl"]["dependencies"] == [
+        {
+            "name": "libc6",
+            "version": "2.35-0ubuntu3",
+            "depth": 2,
+            "type": "APT",
+            "size": 9000,
+        }
+    ]
@@ -0,0 +1,72 @@
+import docker
+import pytest
+
+from container import session as session_module
+from container.session import ExecSession, run_in_image
+
+
+class FakeContainer(object):
+    short_id = "c1"
+
+    def __init__(self, results):
+        self.results = results
+        self.cmds = []
+        self.removed = False
+
+    def exec_run(self, cmd, demux=False):
+        assert demux
+        self.cmds.append(cmd)
+        return self.results[cmd]
+
+    def remove(self, force=False):
+        self.removed = True
+
+
+class FakeClient(object):
+    def __init__(self, results):
+        self.containers = self
+        self.results = results
+        self.started = []
+
+    def run(self, image, cmd, **kwargs):
+        self.started.append((image, cmd, kwargs))
+        return FakeContainer(self.results)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = FakeClient(
+        {
+            "apt list --installed": (0, (b"adduser/jammy\n", None)),
+            "false": (1, (None, b"failed\n")),
+            "nope": (127, (b"nope: not found\n", None)),
+        }
+    )
+    monkeypatch.setattr(session_module.docker, "from_env", lambda: client)
+    return client
+
+
+def test_commands_share_one_container(client):
+    with ExecSession("img") as session:
+        assert session.run("apt list --installed") == b"adduser/jammy\n"
+        assert run_in_image(client, "img", "apt list --installed", session) == (
+            b"adduser/jammy\n"
+        )
+        container = session.container
+    assert len(client.started) == 1
+    assert client.started[0][1] == ExecSession.IDLE_CMD
+    assert container.cmds == ["apt list --installed"] * 2
+    assert container.removed
+    assert session.container is None
+
+
+def test_errors(client):
+    session = ExecSession("img")
+    with pytest.raises(docker.errors.ContainerError) as e:
+        session.run("false")
+    assert e.value.exit_status == 1
+    assert e.value.stderr == b"failed\n"
+    with pytest.raises(docker.errors.APIError, match="cannot execute nope"):
+        session.run("nope")
+    session.stop()
+    session.stop()
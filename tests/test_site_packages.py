@@ -0,0 +1,111 @@
+from pkg_analysis.rootfs import DirRootFS
+from pkg_analysis.site_packages import (
+    SitePackages,
+    find_site_packages,
+    marker_environment,
+    parse_metadata,
+    parse_requires_txt,
+    python_version,
+)
+
+LOCAL = "/usr/local/lib/python3.10/site-packages"
+DIST = "/usr/lib/python3/dist-packages"
+
+ROOTFS_FILES = {
+    "/usr/lib/python3.7": None,
+    "/usr/lib/python3.10": None,
+    f"{LOCAL}/Cython-0.29.dist-info/METADATA": (
+        "Metadata-Version: 2.1\n"
+        "Name: Cython\n"
+        "Version: 0.29\n"
+        "Summary: The Cython compiler\n"
+        "Requires-Dist: typing_extensions ; python_version < '3.8'\n"
+        "Requires-Dist: pytest ; extra == 'test'\n"
+        "Requires-Dist: six (>=1.0)\n"
+        "Requires-Dist: six\n"
+        "\n"
+        "Requires-Dist: not a header\n"
+    ),
+    f"{LOCAL}/Cython-0.29.dist-info/RECORD": (
+        "cython.py,sha256=x,10\n"
+        "Cython/__init__.py,,\n"
+        "Cython-0.29.dist-info/METADATA,,\n"
+    ),
+    f"{LOCAL}/six-1.16.0.dist-info/METADATA": "Name: six\nVersion: 1.16.0\n",
+    f"{LOCAL}/six-1.16.0.dist-info/top_level.txt": "six\n",
+    f"{LOCAL}/six.py": "",
+    # shadowed by the one of /usr/local
+    f"{DIST}/six-1.15.0.egg-info": "Name: six\nVersion: 1.15.0\n",
+    f"{DIST}/PyYAML-5.4.egg-info/PKG-INFO": "Name: PyYAML\nVersion: 5.4\n",
+    f"{DIST}/PyYAML-5.4.egg-info/requires.txt": (
+        '[:python_version < "3.8"]\nimportlib-metadata\n'
+    ),
+    f"{DIST}/yaml/__init__.py": "",
+    f"{DIST}/yaml/cyaml.py": "",
+    f"{DIST}/attrs-21.egg-info/PKG-INFO": "Name: attrs\nVersion: 21\n",
+    f"{DIST}/attrs-21.egg-info/installed-files.txt": (
+        "../attr/__init__.py\nPKG-INFO\n"
+    ),
+    # the same dir as /usr/lib/python3/dist-packages
+    "/usr/lib/python3.10/dist-packages": ("symlink", "../python3/dist-packages"),
+}
+
+
+def test_parse_requires_txt():
+    assert parse_requires_txt(
+        'numpy>=1.17\n\n[:python_version < "3.8"]\ntyping-extensions\n'
+        "[testing]\npytest\n[cuda:sys_platform == 'linux']\ncupy\n"
+    ) == [
+        "numpy>=1.17",
+        'typing-extensions ; (python_version < "3.8")',
+        'pytest ; extra == "testing"',
+        "cupy ; extra == \"cuda\" and (sys_platform == 'linux')",
+    ]
+
+
+def test_parse_metadata():
+    headers = parse_metadata(
+        "Name: a\nClassifier: x\nClassifier: y\nLicense: MIT\n  more\n\nName: b\n"
+    )
+    assert headers == {
+        "Name": ["a"],
+        "Classifier": ["x", "y"],
+        "License": ["MIT\nmore"],
+    }
+
+
+def test_python_version():
+    assert python_version(LOCAL) == "3.10"
+    assert python_version(DIST) is None
+
+
+def test_site_packages(dir_rootfs):
+    rootfs = DirRootFS(dir_rootfs(ROOTFS_FILES))
+    assert find_site_packages(rootfs) == [LOCAL, DIST]
+
+    site_packages = SitePackages.load(rootfs)
+    assert SitePackages.load(rootfs) is site_packages
+    dists = site_packages.dists
+    assert sorted(dists) == ["attrs", "cython", "pyyaml", "six"]
+    assert dists["six"].version == "1.16.0"
+    assert dists["cython"].summary == "The Cython compiler"
+
+    assert site_packages.dependencies(dists["cython"]) == ["six"]
+    # dist-packages is used by the highest python of the image
+    assert site_packages.python_version(DIST) == "3.10"
+    assert site_packages.dependencies(dists["pyyaml"]) == []
+    assert dists["pyyaml"].dependencies(marker_environment("3.7")) == [
+        "importlib-metadata"
+    ]
+
+
+def test_files(dir_rootfs):
+    dists = SitePackages(DirRootFS(dir_rootfs(ROOTFS_FILES))).dists
+    assert dists["cython"].files() == [
+        "cython.py",
+        "Cython/__init__.py",
+        "Cython-0.29.dist-info/METADATA",
+    ]
+    assert dists["attrs"].files() == ["attr/__init__.py", "attrs-21.egg-info/PKG-INFO"]
+    assert sorted(dists["pyyaml"].files()) == ["yaml/__init__.py", "yaml/cyaml.py"]
+    assert dists["six"].files() == ["six.py"]
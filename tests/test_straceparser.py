@@ -0,0 +1,87 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(__file__), "..", "external", "cimplifier", "bare-metal", "code"
+    ),
+)
+
+import bench_straceparser  # noqa: E402
+import straceparser  # noqa: E402
+
+TRICKY_LINES = [
+    r'execve("/usr/bin/python3", ["python3", "a.py"], ["PS1=\33[0m", "HOME=/root"]) = 0',
+    r'openat(AT_FDCWD, "/etc/a \"quoted\".conf", O_RDONLY|O_CLOEXEC) = 3</etc/a "quoted".conf>',
+    r'openat(3</usr/lib/a b>, "c.so", O_RDONLY) = 4</usr/lib/a b/c.so>',
+    r'openat(AT_FDCWD, "/tmp/out", O_WRONLY|O_CREAT|O_TRUNC, 0644) = 5</tmp/out>',
+    r'newfstatat(AT_FDCWD, "/opt", {st_mode=S_IFDIR|0755, ...}, 0) = 0',
+    r'stat("/missing", 0x7ffd0000) = -1 ENOENT (No such file or directory)',
+    r'access("/etc/ld.so.preload", R_OK) = 0',
+    r'chdir("/srv") = 0',
+    r'openat(AT_FDCWD, "relative.txt", O_RDONLY) = 6</srv/relative.txt>',
+    r"clone(child_stack=NULL, flags=CLONE_CHILD_SETTID|SIGCHLD) = 43",
+    "--- SIGCHLD {si_signo=SIGCHLD, si_code=CLD_EXITED, si_pid=43, si_uid=0} ---",
+    "exit_group(0) = ?",
+    "+++ exited with 0 +++",
+]
+
+
+def records(parsers):
+    return {pid: [vars(r) for r in p.exec_records] for pid, p in parsers.items()}
+
+
+def parse_both(*args):
+    slow = straceparser.process(*args, fast=False)
+    fast = straceparser.process(*args, fast=True)
+    assert records(slow) == records(fast)
+    return slow
+
+
+def test_parse_ret_prints_unmatched_lines_once(capsys):
+    line = "read(3, 0x7f00, 4096) = ? ERESTARTSYS (To be restarted)"
+    for suffix in ["\n", ""]:
+        ret = straceparser.parse_ret(line + suffix, " ? ERESTARTSYS (To be restarted)")
+        assert ret == (-1, None, "ERESTARTSYS")
+    assert capsys.readouterr().out == line + "\n" + line + "\n"
+
+
+def test_fast_mode_on_tricky_lines(tmp_path):
+    trace = tmp_path / "all.strace"
+    trace.write_text("\n".join(TRICKY_LINES) + "\n")
+    image = parse_both(42, str(trace), "/", False)[42].exec_records[-1]
+    assert image.envp == ["PS1=\\33[0m", "HOME=/root"]
+    assert '/etc/a \\"quoted\\".conf' in image.exist_files
+    assert "/usr/lib/a b/c.so" in image.exist_files
+    assert "/srv/relative.txt" in image.exist_files
+    assert "/missing" not in image.exist_files
+    assert image.written_files == {"/tmp/out"}
+
+
+def test_fast_mode_on_a_synthetic_log(tmp_path):
+    trace = str(tmp_path / "all.strace")
+    bench_straceparser.synthetic_trace(trace, 5000)
+    parsers = parse_both(0, trace, "/", False)
+    assert len(parsers[0].exec_records[-1].exist_files) > 1000
+
+
+@pytest.mark.parametrize("fast", [False, True])
+def test_per_pid_logs(tmp_path, fast):
+    prefix = str(tmp_path / "all.strace")
+    with open(prefix + ".42", "w") as f:
+        f.write("\n".join(TRICKY_LINES) + "\n")
+    with open(prefix + ".43", "w") as f:
+        f.write('openat(AT_FDCWD, "child.txt", O_RDONLY) = 3</srv/child.txt>\n')
+    with open(prefix + ".99", "w") as f:
+        f.write('stat("/orphan", {st_mode=S_IFREG|0644, ...}) = 0\n')
+
+    parsers = straceparser.process("42", prefix, "/", False, fast, max_workers=2)
+    assert sorted(parsers) == [42, 43, 99]
+    child = parsers[43].exec_records[-1]
+    # forked after the chdir and the execve of its parent
+    assert "/srv/child.txt" in child.exist_files
+    assert child.exe == "/usr/bin/python3"
+    assert "/orphan" in parsers[99].exec_records[-1].exist_files
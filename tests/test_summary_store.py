@@ -0,0 +1,58 @@
+from pkg_analysis.image import Image
+from pkg_analysis.summary_store import ImageSummaryStore
+
+
+def test_put_keeps_unset_fields_and_moves_refs(tmp_path):
+    with ImageSummaryStore(str(tmp_path / "s.db")) as store:
+        store.put("sha256:a", size_kb=10.0, layers=["l1"], refs=["img:1"])
+        store.put("sha256:a", refs=["img:latest"])
+        record = store.get("img:latest")
+        assert record["size_kb"] == 10.0
+        assert record["layers"] == ["l1"]
+        assert store.get("img:1")["digest"] == "sha256:a"
+
+        # the tag moved to another image
+        store.put("sha256:b", size_kb=20.0, refs=["img:latest"])
+        assert store.get("img:latest")["digest"] == "sha256:b"
+        assert store.get("sha256:a")["size_kb"] == 10.0
+        assert store.get("img:nope") is None
+
+
+def test_put_summary_keeps_the_other_summaries(tmp_path):
+    with ImageSummaryStore(str(tmp_path / "s.db")) as store:
+        store.put("sha256:a", size_kb=10.0)
+        store.put_summary("sha256:a", "debloated:x", {"size": 1})
+        store.put_summary("sha256:a", "debloated:y", {"size": 2})
+        store.put("sha256:a", size_kb=11.0)
+        record = store.get("sha256:a")
+        assert record["summaries"] == {
+            "debloated:x": {"size": 1},
+            "debloated:y": {"size": 2},
+        }
+        assert record["size_kb"] == 11.0
+
+
+class FakeAPIClient(object):
+    def __init__(self, images):
+        self.images = images
+        self.inspected = []
+
+    def inspect_image(self, name):
+        self.inspected.append(name)
+        return self.images[name]
+
+
+def test_img_record_only_inspects_on_a_miss_or_refresh(tmp_path):
+    image = Image("img:1", cache_path=str(tmp_path / "s.db"))
+    image.api_client = FakeAPIClient(
+        {"img:1": {"Id": "sha256:a", "Size": 2048, "RepoTags": None}}
+    )
+
+    assert image._img_record("img:1", use_cache=True)["size_kb"] == 2.0
+    assert image._img_record("img:1", use_cache=True)["digest"] == "sha256:a"
+    assert image.api_client.inspected == ["img:1"]
+
+    image.api_client.images["img:1"] = {"Id": "sha256:b", "Size": 4096}
+    assert image._img_record("img:1", use_cache=False)["size_kb"] == 4.0
+    assert image.api_client.inspected == ["img:1", "img:1"]
+    assert image._img_record("img:1", use_cache=True)["digest"] == "sha256:b"